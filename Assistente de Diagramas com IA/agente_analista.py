@@ -1,32 +1,42 @@
-import os
 import json
-from openai import AzureOpenAI
-from dotenv import load_dotenv
+from llm_client import create_chat_completion, acreate_chat_completion
+from prompts import ANALISTA_CRIACAO, ANALISTA_REFINO
+from tracing import rastreado
 
-# Define o caminho para o arquivo .env na pasta pai
-dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+def _montar_mensagens(prompt_usuario: str, plano_anterior_str: str = None, criticas: list = None) -> tuple[list, str]:
+    """Monta as mensagens da chamada e retorna junto a ação ("criado"/"refinado") para o log."""
+    is_refinement_cycle = plano_anterior_str and criticas
 
-# Carrega as variáveis de ambiente do arquivo especificado
-load_dotenv(dotenv_path=dotenv_path)
+    if is_refinement_cycle:
+        # Modo de Refinamento
+        criticas_str = "\n".join(f"- {c}" for c in criticas)
+        messages = ANALISTA_REFINO.mensagens(
+            prompt_usuario=prompt_usuario, plano_anterior=plano_anterior_str, criticas=criticas_str
+        )
+        return messages, "refinado"
 
-# Configura o cliente da Azure OpenAI
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
+    # Modo de Criação Inicial
+    return ANALISTA_CRIACAO.mensagens(prompt_usuario=prompt_usuario), "criado"
 
-deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+def _interpretar_resposta(response, log_action: str) -> tuple[dict, str]:
+    plano_json_str = response.choices[0].message.content
+    plano_dict = json.loads(plano_json_str)
 
-def _ler_manual_de_design():
-    """Lê o conteúdo do manual de boas práticas de design."""
-    try:
-        manual_path = os.path.join(os.path.dirname(__file__), "manual_de_boas_praticas_design.md")
-        with open(manual_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        return "Manual de design não encontrado."
+    log_message = f"✅ **Agente Analista**: Plano de design {log_action} com sucesso."
+    return plano_dict, log_message
+
+def _plano_interpretavel(conteudo: str) -> bool:
+    # Só planos que decodificam para um objeto JSON vão para o cache de respostas
+    return isinstance(json.loads(conteudo), dict)
 
+def _resultado_de_erro(e: Exception) -> tuple[dict, str]:
+    if isinstance(e, json.JSONDecodeError):
+        log_message = f"❌ **Agente Analista**: Falha ao decodificar o JSON do plano. Erro: {e}"
+        return {"erro": "Falha na decodificação do JSON", "detalhes": str(e)}, log_message
+    log_message = f"❌ **Agente Analista**: Falha ao criar o plano de design. Erro: {e}"
+    return {"erro": "Falha na chamada da IA", "detalhes": str(e)}, log_message
+
+@rastreado()
 def analisar_prompt_e_criar_plano(prompt_usuario: str, plano_anterior_str: str = None, criticas: list = None) -> tuple[dict, str]:
     """
     Analisa o prompt do usuário ou refina um plano existente com base em críticas.
@@ -39,60 +49,35 @@ def analisar_prompt_e_criar_plano(prompt_usuario: str, plano_anterior_str: str =
     Returns:
         Uma tupla contendo o plano JSON (como dicionário) e uma mensagem de log.
     """
-    manual_design = _ler_manual_de_design()
-    is_refinement_cycle = plano_anterior_str and criticas
-
-    if is_refinement_cycle:
-        # Modo de Refinamento
-        system_prompt = f"""
-        Você é um especialista em Análise e Design de Processos. Sua tarefa é refinar um "Plano de Design" JSON com base em uma lista de "Críticas".
-        O objetivo é garantir que o plano final seja uma representação fiel e completa do "Prompt Original" do usuário.
-        
-        Siga RIGOROSAMENTE as regras do manual de design para manter a consistência.
-        --- INÍCIO DO MANUAL DE DESIGN ---
-        {manual_design}
-        --- FIM DO MANUAL ---
-
-        Analise o plano anterior e as críticas, e gere uma nova versão do plano em JSON que resolva TODOS os pontos levantados. Gere APENAS o objeto JSON completo e atualizado.
-        """
-        criticas_str = "\n".join(f"- {c}" for c in criticas)
-        user_content = f'--PROMPT ORIGINAL--\n{prompt_usuario}\n\n--PLANO ANTERIOR PARA REFINAR--\n{plano_anterior_str}\n\n--CRÍTICAS A SEREM APLICADAS--\n{criticas_str}'
-        log_action = "refinado"
-    else:
-        # Modo de Criação Inicial
-        system_prompt = f"""
-        Você é um especialista em Análise e Design de Processos. Sua tarefa é converter a descrição de um processo, fornecida pelo usuário, em um plano de design estruturado em JSON.
-        
-        Siga RIGOROSAMENTE as regras e a estrutura de saída definidas no manual a seguir.
-        --- INÍCIO DO MANUAL DE DESIGN ---
-        {manual_design}
-        --- FIM DO MANUAL ---
-
-        Analise o prompt do usuário e gere APENAS o objeto JSON correspondente ao plano de design.
-        """
-        user_content = prompt_usuario
-        log_action = "criado"
-
+    messages, log_action = _montar_mensagens(prompt_usuario, plano_anterior_str, criticas)
     try:
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
+        response = create_chat_completion(
+            agent="analista",
+            messages=messages,
             temperature=0.2,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            # Um plano inicial pode ser reaproveitado para um prompt quase idêntico
+            cache_semantico=(log_action == "criado"),
+            validar_resposta=_plano_interpretavel,
         )
+        return _interpretar_resposta(response, log_action)
+    except Exception as e:
+        return _resultado_de_erro(e)
 
-        plano_json_str = response.choices[0].message.content
-        plano_dict = json.loads(plano_json_str)
-
-        log_message = f"✅ **Agente Analista**: Plano de design {log_action} com sucesso."
-        return plano_dict, log_message
-
-    except json.JSONDecodeError as e:
-        log_message = f"❌ **Agente Analista**: Falha ao decodificar o JSON do plano. Erro: {e}"
-        return {"erro": "Falha na decodificação do JSON", "detalhes": str(e)}, log_message
+@rastreado()
+async def analisar_prompt_e_criar_plano_async(prompt_usuario: str, plano_anterior_str: str = None, criticas: list = None) -> tuple[dict, str]:
+    """Versão assíncrona de `analisar_prompt_e_criar_plano`, com os mesmos argumentos e retorno."""
+    messages, log_action = _montar_mensagens(prompt_usuario, plano_anterior_str, criticas)
+    try:
+        response = await acreate_chat_completion(
+            agent="analista",
+            messages=messages,
+            temperature=0.2,
+            response_format={"type": "json_object"},
+            # Um plano inicial pode ser reaproveitado para um prompt quase idêntico
+            cache_semantico=(log_action == "criado"),
+            validar_resposta=_plano_interpretavel,
+        )
+        return _interpretar_resposta(response, log_action)
     except Exception as e:
-        log_message = f"❌ **Agente Analista**: Falha ao criar o plano de design. Erro: {e}"
-        return {"erro": "Falha na chamada da IA", "detalhes": str(e)}, log_message
+        return _resultado_de_erro(e)
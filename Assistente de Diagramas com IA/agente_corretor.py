@@ -1,87 +1,156 @@
-from openai import AzureOpenAI
-import os
-from dotenv import load_dotenv
-from mcp_client import get_library_docs # Importa o cliente MCP
+from llm_client import create_chat_completion, acreate_chat_completion, stream_chat_completion, astream_chat_completion
+import json
+import asyncio
+from agente_validador import validar_diagrama_mermaid
+from mermaid_autofix import corrigir_por_regras
+from prompts import CORRETOR
+from mermaid_stream import FiltroDeCercas, extrair_codigo_mermaid
+from tracing import rastreado, span_atual
 
-# Define o caminho para o arquivo .env na pasta pai
-dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+# Separa o código do plano de design na mensagem do usuário
+MARCADOR_PLANO = "--PLANO DE DESIGN (O CÓDIGO ACIMA ESTÁ INCOMPLETO)--"
 
-# Carrega as variáveis de ambiente do arquivo especificado
-load_dotenv(dotenv_path=dotenv_path)
+def _montar_mensagens(codigo_invalido: str, mensagem_erro: str, plano: dict = None) -> list:
+    # O manual e a documentação do MCP ficam no prefixo fixo; o erro e o código vão na mensagem do usuário
+    secao_plano = ""
+    if plano is not None:
+        # Código interrompido durante o streaming: o corretor também precisa completá-lo
+        secao_plano = f"\n\n{MARCADOR_PLANO}\n{json.dumps(plano, indent=2, ensure_ascii=False)}"
+    return CORRETOR.mensagens(codigo_invalido=codigo_invalido, mensagem_erro=mensagem_erro, secao_plano=secao_plano)
 
-# Configurar o cliente Azure OpenAI
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
+LOG_SUCESSO = "✅ **Agente Corretor**: Tentativa de correção aplicada com sucesso, usando o manual e a documentação do MCP."
 
-deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+def _corrigir_por_regras(codigo_invalido: str, mensagem_erro: str, plano: dict = None):
+    """
+    Tenta as correções determinísticas antes do LLM.
 
-def _ler_manual_de_boas_praticas():
-    """Lê o conteúdo do manual de boas práticas."""
-    try:
-        manual_path = os.path.join(os.path.dirname(__file__), "manual_de_boas_praticas_mermaid.md")
-        with open(manual_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        return "Manual de boas práticas não encontrado."
+    Returns:
+        Uma tupla (código corrigido, mensagem de log), ou None se o código ainda precisar do LLM.
+    """
+    if plano is not None:
+        # Código interrompido no meio: as regras deixariam o diagrama válido, mas incompleto
+        return None
+    resultado = corrigir_por_regras(
+        codigo_invalido, mensagem_erro, validar=lambda codigo: validar_diagrama_mermaid(codigo)[0]
+    )
+    if not resultado.corrigido:
+        return None
+    span_atual().definir_atributo("corretor.regras", ",".join(resultado.regras))
+    log_message = f"🔧 **Agente Corretor**: Erro corrigido por regras determinísticas ({', '.join(resultado.regras)}), sem chamar o LLM."
+    return resultado.codigo, log_message
+
+# As chamadas ao LLM não informam `validar_resposta`, então nunca passam pelo cache de
+# respostas: a mesma entrada só volta ao corretor quando a correção anterior falhou
+
+def _interpretar_resposta(response) -> tuple[str, str]:
+    # Limpa o código de possíveis blocos de markdown
+    codigo_corrigido = extrair_codigo_mermaid(response.choices[0].message.content)
+    return codigo_corrigido, LOG_SUCESSO
 
-def corrigir_diagrama_mermaid(codigo_invalido: str, mensagem_erro: str) -> tuple[str, str]:
+def _resultado_de_erro(e: Exception) -> tuple[str, str]:
+    print(f"Ocorreu um erro ao chamar a API da OpenAI: {e}")
+    log_message = f"❌ **Agente Corretor**: Falha ao tentar corrigir o diagrama. Erro: {e}"
+    return f"Ocorreu um erro ao corrigir o diagrama: {e}", log_message
+
+@rastreado()
+def corrigir_diagrama_mermaid(codigo_invalido: str, mensagem_erro: str, plano: dict = None) -> tuple[str, str]:
     """
     Tenta corrigir um código Mermaid inválido usando a IA.
 
+    Antes do LLM, tenta as regras determinísticas de `mermaid_autofix`; se o
+    código corrigido por elas passar na validação, o LLM não é chamado.
+
     Args:
         codigo_invalido: O código Mermaid com erro.
         mensagem_erro: A mensagem de erro retornada pelo validador.
+        plano: O plano de design, quando o código está incompleto (geração interrompida).
 
     Returns:
         Uma tupla contendo o código Mermaid corrigido e uma mensagem de log detalhando a ação do agente.
     """
-    # 1. Consulta ao conhecimento local (erros passados)
-    manual_content = _ler_manual_de_boas_praticas()
-    # 2. Consulta à documentação atualizada via MCP
-    mermaid_docs = get_library_docs('/mermaid-js/mermaid', topic='flowchart syntax')
-
-    prompt_sistema = f"""
-    Você é um especialista em sintaxe de diagramas Mermaid. Sua tarefa é corrigir o código Mermaid fornecido.
-    O código a seguir resultou no erro: '{mensagem_erro}'.
-
-    Para garantir a sintaxe correta, você deve seguir DUAS fontes de conhecimento:
-    1. O MANUAL DE BOAS PRÁTICAS, que contém lições de erros passados.
-    2. A DOCUMENTAÇÃO DE REFERÊNCIA, que contém a sintaxe oficial mais recente.
-
-    --- INÍCIO DO MANUAL DE BOAS PRÁTICAS ---
-    {manual_content}
-    --- FIM DO MANUAL DE BOAS PRÁTICAS ---
+    por_regras = _corrigir_por_regras(codigo_invalido, mensagem_erro, plano)
+    if por_regras is not None:
+        return por_regras
+    try:
+        response = create_chat_completion(
+            agent="corretor",
+            messages=_montar_mensagens(codigo_invalido, mensagem_erro, plano),
+            temperature=0.1, # Baixa temperatura para correções mais determinísticas
+        )
+        return _interpretar_resposta(response)
+    except Exception as e:
+        return _resultado_de_erro(e)
 
-    --- INÍCIO DA DOCUMENTAÇÃO DE REFERÊNCIA (MERMAID) ---
-    {mermaid_docs}
-    --- FIM DA DOCUMENTAÇÃO ---
+@rastreado()
+async def corrigir_diagrama_mermaid_async(codigo_invalido: str, mensagem_erro: str, plano: dict = None) -> tuple[str, str]:
+    """Versão assíncrona de `corrigir_diagrama_mermaid`, com os mesmos argumentos e retorno."""
+    # A revalidação pode acionar o mmdc, que é bloqueante
+    por_regras = await asyncio.to_thread(_corrigir_por_regras, codigo_invalido, mensagem_erro, plano)
+    if por_regras is not None:
+        return por_regras
+    try:
+        response = await acreate_chat_completion(
+            agent="corretor",
+            messages=_montar_mensagens(codigo_invalido, mensagem_erro, plano),
+            temperature=0.1,
+        )
+        return _interpretar_resposta(response)
+    except Exception as e:
+        return _resultado_de_erro(e)
 
-    Analise o código, o erro e as fontes de conhecimento para fornecer uma correção. Forneça apenas o código Mermaid corrigido, sem nenhuma explicação adicional.
+@rastreado()
+def corrigir_diagrama_mermaid_stream(codigo_invalido: str, mensagem_erro: str, plano: dict = None):
     """
+    Versão em streaming de `corrigir_diagrama_mermaid`.
 
+    Gera tuplas `(codigo_parcial, None)` à medida que o código chega e, por último,
+    `(codigo_final, mensagem_de_log)`. Fechar o gerador antes do fim cancela a geração.
+    """
+    por_regras = _corrigir_por_regras(codigo_invalido, mensagem_erro, plano)
+    if por_regras is not None:
+        yield por_regras
+        return
+    filtro = FiltroDeCercas()
+    trechos = None
     try:
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=[
-                {"role": "system", "content": prompt_sistema},
-                {"role": "user", "content": codigo_invalido}
-            ],
-            temperature=0.1, # Baixa temperatura para correções mais determinísticas
+        trechos = stream_chat_completion(
+            agent="corretor",
+            messages=_montar_mensagens(codigo_invalido, mensagem_erro, plano),
+            temperature=0.1,
         )
-        codigo_corrigido = response.choices[0].message.content
-        # Limpa o código de possíveis blocos de markdown
-        if codigo_corrigido.strip().startswith("```mermaid"):
-            codigo_corrigido = codigo_corrigido.strip()[len("```mermaid"):].strip()
-        if codigo_corrigido.strip().endswith("```"):
-            codigo_corrigido = codigo_corrigido.strip()[:-len("```")].strip()
-            
-        log_message = "✅ **Agente Corretor**: Tentativa de correção aplicada com sucesso, usando o manual e a documentação do MCP."
-        return codigo_corrigido, log_message
+        for trecho in trechos:
+            if filtro.alimentar(trecho):
+                yield filtro.codigo, None
+    except Exception as e:
+        yield _resultado_de_erro(e)
+        return
+    finally:
+        if trechos is not None:
+            trechos.close()
+    yield filtro.finalizar(), LOG_SUCESSO
 
+@rastreado()
+async def corrigir_diagrama_mermaid_astream(codigo_invalido: str, mensagem_erro: str, plano: dict = None):
+    """Versão assíncrona de `corrigir_diagrama_mermaid_stream`, com os mesmos argumentos e itens gerados."""
+    por_regras = await asyncio.to_thread(_corrigir_por_regras, codigo_invalido, mensagem_erro, plano)
+    if por_regras is not None:
+        yield por_regras
+        return
+    filtro = FiltroDeCercas()
+    trechos = None
+    try:
+        trechos = astream_chat_completion(
+            agent="corretor",
+            messages=_montar_mensagens(codigo_invalido, mensagem_erro, plano),
+            temperature=0.1,
+        )
+        async for trecho in trechos:
+            if filtro.alimentar(trecho):
+                yield filtro.codigo, None
     except Exception as e:
-        print(f"Ocorreu um erro ao chamar a API da OpenAI: {e}")
-        log_message = f"❌ **Agente Corretor**: Falha ao tentar corrigir o diagrama. Erro: {e}"
-        return f"Ocorreu um erro ao corrigir o diagrama: {e}", log_message
+        yield _resultado_de_erro(e)
+        return
+    finally:
+        if trechos is not None:
+            await trechos.aclose()
+    yield filtro.finalizar(), LOG_SUCESSO
@@ -1,73 +1,162 @@
+from llm_client import create_chat_completion, acreate_chat_completion, stream_chat_completion, astream_chat_completion
 import os
-from openai import AzureOpenAI
-from dotenv import load_dotenv
 import json
-from mcp_client import get_library_docs # Importa o cliente MCP
-
-# Define o caminho para o arquivo .env na pasta pai
-dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-
-# Carrega as variáveis de ambiente do arquivo especificado
-load_dotenv(dotenv_path=dotenv_path)
-
-# Configura o cliente da Azure OpenAI
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
-
-deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
-
-def desenhar_diagrama_com_plano(plano: dict) -> tuple[str, str]:
+from prompts import DESENHISTA
+from mermaid_stream import FiltroDeCercas, extrair_codigo_mermaid
+from mermaid_parser import e_flowchart, analisar_flowchart, erros
+from plan_compiler import compilar_plano, PlanoIncompativelError
+from tracing import rastreado, span_atual
+
+# Converte o plano sem LLM sempre que ele segue o formato do manual de design
+USAR_COMPILADOR = os.getenv("PLAN_COMPILER", "1") == "1"
+
+def _montar_mensagens(plano: dict) -> list:
+    # A documentação do MCP fica no prefixo fixo; o plano JSON é o prompt do usuário
+    return DESENHISTA.mensagens(plano=json.dumps(plano, indent=2))
+
+LOG_SUCESSO = "✅ **Agente Desenhista**: Diagrama renderizado com sucesso, combinando o plano de design com a documentação do MCP."
+
+def _interpretar_resposta(response) -> tuple[str, str]:
+    # Limpa o código para retornar apenas o conteúdo dentro do bloco ```mermaid ... ```
+    mermaid_code = extrair_codigo_mermaid(response.choices[0].message.content)
+    return mermaid_code, LOG_SUCESSO
+
+def _codigo_interpretavel(conteudo: str) -> bool:
+    # Só código que passa na pré-validação local vai para o cache de respostas;
+    # o mmdc roda depois, no validador
+    codigo = extrair_codigo_mermaid(conteudo)
+    return bool(codigo) and not (e_flowchart(codigo) and erros(analisar_flowchart(codigo)))
+
+def tentar_compilar(plano: dict):
+    """Tenta o compilador determinístico; retorna None quando o plano exige o LLM."""
+    if not USAR_COMPILADOR:
+        return None
+    try:
+        codigo = compilar_plano(plano)
+    except PlanoIncompativelError as e:
+        # O motivo fica no span; o plano segue para o LLM
+        span_atual().definir_atributos(**{"desenhista.compilado": False, "desenhista.motivo_llm": str(e)})
+        return None
+    span_atual().definir_atributo("desenhista.compilado", True)
+    return codigo, "✅ **Agente Desenhista**: Diagrama compilado diretamente do plano de design, sem chamada ao LLM."
+
+def estimar_tokens(plano: dict) -> int:
+    """Estimativa grosseira (4 caracteres por token) dos tokens de prompt e de resposta de uma chamada ao desenhista."""
+    mensagens = _montar_mensagens(plano)
+    prompt = sum(len(m["content"]) for m in mensagens) // 4
+    # O código gerado tem, em geral, o tamanho do plano
+    return prompt + len(mensagens[-1]["content"]) // 4
+
+def _resultado_de_erro(e: Exception) -> tuple[str, str]:
+    log_message = f"❌ **Agente Desenhista**: Falha ao desenhar o diagrama. Erro: {e}"
+    return f"-- Erro ao desenhar diagrama: {e}", log_message
+
+def _opcoes(seed: int = None) -> dict:
+    return {"seed": seed} if seed is not None else {}
+
+@rastreado()
+def desenhar_diagrama_com_plano(plano: dict, temperature: float = 0.0, seed: int = None, compilar: bool = True) -> tuple[str, str]:
     """
     Usa a IA para gerar o código Mermaid, combinando um plano de design e a documentação do MCP.
 
     Args:
         plano: Um dicionário contendo o plano de design estruturado.
+        temperature: Temperatura da chamada (zero segue o plano o mais fielmente possível).
+        seed: Semente de amostragem, para gerar candidatos diferentes do mesmo plano.
+        compilar: Tenta o compilador determinístico antes do LLM.
 
     Returns:
         Uma tupla contendo o código Mermaid gerado e uma mensagem de log.
     """
-    # 1. Consulta à documentação atualizada via MCP
-    mermaid_docs = get_library_docs('/mermaid-js/mermaid', topic='flowchart syntax')
-    plano_str = json.dumps(plano, indent=2)
-
-    system_prompt = f"""
-    Você é um especialista em desenhar diagramas com a sintaxe Mermaid. Sua tarefa é converter um "plano de design" JSON em um código Mermaid limpo e funcional.
-
-    Você deve seguir DUAS fontes de conhecimento:
-    1. O PLANO DE DESIGN: Ele define a estrutura, os passos, os textos e as conexões. Siga-o rigorosamente.
-    2. A DOCUMENTAÇÃO DE REFERÊNCIA: Use-a para aplicar a sintaxe mais moderna e eficiente para os elementos definidos no plano.
-
-    --- INÍCIO DA DOCUMENTAÇÃO DE REFERÊNCIA (MERMAID) ---
-    {mermaid_docs}
-    --- FIM DA DOCUMENTAÇÃO ---
+    compilado = tentar_compilar(plano) if compilar else None
+    if compilado is not None:
+        return compilado
+    try:
+        response = create_chat_completion(
+            agent="desenhista",
+            messages=_montar_mensagens(plano),
+            temperature=temperature,
+            validar_resposta=_codigo_interpretavel,
+            **_opcoes(seed),
+        )
+        return _interpretar_resposta(response)
+    except Exception as e:
+        return _resultado_de_erro(e)
+
+@rastreado()
+async def desenhar_diagrama_com_plano_async(plano: dict, temperature: float = 0.0, seed: int = None, compilar: bool = True) -> tuple[str, str]:
+    """Versão assíncrona de `desenhar_diagrama_com_plano`, com os mesmos argumentos e retorno."""
+    compilado = tentar_compilar(plano) if compilar else None
+    if compilado is not None:
+        return compilado
+    try:
+        response = await acreate_chat_completion(
+            agent="desenhista",
+            messages=_montar_mensagens(plano),
+            temperature=temperature,
+            validar_resposta=_codigo_interpretavel,
+            **_opcoes(seed),
+        )
+        return _interpretar_resposta(response)
+    except Exception as e:
+        return _resultado_de_erro(e)
 
-    Analise o plano de design a seguir e gere APENAS o código Mermaid correspondente. Não inclua nenhuma explicação ou texto adicional.
+@rastreado()
+def desenhar_diagrama_com_plano_stream(plano: dict):
     """
+    Versão em streaming de `desenhar_diagrama_com_plano`.
 
+    Gera tuplas `(codigo_parcial, None)` à medida que o código chega e, por último,
+    `(codigo_final, mensagem_de_log)`. Fechar o gerador antes do fim cancela a geração.
+    Planos compiláveis geram apenas o item final.
+    """
+    compilado = tentar_compilar(plano)
+    if compilado is not None:
+        yield compilado
+        return
+    filtro = FiltroDeCercas()
+    trechos = None
     try:
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": plano_str} # O plano JSON é o prompt do usuário
-            ],
-            temperature=0.0, # Temperatura zero para seguir o plano o mais fielmente possível
+        trechos = stream_chat_completion(
+            agent="desenhista",
+            messages=_montar_mensagens(plano),
+            temperature=0.0,
+            validar_resposta=_codigo_interpretavel,
         )
-
-        mermaid_code = response.choices[0].message.content
-
-        # Limpa o código para retornar apenas o conteúdo dentro do bloco ```mermaid ... ```
-        if '```mermaid' in mermaid_code:
-            mermaid_code = mermaid_code.split('```mermaid')[1].split('```')[0].strip()
-        elif '```' in mermaid_code:
-             mermaid_code = mermaid_code.split('```')[1].strip()
-
-        log_message = "✅ **Agente Desenhista**: Diagrama renderizado com sucesso, combinando o plano de design com a documentação do MCP."
-        return mermaid_code, log_message
-
+        for trecho in trechos:
+            if filtro.alimentar(trecho):
+                yield filtro.codigo, None
+    except Exception as e:
+        yield _resultado_de_erro(e)
+        return
+    finally:
+        if trechos is not None:
+            trechos.close()
+    yield filtro.finalizar(), LOG_SUCESSO
+
+@rastreado()
+async def desenhar_diagrama_com_plano_astream(plano: dict):
+    """Versão assíncrona de `desenhar_diagrama_com_plano_stream`, com os mesmos argumentos e itens gerados."""
+    compilado = tentar_compilar(plano)
+    if compilado is not None:
+        yield compilado
+        return
+    filtro = FiltroDeCercas()
+    trechos = None
+    try:
+        trechos = astream_chat_completion(
+            agent="desenhista",
+            messages=_montar_mensagens(plano),
+            temperature=0.0,
+            validar_resposta=_codigo_interpretavel,
+        )
+        async for trecho in trechos:
+            if filtro.alimentar(trecho):
+                yield filtro.codigo, None
     except Exception as e:
-        log_message = f"❌ **Agente Desenhista**: Falha ao desenhar o diagrama. Erro: {e}"
-        return f"-- Erro ao desenhar diagrama: {e}", log_message
+        yield _resultado_de_erro(e)
+        return
+    finally:
+        if trechos is not None:
+            await trechos.aclose()
+    yield filtro.finalizar(), LOG_SUCESSO
@@ -1,60 +1,127 @@
 import subprocess
 import os
+import re
+from dotenv import load_dotenv
+from mermaid_worker_pool import get_pool, WorkerIndisponivelError
+from mermaid_parser import e_flowchart, analisar_flowchart, erros, formatar_diagnosticos
+import validation_cache
+from validation_cache import get_cache, caminho_mmdc
+from tracing import rastreado, span, span_atual
+from request_trace import medir_etapa
 
-def validar_diagrama_mermaid(codigo_mermaid: str, temp_file_path: str = "temp_diagram.mmd") -> tuple[bool, str, str]:
-    """
-    Valida um código Mermaid usando o mermaid-cli.
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 
-    Args:
-        codigo_mermaid: A string contendo o código Mermaid a ser validado.
-        temp_file_path: O caminho para um arquivo temporário a ser usado para a validação.
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
 
-    Returns:
-        Uma tupla (bool, str) onde o booleano é True se o código for válido,
-        e a string contém uma mensagem de sucesso ou o erro.
-    """
-    try:
-        # Escreve o código em um arquivo temporário
-        with open(temp_file_path, "w", encoding="utf-8") as f:
-            f.write(codigo_mermaid)
+# Tempo máximo de uma execução avulsa do mmdc (Node + Chromium)
+TIMEOUT_MMDC = float(os.getenv("MERMAID_CLI_TIMEOUT", "60"))
 
-        # Constrói o caminho para o executável do mmdc, subindo um nível no diretório
-        # para encontrar a pasta node_modules na raiz do projeto.
-        # No Windows, usa .cmd; em outros sistemas, usa o executável sem extensão
-        if os.name == 'nt':  # Windows
-            mmdc_path = os.path.join(os.path.dirname(__file__), "..", "node_modules", ".bin", "mmdc.cmd")
-        else:
-            mmdc_path = os.path.join(os.path.dirname(__file__), "..", "node_modules", ".bin", "mmdc")
+# Mensagens do Mermaid para código rejeitado; qualquer outra falha do mmdc
+# (ex: o Chromium não iniciou) é da infraestrutura, não do diagrama
+RE_ERRO_DE_SINTAXE = re.compile(
+    r"Parse error|Lexical error|Syntax error|No diagram type detected|UnknownDiagramError|Expecting '", re.IGNORECASE
+)
 
-        # Define o caminho para o arquivo .env na pasta pai
-        dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+def _validar_com_mmdc(codigo_mermaid: str) -> tuple[bool, str, bool]:
+    """
+    Valida o código executando um novo processo do mmdc (caminho de contingência).
+
+    O código é enviado pelo stdin e o SVG é descartado pelo stdout, de modo que
+    nenhum arquivo é criado em disco e chamadas simultâneas não interferem entre si.
 
-        # Carrega as variáveis de ambiente do arquivo especificado
-        load_dotenv(dotenv_path=dotenv_path)
+    Returns:
+        Uma tupla (válido, mensagem de erro, conclusivo); conclusivo é False quando
+        a falha foi do mmdc ou do Chromium, e não do diagrama.
 
+    Raises:
+        FileNotFoundError: Se o mmdc não for encontrado.
+    """
+    try:
         # Executa o mermaid-cli para validar a sintaxe (tentando gerar um SVG)
         # A saída é descartada se for bem-sucedido, mas o erro é capturado
-        resultado = subprocess.run(
-            [mmdc_path, "-i", temp_file_path, "-o", "temp_output.svg"],
+        subprocess.run(
+            [caminho_mmdc(), "-i", "-", "-o", "-", "-e", "svg"],
+            input=codigo_mermaid,
             capture_output=True,
             text=True,
             check=True,
-            encoding="utf-8"
+            encoding="utf-8",
+            timeout=TIMEOUT_MMDC,
         )
-        log_message = "✅ **Agente Validador**: Sintaxe do diagrama verificada e aprovada."
+        return True, "", True
+    except subprocess.TimeoutExpired:
+        return False, f"Erro: o mmdc não respondeu em {TIMEOUT_MMDC:g}s.", False
+    except subprocess.CalledProcessError as e:
+        # Se o mmdc falhar com uma mensagem do Mermaid, a sintaxe é inválida
+        return False, e.stderr, bool(RE_ERRO_DE_SINTAXE.search(e.stderr or ""))
+
+@rastreado()
+def validar_diagrama_mermaid(codigo_mermaid: str) -> tuple[bool, str, str]:
+    """
+    Valida um código Mermaid usando o mermaid-cli.
+
+    Flowcharts passam antes por uma pré-validação local em Python puro
+    (ver `mermaid_parser`); se ela encontrar erros, o mmdc nem é acionado.
+    Em seguida, a validação é feita no pool de workers Node/Chromium já aquecidos
+    (ver `mermaid_worker_pool`). Se o pool estiver desativado ou indisponível,
+    recorre a uma execução avulsa do mmdc, que renderiza o diagrama inteiro (o pool
+    só executa o `mermaid.parse`). Os resultados do mmdc ficam em cache, por caminho
+    (ver `validation_cache`; `VALIDATION_CACHE=0` desativa), então revalidar o
+    mesmo código não o executa de novo.
+
+    Nenhum caminho grava arquivos em disco, então a função pode ser chamada
+    por várias threads (ou sessões do Streamlit) ao mesmo tempo.
+
+    Args:
+        codigo_mermaid: A string contendo o código Mermaid a ser validado.
+
+    Returns:
+        Uma tupla (bool, str, str) onde o booleano é True se o código for válido,
+        a primeira string contém uma mensagem de sucesso ou o erro, e a segunda a mensagem de log.
+    """
+    if e_flowchart(codigo_mermaid):
+        falhas = erros(analisar_flowchart(codigo_mermaid))
+        if falhas:
+            erro = f"Erro de sintaxe detectado na pré-validação local:\n{formatar_diagnosticos(falhas)}"
+            log_message = f"⚠️ **Agente Validador**: Sintaxe inválida detectada na pré-validação local (sem mmdc). Erro: {formatar_diagnosticos(falhas)}"
+            span_atual().definir_atributos(**{"mermaid.origem": "pre_validacao", "mermaid.valido": False})
+            return False, erro, log_message
+
+    cache = get_cache() if validation_cache.HABILITADO else None
+    # O pool só faz o parse e o mmdc avulso renderiza: cada caminho tem suas próprias entradas
+    via = "pool" if get_pool().ativo else "subprocesso"
+    em_cache = cache.obter(codigo_mermaid, via) if cache is not None else None
+    if em_cache is not None:
+        valido, erro = em_cache
+        origem = " (resultado em cache)"
+        span_atual().definir_atributo("mermaid.origem", "cache")
+    else:
+        try:
+            with span("mermaid.mmdc") as execucao, medir_etapa("mmdc"):
+                try:
+                    # O worker só responde com o resultado do `mermaid.parse`; falhas
+                    # do Chromium chegam como WorkerIndisponivelError
+                    valido, erro = get_pool().validar(codigo_mermaid)
+                    conclusivo, via = True, "pool"
+                except WorkerIndisponivelError:
+                    via = "subprocesso"
+                    valido, erro, conclusivo = _validar_com_mmdc(codigo_mermaid)
+                execucao.definir_atributo("mermaid.via", via)
+        except FileNotFoundError:
+            # Caso o mmdc não seja encontrado
+            log_message = "❌ **Agente Validador**: O executável 'mmdc' não foi encontrado. A validação não pôde ser concluída."
+            return False, "Erro: mermaid-cli (mmdc) não encontrado. Verifique se está instalado.", log_message
+        if cache is not None and conclusivo:
+            cache.armazenar(codigo_mermaid, valido, erro, via)
+        origem = ""
+        span_atual().definir_atributo("mermaid.origem", "mmdc")
+    span_atual().definir_atributo("mermaid.valido", valido)
+
+    if valido:
+        log_message = f"✅ **Agente Validador**: Sintaxe do diagrama verificada e aprovada{origem}."
         return True, "Sintaxe do diagrama Mermaid é válida.", log_message
 
-    except subprocess.CalledProcessError as e:
-        # Se o mmdc falhar, a sintaxe é provavelmente inválida
-        log_message = f"⚠️ **Agente Validador**: Sintaxe inválida detectada. Erro: {e.stderr.strip()}"
-        return False, e.stderr, log_message
-    except FileNotFoundError:
-        # Caso o mmdc não seja encontrado
-        log_message = "❌ **Agente Validador**: O executável 'mmdc' não foi encontrado. A validação não pôde ser concluída."
-        return False, "Erro: mermaid-cli (mmdc) não encontrado. Verifique se está instalado.", log_message
-    finally:
-        # Limpa os arquivos temporários
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        if os.path.exists("temp_output.svg"):
-            os.remove("temp_output.svg")
+    log_message = f"⚠️ **Agente Validador**: Sintaxe inválida detectada{origem}. Erro: {erro.strip()}"
+    return False, erro, log_message
@@ -1,10 +1,15 @@
 import os
 import json
 import asyncio
+import hashlib
 from typing import Dict, List, Any, Optional
 from chroma_manager import ChromaManager
+from validation_cache import CACHE_DIR
 import streamlit as st
 
+# Insights da última análise semântica, reaproveitados enquanto o nó e a coleção não mudam
+INSIGHTS_CACHE_PATH = os.path.join(CACHE_DIR, 'semantic_insights.json')
+
 class APIOrchestrator:
     """
     Orquestrador automático que gerencia a leitura do grafo de conhecimento,
@@ -105,17 +110,15 @@ class APIOrchestrator:
             sync_needed = self.chroma_manager.is_sync_needed()
             
             if sync_needed:
-                self.chroma_manager.run_ingestion()
+                step_result["details"]["changes"] = self.chroma_manager.run_ingestion()
                 step_result["details"]["action"] = "synchronized"
                 step_result["details"]["reason"] = "knowledge graph was updated"
             else:
                 step_result["details"]["action"] = "skipped"
                 step_result["details"]["reason"] = "already synchronized"
             
-            # Verificar status do banco
-            collection = self.chroma_manager.collection
-            results = collection.get()
-            step_result["details"]["total_items"] = len(results.get('ids', []))
+            # Verificar status do banco (contagem no servidor, sem trazer documentos)
+            step_result["details"]["total_items"] = self.chroma_manager.collection.count()
             
             step_result["status"] = "completed"
             
@@ -139,34 +142,54 @@ class APIOrchestrator:
             # Identificar nós novos ou modificados
             new_nodes = self._identify_new_nodes()
             
-            # Análise semântica para cada tipo de nó
+            # Insights em cache valem enquanto o nó e o conteúdo da coleção não mudam
+            sync_hash = self.chroma_manager.sync_hash()
+            cached_insights = self._load_insights_cache() if sync_hash else {}
             semantic_analysis = {}
+            insights_by_key = {}
+            pending = []
             
             for node in self.knowledge_graph.get('nodes', []):
-                node_id = node.get('id')
-                node_type = node.get('type')
-                
                 # Consulta semântica específica para o nó
                 semantic_query = self._generate_semantic_query(node)
-                results = self.chroma_manager.semantic_query(semantic_query, n_results=3)
-                
+                key = self._insight_cache_key(node, semantic_query, sync_hash)
+                if key in cached_insights:
+                    semantic_analysis[node.get('id')] = dict(cached_insights[key])
+                    insights_by_key[key] = cached_insights[key]
+                else:
+                    pending.append((node, semantic_query, key))
+            
+            # Uma única consulta em lote para os nós restantes, fora do event loop
+            batch_results = []
+            if pending:
+                batch_results = await asyncio.to_thread(
+                    self.chroma_manager.semantic_query_batch, [query for _, query, _ in pending], 3
+                )
+            
+            for (node, semantic_query, key), results in zip(pending, batch_results):
                 # Análise de relacionamentos semânticos
-                related_concepts = self._analyze_semantic_relationships(node, results)
-                
-                semantic_analysis[node_id] = {
-                    "type": node_type,
+                insight = {
+                    "type": node.get('type'),
                     "semantic_query": semantic_query,
-                    "related_concepts": related_concepts,
-                    "semantic_score": self._calculate_semantic_score(results),
-                    "is_new": node_id in new_nodes
+                    "related_concepts": self._analyze_semantic_relationships(node, results),
+                    "semantic_score": self._calculate_semantic_score(results)
                 }
+                semantic_analysis[node.get('id')] = dict(insight)
+                insights_by_key[key] = insight
+            
+            for node_id, insight in semantic_analysis.items():
+                insight["is_new"] = node_id in new_nodes
             
             self.semantic_insights = semantic_analysis
+            if sync_hash:
+                self._save_insights_cache(insights_by_key)
             
             step_result.update({
                 "status": "completed",
                 "details": {
                     "analyzed_nodes": len(semantic_analysis),
+                    "queried_nodes": len(pending),
+                    "cached_nodes": len(semantic_analysis) - len(pending),
                     "new_nodes_count": len(new_nodes),
                     "semantic_depth_score": self._calculate_overall_semantic_depth()
                 }
@@ -180,6 +203,29 @@ class APIOrchestrator:
             
         return step_result
     
+    @staticmethod
+    def _insight_cache_key(node: Dict[str, Any], semantic_query: str, sync_hash: Optional[str]) -> str:
+        """Chave do insight: conteúdo do nó, consulta gerada e hash de sincronização da coleção"""
+        content = json.dumps([node, semantic_query, sync_hash], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def _load_insights_cache(self) -> Dict[str, Any]:
+        try:
+            with open(INSIGHTS_CACHE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+    
+    def _save_insights_cache(self, insights_by_key: Dict[str, Any]):
+        """Grava só os insights atuais, descartando os de nós alterados ou removidos"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(INSIGHTS_CACHE_PATH)), exist_ok=True)
+            with open(INSIGHTS_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(insights_by_key, f, ensure_ascii=False)
+        except OSError:
+            # O cache é apenas uma otimização; falhas não afetam a inicialização
+            pass
+    
     def _generate_architecture_overview(self, nodes_by_type: Dict[str, List]) -> Dict[str, Any]:
         """Gera uma visão geral da arquitetura"""
         return {
@@ -3,12 +3,15 @@ from streamlit_mermaid import st_mermaid
 import os
 import json
 import streamlit.components.v1 as components
-from agente_analista import analisar_prompt_e_criar_plano
-from agente_desenhista import desenhar_diagrama_com_plano
-from agente_validador import validar_diagrama_mermaid
-from agente_corretor import corrigir_diagrama_mermaid
-from agente_critico import criticar_plano_de_design
+from pipeline import DiagramPipeline
+from llm_client import resumo_de_uso, executar
+from response_cache import get_response_cache
+import mermaid_autofix
+import refinement_budget
+from request_trace import resumo_de_estatisticas
 from chroma_manager import ChromaManager
+import hybrid_retriever
+from hybrid_retriever import RecuperadorHibrido
 
 # --- Configuração da Página ---
 st.set_page_config(
@@ -37,13 +40,8 @@ if 'orchestrator' not in st.session_state:
     
 if 'system_initialized' not in st.session_state:
     with st.spinner('🤖 Inicializando sistema automático: lendo grafo → sincronizando ChromaDB → análise semântica...'):
-        import asyncio
-        
         # Executar inicialização automática
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        initialization_report = loop.run_until_complete(st.session_state.orchestrator.initialize_system())
-        loop.close()
+        initialization_report = executar(st.session_state.orchestrator.initialize_system())
         
         st.session_state.initialization_report = initialization_report
         st.session_state.system_initialized = True
@@ -65,6 +63,10 @@ if 'system_initialized' not in st.session_state:
 # Manter referência ao chroma_manager para compatibilidade
 chroma_manager = st.session_state.orchestrator.chroma_manager
 
+# Busca híbrida (BM25 + vetorial, fundidas por RRF) da aba de busca
+if 'retriever' not in st.session_state:
+    st.session_state.retriever = RecuperadorHibrido(chroma_manager)
+
 # --- Estado da Sessão ---
 if 'mermaid_code' not in st.session_state:
     st.session_state.mermaid_code = """graph TD
@@ -155,90 +157,26 @@ with tab1:
             st.session_state.log_messages.clear()
             
             if prompt_usuario:
-                max_tentativas = 3
-                codigo_atual = ""
-                mensagem_erro = ""
-
                 with st.spinner("Os agentes estão trabalhando..."):
-                    st.session_state.log_messages.append("▶️ **Iniciando processo**: Prompt do usuário recebido.")
-                    
-                    # --- Ciclo de Análise, Crítica e Refinamento do Plano ---
-                    plano_atual = None
-                    plano_aprovado = False
-                    max_ciclos_refinamento = 3
-
-                    # Etapa 1: Geração do plano inicial
-                    plano_atual, log_analista = analisar_prompt_e_criar_plano(prompt_usuario)
-                    st.session_state.log_messages.append(log_analista)
-
-                    if "erro" in plano_atual:
-                        st.error("O Agente Analista falhou em criar o plano inicial.")
-                        st.session_state.log_messages.append("❌ **Processo finalizado com falha crítica na análise.**")
-                        st.stop()
-
-                    for ciclo in range(max_ciclos_refinamento):
-                        st.session_state.log_messages.append(f"▶️ **Ciclo de Qualidade {ciclo + 1}/{max_ciclos_refinamento}**: Acionando Agente Crítico.")
-                        
-                        # Etapa 2: Agente Crítico analisa o plano
-                        plano_atual_str = json.dumps(plano_atual, indent=2)
-                        critica, log_critico = criticar_plano_de_design(prompt_usuario, plano_atual_str)
-                        st.session_state.log_messages.append(log_critico)
-
-                        if critica.get("status") == "Aprovado":
-                            st.session_state.log_messages.append("✅ **Agente Crítico**: Plano de design aprovado.")
-                            plano_aprovado = True
-                            break
-                        elif critica.get("status") == "Requer Refinamento":
-                            criticas_list = critica.get('criticas', [])
-                            st.session_state.log_messages.append(f"⚠️ **Agente Crítico**: Plano requer refinamento. Críticas: {', '.join(criticas_list)}")
-                            
-                            # Etapa 3: Agente Analista refina o plano
-                            plano_atual, log_analista_refino = analisar_prompt_e_criar_plano(
-                                prompt_usuario=prompt_usuario,
-                                plano_anterior_str=plano_atual_str,
-                                criticas=criticas_list
-                            )
-                            st.session_state.log_messages.append(log_analista_refino)
-                            if "erro" in plano_atual:
-                                st.error("O Agente Analista falhou durante o ciclo de refinamento.")
-                                st.session_state.log_messages.append("❌ **Processo finalizado com falha crítica no refinamento.**")
-                                plano_aprovado = False
-                                break
-                        else:
-                            st.error("O Agente Crítico encontrou um erro inesperado.")
-                            st.session_state.log_messages.append(f"❌ **Processo finalizado com falha crítica na auditoria.** Detalhes: {critica.get('criticas', ['N/A'])}")
-                            plano_aprovado = False
-                            break
-                    
-                    if not plano_aprovado:
-                        st.session_state.log_messages.append("⚠️ **Aviso**: O plano não foi formalmente aprovado. Prosseguindo com a melhor versão disponível após os ciclos de refinamento.")
-                    
-                    # --- Ciclo de Desenho e Validação de Sintaxe ---
-                    log_desenho = "com plano aprovado" if plano_aprovado else "com a melhor versão do plano"
-                    st.session_state.log_messages.append(f"▶️ **Iniciando fase de desenho** {log_desenho}.")
-                    
-                    # Etapa 4: Agente Desenhista cria o código
-                    codigo_atual, log_desenhista = desenhar_diagrama_com_plano(plano_atual)
-                    st.session_state.log_messages.append(log_desenhista)
-
-                    # Etapa 5: Validação e Correção de Sintaxe
-                    max_tentativas_sintaxe = 3
-                    for tentativa in range(max_tentativas_sintaxe):
-                        valido, mensagem_erro, log_validador = validar_diagrama_mermaid(codigo_atual)
-                        st.session_state.log_messages.append(log_validador)
-
-                        if valido:
-                            st.session_state.mermaid_code = codigo_atual
-                            st.session_state.log_messages.append("✅ **Processo finalizado com sucesso.**")
-                            break
-                        else:
-                            st.session_state.log_messages.append(f"▶️ **Iniciando correção de sintaxe {tentativa + 1}/{max_tentativas_sintaxe}**...")
-                            codigo_atual, log_corretor = corrigir_diagrama_mermaid(codigo_atual, mensagem_erro)
-                            st.session_state.log_messages.append(log_corretor)
-                    else: 
-                        st.error("Não foi possível gerar um diagrama com sintaxe válida após várias tentativas.")
-                        st.session_state.log_messages.append("❌ **Processo finalizado com falha na correção de sintaxe.**")
-                        st.session_state.mermaid_code = codigo_atual
+                    # Mostra a última ação dos agentes e o código à medida que é gerado
+                    status_placeholder = st.empty()
+                    codigo_placeholder = st.empty()
+                    pipeline = DiagramPipeline(
+                        on_log=status_placeholder.info,
+                        streaming=True,
+                        on_codigo_parcial=lambda codigo: codigo_placeholder.code(codigo, language="mermaid"),
+                    )
+                    # Um event loop por clique; `executar` fecha os clientes HTTP dele ao final
+                    resultado = executar(pipeline.run(prompt_usuario))
+                    st.session_state.log_messages.extend(resultado["log_messages"])
+                    st.session_state.request_trace = resultado["trace"]
+
+                for erro in resultado["erros"]:
+                    st.error(erro)
+                if resultado["status"] == "falha_analise":
+                    st.stop()
+                if resultado["mermaid_code"]:
+                    st.session_state.mermaid_code = resultado["mermaid_code"]
             else:
                 st.warning("Por favor, insira uma descrição para o diagrama.")
             
@@ -254,6 +192,40 @@ with tab1:
             log_container = st.container(border=True)
             for msg in st.session_state.log_messages:
                 log_container.info(msg)
+            # Consumo acumulado da sessão do servidor, incluindo o cache de prefixo do provedor
+            st.caption(resumo_de_uso())
+            st.caption(get_response_cache().resumo())
+            st.caption(mermaid_autofix.resumo())
+            st.caption(refinement_budget.resumo())
+
+        trace = st.session_state.get("request_trace")
+        if trace:
+            with st.expander("📊 Tokens, custo e latência desta requisição", expanded=False):
+                totais = trace["totais"]
+                st.caption(
+                    f"{totais['chamadas']} chamadas ao LLM ({totais['acertos_cache']} do cache), "
+                    f"US$ {totais['custo_usd']:.4f}, {trace['duracao_ms'] / 1000:.2f}s no total."
+                )
+                st.table([
+                    {
+                        "Agente": agente,
+                        "Chamadas": t["chamadas"],
+                        "Prompt": t["prompt_tokens"],
+                        "Em cache": t["cached_tokens"],
+                        "Gerados": t["completion_tokens"],
+                        "Repetições": t["repeticoes"],
+                        "Latência (s)": round(t["latencia_ms"] / 1000, 2),
+                        "Custo (US$)": round(t["custo_usd"], 4),
+                    }
+                    for agente, t in trace["por_agente"].items()
+                ])
+                st.download_button(
+                    "Exportar trace (JSON)",
+                    data=json.dumps(trace, ensure_ascii=False, indent=2),
+                    file_name=f"trace_{trace['id']}.json",
+                    mime="application/json",
+                )
+                st.caption(resumo_de_estatisticas())
 
 with tab2:
     st.header("Visualizador do Grafo de Conhecimento")
@@ -323,10 +295,15 @@ with tab3:
     if st.button("🔍 Buscar com Análise Profunda", key="semantic_search"):
         if query_text:
             with st.spinner("Executando busca semântica inteligente..."):
-                # Busca tradicional
-                results = chroma_manager.semantic_query(query_text, n_results=5)
+                # Busca híbrida (léxica + vetorial), ou só vetorial com HYBRID_SEARCH=0
+                if hybrid_retriever.HABILITADO:
+                    results = st.session_state.retriever.buscar(query_text, n_results=5)
+                else:
+                    results = chroma_manager.semantic_query(query_text, n_results=5)
                 
                 st.subheader("📋 Resultados da Busca Semântica:")
+                if results.get('latencias_ms'):
+                    st.caption(" · ".join(f"{etapa}: {ms:.1f} ms" for etapa, ms in results['latencias_ms'].items()))
                 
                 if results and results['documents'] and results['documents'][0]:
                     # Dashboard de estatísticas dos resultados
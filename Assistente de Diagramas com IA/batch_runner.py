@@ -0,0 +1,171 @@
+"""
+Geração de diagramas em lote, sem interface.
+
+Lê prompts de um arquivo JSONL, executa o pipeline completo dos agentes para
+cada um (com concorrência limitada e timeout por requisição) e grava cada
+resultado em um JSONL de saída assim que fica pronto. Requisições já presentes
+na saída são puladas, o que permite retomar um lote interrompido.
+
+Uso:
+    python batch_runner.py entrada.jsonl saida.jsonl --concurrency 4 --timeout 300
+    python batch_runner.py entrada.jsonl saida.jsonl --stub   # offline, sem Azure OpenAI
+    python batch_runner.py entrada.jsonl saida.jsonl --stub --stub-latency "lognormal:1.5,0.5"
+    python batch_runner.py entrada.jsonl saida.jsonl --record fixtures.jsonl   # grava as respostas do LLM
+    python batch_runner.py entrada.jsonl saida.jsonl --replay fixtures.jsonl   # reproduz as respostas gravadas
+    python batch_runner.py entrada.jsonl saida.jsonl --candidates 3   # desenhista especulativo
+
+Ao final, imprime a latência p50/p95 das requisições, para comparar lotes com
+e sem candidatos em paralelo.
+
+Cada linha da entrada deve ter um prompt em "prompt" (ou "body") e, de
+preferência, um identificador em "id" (ou "request_id").
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timezone
+import llm_client
+from pipeline import DiagramPipeline
+from response_cache import get_response_cache
+import mermaid_autofix
+import refinement_budget
+from request_trace import percentil, resumo_de_estatisticas
+
+# Resultados com estes status são refeitos ao retomar um lote
+STATUS_REPETIVEIS = {"timeout", "erro"}
+
+
+def ler_requisicoes(caminho: str) -> list:
+    """Lê o JSONL de entrada e normaliza cada linha para {"id", "prompt"}."""
+    requisicoes = []
+    with open(caminho, "r", encoding="utf-8") as f:
+        for numero, linha in enumerate(f, start=1):
+            if not linha.strip():
+                continue
+            dados = json.loads(linha)
+            prompt = dados.get("prompt") or dados.get("body")
+            if not prompt:
+                print(f"Linha {numero} ignorada: nenhum prompt encontrado.", file=sys.stderr)
+                continue
+            requisicao_id = str(dados.get("id") or dados.get("request_id") or f"linha-{numero}")
+            requisicoes.append({"id": requisicao_id, "prompt": prompt})
+    return requisicoes
+
+
+def ids_concluidos(caminho_saida: str) -> set:
+    """Retorna os ids que já têm um resultado definitivo no JSONL de saída."""
+    ultimos = {}
+    try:
+        with open(caminho_saida, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    resultado = json.loads(linha)
+                except json.JSONDecodeError:
+                    # Linha truncada por uma interrupção no meio da escrita
+                    continue
+                ultimos[resultado.get("id")] = resultado.get("status")
+    except FileNotFoundError:
+        pass
+    return {requisicao_id for requisicao_id, status in ultimos.items() if status not in STATUS_REPETIVEIS}
+
+
+def resumo_de_latencia(registros: list) -> str:
+    duracoes = [r["duracao_s"] for r in registros if "duracao_s" in r]
+    linha = f"Latência por requisição: p50 {percentil(duracoes, 50):.2f}s, p95 {percentil(duracoes, 95):.2f}s."
+    especulativos = [r["candidatos"] for r in registros if r.get("candidatos")]
+    if especulativos:
+        alternativos = sum(1 for c in especulativos if c["vencedor"] not in (None, 0))
+        linha += f" Candidatos em paralelo em {len(especulativos)} requisição(ões); um candidato alternativo venceu em {alternativos}."
+    return linha
+
+
+async def _processar(requisicao: dict, timeout: float, semaforo: asyncio.Semaphore, saida, lock: asyncio.Lock,
+                     candidatos: int = None):
+    async with semaforo:
+        inicio = time.perf_counter()
+        registro = {
+            "id": requisicao["id"],
+            "prompt": requisicao["prompt"],
+            "inicio": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            resultado = await asyncio.wait_for(DiagramPipeline(candidatos=candidatos).run(requisicao["prompt"]), timeout=timeout)
+            registro.update(resultado)
+        except asyncio.TimeoutError:
+            registro.update({"status": "timeout", "erros": [f"Tempo limite de {timeout}s excedido."]})
+        except Exception as e:
+            registro.update({"status": "erro", "erros": [str(e)]})
+        registro["duracao_s"] = round(time.perf_counter() - inicio, 3)
+
+        async with lock:
+            saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            saida.flush()
+        print(f"[{registro['status']}] {registro['id']} ({registro['duracao_s']}s)")
+        return registro
+
+
+async def executar_lote(caminho_entrada: str, caminho_saida: str, concorrencia: int = 4, timeout: float = 300,
+                        candidatos: int = None) -> list:
+    """
+    Processa todas as requisições pendentes do arquivo de entrada.
+
+    Returns:
+        A lista de registros gravados nesta execução.
+    """
+    requisicoes = ler_requisicoes(caminho_entrada)
+    concluidos = ids_concluidos(caminho_saida)
+    pendentes = [r for r in requisicoes if r["id"] not in concluidos]
+    print(f"{len(requisicoes)} requisições, {len(requisicoes) - len(pendentes)} já concluídas, {len(pendentes)} pendentes.")
+
+    semaforo = asyncio.Semaphore(concorrencia)
+    lock = asyncio.Lock()
+    with open(caminho_saida, "a", encoding="utf-8") as saida:
+        return await asyncio.gather(*[
+            _processar(requisicao, timeout, semaforo, saida, lock, candidatos) for requisicao in pendentes
+        ])
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Gera diagramas Mermaid em lote a partir de um JSONL de prompts.")
+    parser.add_argument("entrada", help="Arquivo JSONL com os prompts.")
+    parser.add_argument("saida", help="Arquivo JSONL onde os resultados são acrescentados.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Número máximo de pipelines simultâneos.")
+    parser.add_argument("--timeout", type=float, default=300, help="Tempo limite por requisição, em segundos.")
+    parser.add_argument("--stub", action="store_true", help="Usa um LLM determinístico local em vez do Azure OpenAI.")
+    parser.add_argument("--stub-latency", default=None,
+                        help='Latência simulada do stub/replay: segundos, "lognormal:1.5,0.5" ou "analista=2;*=0.5".')
+    parser.add_argument("--record", metavar="FIXTURES", help="Grava as respostas do LLM como fixtures neste arquivo.")
+    parser.add_argument("--replay", metavar="FIXTURES", help="Responde com as fixtures gravadas, sem rede.")
+    parser.add_argument("--candidates", type=int, default=None, help="Candidatos do desenhista gerados em paralelo (padrão: PIPELINE_CANDIDATES).")
+    args = parser.parse_args(argv)
+
+    replay = None
+    if args.stub:
+        from llm_stub import StubLLM
+        llm_client.usar_backend(StubLLM(latencia=args.stub_latency or 0.0))
+    elif args.replay:
+        from llm_backends import BackendReplay
+        replay = BackendReplay(args.replay, latencia=args.stub_latency)
+        llm_client.usar_backend(replay)
+    if args.record:
+        from llm_backends import BackendGravador
+        llm_client.usar_backend(BackendGravador(llm_client.backend_atual(), args.record))
+
+    registros = llm_client.executar(executar_lote(args.entrada, args.saida, args.concurrency, args.timeout, args.candidates))
+    sucessos = sum(1 for r in registros if r.get("status") == "sucesso")
+    print(f"Concluído: {sucessos}/{len(registros)} diagramas válidos.")
+    print(resumo_de_latencia(registros))
+    print(resumo_de_estatisticas([r["trace"] for r in registros if r.get("trace")]))
+    print(llm_client.resumo_de_uso())
+    print(get_response_cache().resumo())
+    print(mermaid_autofix.resumo())
+    print(refinement_budget.resumo())
+    if replay is not None:
+        print(replay.resumo())
+    return 0 if sucessos == len(registros) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,101 +2,239 @@ import os
 import json
 import hashlib
 import chromadb
+from tracing import rastreado, span_atual
+from embedding_cache import FuncaoDeEmbeddingComCache, ModeloChroma
+from hybrid_retriever import IndiceBM25
+
+# Id of the record holding the hash of the last synced knowledge_graph.json
+SYNC_HASH_ID = "sync_hash_id"
+# Searches that include edges must still skip the sync record
+NOT_SYNC_RECORD = {"source": {"$ne": "sync_hash"}}
+# Items per upsert/delete call, kept below ChromaDB's maximum batch size
+BATCH_SIZE = 500
 
 class ChromaManager:
     """
     Manages all interactions with the ChromaDB database, including initialization,
     synchronization, and querying.
     """
-    def __init__(self, base_dir):
+    def __init__(self, base_dir, embedding_function=None):
         self.base_dir = base_dir
         self.db_path = os.path.join(self.base_dir, 'chroma_db')
         self.kg_path = os.path.join(self.base_dir, 'knowledge_graph.json')
         self.collection_name = "knowledge_graph"
+        # Cached, batched embeddings: unchanged documents are never embedded twice
+        self.embedding_function = embedding_function or FuncaoDeEmbeddingComCache()
         self.client = chromadb.PersistentClient(path=self.db_path)
-        self.collection = self.client.get_or_create_collection(name=self.collection_name)
+        self.collection = self._open_collection()
+        # BM25 index for the hybrid search, kept in step with the collection by run_ingestion
+        self.lexical_index_path = os.path.join(self.db_path, 'bm25_index.json')
+        self._lexical_index = None
+
+    def _open_collection(self):
+        return self.client.get_or_create_collection(name=self.collection_name, embedding_function=self.embedding_function)
+
+    def _recreate_collection(self):
+        try:
+            # Clear existing collection
+            self.client.delete_collection(name=self.collection_name)
+            print("Cleared existing ChromaDB collection.")
+        except Exception as e:
+            print(f"Could not delete the collection (it may not exist): {e}")
+        self.collection = self._open_collection()
+        print("Recreated ChromaDB collection.")
+
+    @staticmethod
+    def _sync_marker(record):
+        """Identifies the synced collection content (file hash and embedding model)."""
+        if record is None:
+            return None
+        return f"{record.get('hash')}:{record.get('embedding_model', ModeloChroma.id)}"
+
+    def _sync_record(self):
+        """Metadata of the record written by the last sync, or None."""
+        stored = self.collection.get(ids=[SYNC_HASH_ID], include=["metadatas"])
+        if not stored or not stored['ids']:
+            return None
+        return stored['metadatas'][0] or {}
 
     def _get_json_hash(self):
         """Calculates the SHA256 hash of the knowledge_graph.json file."""
         with open(self.kg_path, 'rb') as f:
             return hashlib.sha256(f.read()).hexdigest()
 
+    def _file_stat(self):
+        """(size, mtime_ns, inode) of knowledge_graph.json, as stored in the sync record."""
+        stat = os.stat(self.kg_path)
+        return {'file_size': stat.st_size, 'file_mtime_ns': stat.st_mtime_ns, 'file_inode': stat.st_ino}
+
+    @rastreado()
     def is_sync_needed(self):
-        """Checks if the DB is synchronized with the knowledge_graph.json file."""
-        current_hash = self._get_json_hash()
-        # Metadata in ChromaDB must be strings, numbers, or booleans
-        stored_metadata = self.collection.get(where={"source": "sync_hash"})
-        
-        if not stored_metadata or not stored_metadata['ids']:
+        """
+        Checks if the DB is synchronized with the knowledge_graph.json file.
+
+        The file is only read and hashed when its (size, mtime_ns, inode)
+        differs from the one recorded by the last sync, so the usual check on
+        startup costs one stat call and one lookup by id.
+        """
+        record = self._sync_record()
+
+        if record is None:
             return True # No hash stored, sync is needed
 
-        stored_hash = stored_metadata['metadatas'][0].get('hash')
-        return stored_hash != current_hash
+        # Vectors from another embedding model cannot be reused
+        if record.get('embedding_model', ModeloChroma.id) != self.embedding_function.id_do_modelo:
+            return True
+
+        current_stat = self._file_stat()
+        if all(record.get(key) == value for key, value in current_stat.items()):
+            span_atual().definir_atributo("sync.fast_path", True)
+            return False
+
+        if record.get('hash') != self._get_json_hash():
+            return True
+
+        # Same content with a new mtime or inode (e.g. touched or checked out again)
+        self.collection.update(ids=[SYNC_HASH_ID], metadatas=[{**record, **current_stat}])
+        return False
+
+    @staticmethod
+    def _content_hash(document, metadata):
+        """Hash of everything stored for an item, used to detect changed items."""
+        payload = json.dumps([document, metadata], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _node_entry(item):
+        summary = item.get('summary', '')
+        doc = f"ID: {item.get('id', '')}, Tipo: {item.get('type', '')}, Label: {item.get('label', '')}"
+        if summary:
+            doc += f", Resumo: {summary}"
+        metadata = {
+            'id': item.get('id', ''),
+            'type': item.get('type', ''),
+            'label': item.get('label', ''),
+            'summary': summary,
+            'source': 'node'
+        }
+        return f"node_{item.get('id', '')}", doc, metadata
+
+    @staticmethod
+    def _edge_id(item, occurrence):
+        """
+        Stable id for an edge, derived from its endpoints and label instead of its
+        position in the file, so inserting or removing another edge does not
+        change it. Identical edges are told apart by their occurrence number.
+        """
+        key = json.dumps([item.get('source', ''), item.get('target', ''), item.get('label', '')], ensure_ascii=False)
+        edge_id = f"edge_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+        return edge_id if occurrence == 0 else f"{edge_id}_{occurrence}"
+
+    def _edge_entries(self, items):
+        occurrences = {}
+        entries = []
+        for item in items:
+            key = (item.get('source', ''), item.get('target', ''), item.get('label', ''))
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            description = item.get('description', '')
+            doc = f"Edge from '{item.get('source')}' to '{item.get('target')}' labeled '{item.get('label', '')}'."
+            if description:
+                doc += f" Descrição: {description}"
+            metadata = {
+                'source': item.get('source', ''),
+                'target': item.get('target', ''),
+                'label': item.get('label', ''),
+                'description': description,
+                'source_type': 'edge'
+            }
+            entries.append((self._edge_id(item, occurrence), doc, metadata))
+        return entries
+
+    def _desired_items(self, kg_data):
+        """All items the collection should hold, as {id: (document, metadata)} with the content hash in the metadata."""
+        entries = [self._node_entry(item) for item in kg_data.get('nodes', [])]
+        entries += self._edge_entries(kg_data.get('edges', []))
+        desired = {}
+        for item_id, doc, metadata in entries:
+            metadata['content_hash'] = self._content_hash(doc, metadata)
+            desired[item_id] = (doc, metadata)
+        return desired
 
+    def _stored_hashes(self):
+        """Content hash of every item already in the collection (metadata only, no embeddings)."""
+        stored = self.collection.get(include=["metadatas"])
+        return {
+            item_id: (metadata or {}).get('content_hash')
+            for item_id, metadata in zip(stored.get('ids', []), stored.get('metadatas') or [])
+            if item_id != SYNC_HASH_ID
+        }
+
+    @rastreado()
     def run_ingestion(self):
-        """Clears and ingests data from knowledge_graph.json into ChromaDB."""
-        print("--- Running ChromaDB Ingestion --- ")
-        # Clear existing collection
-        self.client.delete_collection(name=self.collection_name)
-        self.collection = self.client.create_collection(name=self.collection_name)
-
-        # Ingest nodes and edges
-        with open(self.kg_path, 'r', encoding='utf-8') as f:
-            kg_data = json.load(f)
-        
-        self._ingest_items(kg_data.get('nodes', []), 'nodes')
-        self._ingest_items(kg_data.get('edges', []), 'edges')
-
-        # Store the new hash
-        new_hash = self._get_json_hash()
-        self.collection.add(
-            ids=["sync_hash_id"],
-            metadatas=[{"source": "sync_hash", "hash": new_hash}]
-        )
-        print("--- Ingestion Complete ---")
-
-    def _ingest_items(self, items, item_type):
-        """Helper function to ingest a list of nodes or edges."""
-        if not items:
-            print(f"No {item_type} to ingest.")
-            return
-
-        docs, metadatas, ids = [], [], []
-        for i, item in enumerate(items):
-            if item_type == 'nodes':
-                summary = item.get('summary', '')
-                doc = f"ID: {item.get('id', '')}, Tipo: {item.get('type', '')}, Label: {item.get('label', '')}"
-                if summary:
-                    doc += f", Resumo: {summary}"
-                metadatas.append({
-                    'id': item.get('id', ''),
-                    'type': item.get('type', ''),
-                    'label': item.get('label', ''),
-                    'summary': summary,
-                    'source': 'node'
-                })
-                ids.append(f"node_{item.get('id', '')}")
-            else: # edges
-                description = item.get('description', '')
-                doc = f"Edge from '{item.get('source')}' to '{item.get('target')}' labeled '{item.get('label', '')}'."
-                if description:
-                    doc += f" Descrição: {description}"
-                ids.append(f"edge_{item.get('source')}_{item.get('target')}_{i}")
-                metadatas.append({
-                    'source': item.get('source', ''),
-                    'target': item.get('target', ''),
-                    'label': item.get('label', ''),
-                    'description': description,
-                    'source_type': 'edge'
-                })
-            docs.append(doc)
-
-        self.collection.add(documents=docs, metadatas=metadatas, ids=ids)
-        print(f"Successfully ingested {len(items)} {item_type}.")
+        """
+        Incrementally syncs the collection with knowledge_graph.json.
+
+        Only new or changed nodes and edges (by content hash) are embedded and
+        upserted, and items no longer in the file are deleted, so the cost of a
+        sync scales with the size of the change instead of the size of the graph.
+
+        Returns:
+            A dict with the number of items added, updated, deleted and unchanged.
+        """
+        print("--- Running ChromaDB Incremental Sync --- ")
+        # Stat before reading, so a write during the sync is detected by the next check
+        file_stat = self._file_stat()
+        with open(self.kg_path, 'rb') as f:
+            content = f.read()
+        kg_data = json.loads(content.decode('utf-8'))
 
+        record = self._sync_record()
+        model_id = self.embedding_function.id_do_modelo
+        if record is not None and record.get('embedding_model', ModeloChroma.id) != model_id:
+            print(f"Embedding model changed to {model_id}; rebuilding the collection.")
+            self._recreate_collection()
+            record = None
+        computed_before = self.embedding_function.metricas()['calculados']
+
+        desired = self._desired_items(kg_data)
+        stored = self._stored_hashes()
+        changed = [item_id for item_id, (_, metadata) in desired.items() if stored.get(item_id) != metadata['content_hash']]
+        removed = [item_id for item_id in stored if item_id not in desired]
+
+        for i in range(0, len(changed), BATCH_SIZE):
+            batch = changed[i:i + BATCH_SIZE]
+            self.collection.upsert(
+                ids=batch,
+                documents=[desired[item_id][0] for item_id in batch],
+                metadatas=[desired[item_id][1] for item_id in batch],
+            )
+        for i in range(0, len(removed), BATCH_SIZE):
+            self.collection.delete(ids=removed[i:i + BATCH_SIZE])
+
+        # Store the new file hash
+        new_record = {"source": "sync_hash", "hash": hashlib.sha256(content).hexdigest(), "embedding_model": model_id, **file_stat}
+        # Chroma requires a document or an embedding for every record; the empty placeholder is never searched
+        self.collection.upsert(ids=[SYNC_HASH_ID], metadatas=[new_record], documents=[""])
+        self._update_lexical_index(desired, changed, removed, self._sync_marker(record), self._sync_marker(new_record))
+        stats = {
+            'added': sum(1 for item_id in changed if item_id not in stored),
+            'updated': sum(1 for item_id in changed if item_id in stored),
+            'deleted': len(removed),
+            'unchanged': len(desired) - len(changed),
+            'embeddings_computed': self.embedding_function.metricas()['calculados'] - computed_before,
+        }
+        span_atual().definir_atributos(**{f"sync.{key}": value for key, value in stats.items()})
+        print(f"--- Sync Complete: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['deleted']} deleted, {stats['unchanged']} unchanged, "
+              f"{stats['embeddings_computed']} embeddings computed ---")
+        return stats
+
+    @rastreado()
     def semantic_query(self, query_text, n_results=3, include_edges=False):
         """Performs a semantic query against the collection."""
-        where_clause = None
+        span_atual().definir_atributos(n_results=n_results, include_edges=include_edges)
+        where_clause = NOT_SYNC_RECORD
         if not include_edges:
             where_clause = {"source": "node"}  # Only search within nodes by default
         
@@ -106,6 +244,69 @@ class ChromaManager:
             where=where_clause
         )
     
+    def _update_lexical_index(self, desired, changed, removed, previous_marker, marker):
+        """Applies the sync changes to the BM25 index, or rebuilds it if it does not match the previous sync."""
+        index = self._lexical_index or IndiceBM25.carregar(self.lexical_index_path)
+        if index is None or previous_marker is None or index.marcador != previous_marker:
+            index = IndiceBM25()
+            changed = list(desired)
+        for item_id in removed:
+            index.remover(item_id)
+        for item_id in changed:
+            doc, metadata = desired[item_id]
+            index.atualizar(item_id, doc, {'source': metadata.get('source')})
+        index.marcador = marker
+        self._save_lexical_index(index)
+
+    def _save_lexical_index(self, index):
+        self._lexical_index = index
+        try:
+            index.salvar(self.lexical_index_path)
+        except OSError as e:
+            # The index is rebuilt from the collection on the next start
+            print(f"Could not save the BM25 index: {e}")
+
+    def lexical_index(self):
+        """The BM25 index of the collection, loaded from disk or rebuilt from the collection if stale."""
+        if self._lexical_index is None:
+            marker = self.sync_hash()
+            index = IndiceBM25.carregar(self.lexical_index_path)
+            if index is None or index.marcador != marker:
+                index = IndiceBM25()
+                stored = self.collection.get(include=["documents", "metadatas"])
+                for item_id, doc, metadata in zip(stored['ids'], stored['documents'], stored['metadatas']):
+                    if item_id != SYNC_HASH_ID:
+                        index.atualizar(item_id, doc or '', {'source': (metadata or {}).get('source')})
+                index.marcador = marker
+                self._save_lexical_index(index)
+            self._lexical_index = index
+        return self._lexical_index
+
+    @rastreado()
+    def semantic_query_batch(self, query_texts, n_results=3, include_edges=False):
+        """
+        Runs many semantic queries with one collection.query call per BATCH_SIZE
+        queries, so all query embeddings are computed together.
+
+        Returns:
+            One result per query, shaped like the result of semantic_query.
+        """
+        span_atual().definir_atributos(queries=len(query_texts), n_results=n_results, include_edges=include_edges)
+        where_clause = NOT_SYNC_RECORD if include_edges else {"source": "node"}
+        results = []
+        for i in range(0, len(query_texts), BATCH_SIZE):
+            chunk = query_texts[i:i + BATCH_SIZE]
+            batch = self.collection.query(query_texts=chunk, n_results=n_results, where=where_clause)
+            fields = [field for field in ('ids', 'documents', 'metadatas', 'distances') if batch.get(field) is not None]
+            for j in range(len(chunk)):
+                results.append({field: [batch[field][j]] for field in fields})
+        return results
+
+    def sync_hash(self):
+        """Identifies the synced collection content (file hash and embedding model), or None before the first sync."""
+        return self._sync_marker(self._sync_record())
+
+    @rastreado()
     def get_all_data(self):
         """Retrieves all data from the collection for visualization."""
         try:
@@ -121,26 +322,11 @@ class ChromaManager:
             print(f"Error retrieving data: {e}")
             return {'nodes': [], 'edges': [], 'total_items': 0}
 
+    @rastreado()
     def force_reingest(self):
-        """Force a complete re-ingestion of the knowledge graph data."""
-        try:
-            # Clear existing collection
-            self.client.delete_collection(name=self.collection_name)
-            print("Cleared existing ChromaDB collection.")
-            
-            # Recreate collection
-            self.collection = self.client.create_collection(name=self.collection_name)
-            print("Recreated ChromaDB collection.")
-            
-            # Run fresh ingestion
-            self.run_ingestion()
-            print("Completed forced re-ingestion with updated summaries and descriptions.")
-            
-        except Exception as e:
-            print(f"Error during forced re-ingestion: {e}")
-            # Recreate collection if it doesn't exist
-            try:
-                self.collection = self.client.create_collection(name=self.collection_name)
-                self.run_ingestion()
-            except Exception as e2:
-                print(f"Failed to recover: {e2}")
+        """Force a complete re-ingestion of the knowledge graph data (every item is embedded again)."""
+        # Recreate collection; the sync then sees every item as new (their embeddings come from the cache)
+        self._recreate_collection()
+        stats = self.run_ingestion()
+        print("Completed forced re-ingestion with updated summaries and descriptions.")
+        return stats
@@ -0,0 +1,248 @@
+"""
+Camada de embeddings do ChromaDB, com cache em disco e cálculo em lotes paralelos.
+
+Sem uma função de embeddings explícita, o Chroma recalcula o embedding de cada
+documento a cada ingestão, mesmo que o texto não tenha mudado. Aqui os vetores
+ficam em um cache SQLite endereçado por (id do modelo, SHA-256 do texto): uma
+reingestão do mesmo grafo não calcula nenhum embedding, e só os textos novos
+vão para o modelo, divididos em lotes processados em paralelo por um pool de
+threads (os modelos locais liberam o GIL durante a inferência, então os lotes
+ocupam todos os núcleos).
+
+Modelos disponíveis (`EMBEDDING_PROVIDER`):
+
+- `chroma` (padrão): o modelo padrão do Chroma (all-MiniLM-L6-v2 via ONNX, na
+  CPU), o mesmo usado antes desta camada, então as coleções existentes
+  continuam compatíveis.
+- `local`: um modelo do sentence-transformers na CPU (`EMBEDDING_LOCAL_MODEL`,
+  padrão all-MiniLM-L6-v2); exige o pacote `sentence-transformers`.
+- `backend`: o modelo de embeddings do backend de LLM ativo (ver
+  `llm_backends`), uma chamada por texto.
+
+Outras variáveis: `EMBEDDING_CACHE=0` desliga o cache, `EMBEDDING_CACHE_PATH`
+(padrão: .cache/embeddings.sqlite3), `EMBEDDING_BATCH_SIZE` (padrão: 64) e
+`EMBEDDING_WORKERS` (padrão: número de núcleos).
+"""
+import os
+import array
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chromadb.api.types import EmbeddingFunction
+from dotenv import load_dotenv
+from validation_cache import CACHE_DIR
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+HABILITADO = os.getenv("EMBEDDING_CACHE", "1") == "1"
+PROVEDOR = os.getenv("EMBEDDING_PROVIDER", "chroma")
+MODELO_LOCAL = os.getenv("EMBEDDING_LOCAL_MODEL", "all-MiniLM-L6-v2")
+TAMANHO_DO_LOTE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+TRABALHADORES = int(os.getenv("EMBEDDING_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def hash_texto(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class ModeloChroma:
+    """O modelo padrão do Chroma (all-MiniLM-L6-v2 em ONNX, na CPU)."""
+
+    id = "chroma:all-MiniLM-L6-v2"
+
+    def __init__(self):
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        self._funcao = DefaultEmbeddingFunction()
+
+    def embed_lote(self, textos: list) -> list:
+        return [[float(x) for x in vetor] for vetor in self._funcao(textos)]
+
+
+class ModeloLocal:
+    """
+    Um modelo do sentence-transformers executado na CPU.
+
+    Args:
+        nome: Nome do modelo no Hugging Face Hub ou caminho local.
+    """
+
+    def __init__(self, nome: str = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_PROVIDER=local exige o pacote sentence-transformers") from e
+        self.nome = nome or MODELO_LOCAL
+        self.id = f"local:{self.nome}"
+        self._modelo = SentenceTransformer(self.nome, device="cpu")
+
+    def embed_lote(self, textos: list) -> list:
+        return self._modelo.encode(textos, batch_size=len(textos), convert_to_numpy=True).tolist()
+
+
+class ModeloDoBackend:
+    """O modelo de embeddings do backend de LLM ativo (`llm_client.criar_embedding`)."""
+
+    def __init__(self):
+        import llm_client
+        self._criar_embedding = llm_client.criar_embedding
+        self.id = f"backend:{getattr(llm_client.backend_atual(), 'modelo_embeddings', None) or llm_client.backend_atual().nome}"
+
+    def embed_lote(self, textos: list) -> list:
+        return [list(self._criar_embedding(texto)) for texto in textos]
+
+
+def criar_modelo(nome: str = None):
+    """Cria o modelo de embeddings indicado por `nome` (padrão: `EMBEDDING_PROVIDER`)."""
+    nome = nome or PROVEDOR
+    if nome == "local":
+        return ModeloLocal()
+    if nome == "backend":
+        return ModeloDoBackend()
+    return ModeloChroma()
+
+
+class EmbeddingCache:
+    """
+    Cache em disco de embeddings, endereçado por (id do modelo, hash do texto).
+
+    Os vetores são gravados como float32, como no cache de respostas.
+
+    Args:
+        db_path: Caminho do banco (padrão: .cache/embeddings.sqlite3).
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.getenv("EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite3"))
+        self._lock = threading.Lock()
+        self._conexao = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conexao = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "modelo TEXT NOT NULL, chave TEXT NOT NULL, vetor BLOB NOT NULL, PRIMARY KEY (modelo, chave))"
+            )
+        return self._conexao
+
+    def obter(self, modelo: str, chaves: list) -> dict:
+        """Retorna {chave: vetor} para as chaves já armazenadas."""
+        encontrados = {}
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                # Consultas em blocos, abaixo do limite de parâmetros do SQLite
+                for i in range(0, len(chaves), 500):
+                    bloco = chaves[i:i + 500]
+                    for chave, blob in conexao.execute(
+                        f"SELECT chave, vetor FROM embeddings WHERE modelo = ? AND chave IN ({','.join('?' * len(bloco))})",
+                        [modelo, *bloco]
+                    ):
+                        encontrados[chave] = array.array("f", blob).tolist()
+            except sqlite3.Error:
+                pass
+        return encontrados
+
+    def armazenar(self, modelo: str, vetores: dict):
+        """Grava {chave: vetor}."""
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                conexao.executemany(
+                    "INSERT OR REPLACE INTO embeddings (modelo, chave, vetor) VALUES (?, ?, ?)",
+                    [(modelo, chave, array.array("f", vetor).tobytes()) for chave, vetor in vetores.items()]
+                )
+                conexao.commit()
+            except sqlite3.Error:
+                # O cache é apenas uma otimização; falhas não afetam a ingestão
+                pass
+
+
+class FuncaoDeEmbeddingComCache(EmbeddingFunction):
+    """
+    Função de embeddings para coleções do Chroma: consulta o cache, calcula só os
+    textos ausentes, em lotes paralelos, e guarda os novos vetores.
+
+    Args:
+        modelo: Um objeto com `id` e `embed_lote(textos)` (padrão: `criar_modelo()`).
+        cache: O `EmbeddingCache` (padrão: o compartilhado; None se `EMBEDDING_CACHE=0`).
+        tamanho_do_lote: Textos por chamada ao modelo.
+        trabalhadores: Lotes calculados em paralelo.
+    """
+
+    def __init__(self, modelo=None, cache: EmbeddingCache = None, tamanho_do_lote: int = None, trabalhadores: int = None):
+        self.modelo = modelo or criar_modelo()
+        self.cache = cache if cache is not None else (get_embedding_cache() if HABILITADO else None)
+        self.tamanho_do_lote = tamanho_do_lote or TAMANHO_DO_LOTE
+        self.trabalhadores = trabalhadores or TRABALHADORES
+        self._lock = threading.Lock()
+        self._metricas = {"textos": 0, "acertos": 0, "calculados": 0, "lotes": 0}
+
+    @property
+    def id_do_modelo(self) -> str:
+        return self.modelo.id
+
+    def __call__(self, input: list) -> list:
+        chaves = [hash_texto(texto) for texto in input]
+        vetores = self.cache.obter(self.modelo.id, list(set(chaves))) if self.cache is not None else {}
+
+        # Textos repetidos na mesma chamada são calculados uma vez
+        pendentes = {}
+        for chave, texto in zip(chaves, input):
+            if chave not in vetores:
+                pendentes.setdefault(chave, texto)
+        novos = self._calcular(pendentes) if pendentes else {}
+        if novos and self.cache is not None:
+            self.cache.armazenar(self.modelo.id, novos)
+        vetores.update(novos)
+
+        with self._lock:
+            self._metricas["textos"] += len(input)
+            self._metricas["acertos"] += len(input) - sum(1 for chave in chaves if chave in novos)
+            self._metricas["calculados"] += len(novos)
+        return [vetores[chave] for chave in chaves]
+
+    def _calcular(self, pendentes: dict) -> dict:
+        chaves = list(pendentes)
+        lotes = [chaves[i:i + self.tamanho_do_lote] for i in range(0, len(chaves), self.tamanho_do_lote)]
+        with self._lock:
+            self._metricas["lotes"] += len(lotes)
+        if len(lotes) == 1 or self.trabalhadores <= 1:
+            resultados = [self.modelo.embed_lote([pendentes[chave] for chave in lote]) for lote in lotes]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.trabalhadores, len(lotes))) as executor:
+                resultados = list(executor.map(lambda lote: self.modelo.embed_lote([pendentes[chave] for chave in lote]), lotes))
+        return {chave: vetor for lote, vetores in zip(lotes, resultados) for chave, vetor in zip(lote, vetores)}
+
+    def metricas(self) -> dict:
+        """Contadores desde a criação: textos recebidos, acertos no cache, embeddings calculados e lotes."""
+        with self._lock:
+            return dict(self._metricas)
+
+    def resumo(self) -> str:
+        """Resumo de uma linha das métricas, para logs e para a interface."""
+        m = self.metricas()
+        return (
+            f"Embeddings ({self.modelo.id}): {m['acertos']}/{m['textos']} do cache, "
+            f"{m['calculados']} calculados em {m['lotes']} lotes."
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Retorna o cache de embeddings compartilhado do processo."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,261 @@
+"""
+Busca híbrida (léxica + vetorial) com reordenação opcional para a aba "Busca Semântica".
+
+A busca vetorial do Chroma encontra bem conceitos parecidos, mas ordena mal
+consultas que citam identificadores exatos (`chroma_manager.py`,
+`agente_corretor`). Aqui três etapas se combinam:
+
+1. Léxica: um índice invertido BM25 (`IndiceBM25`) mantido pelo
+   `ChromaManager` junto com a ingestão, atualizado só com os itens alterados.
+   Identificadores são indexados inteiros e em partes (`chroma_manager.py` →
+   `chroma_manager.py`, `chroma_manager`, `chroma`, `manager`, `py`).
+2. Vetorial: a consulta normal do Chroma.
+3. Fusão: reciprocal rank fusion (RRF) das duas listas e, opcionalmente, uma
+   reordenação dos primeiros candidatos por um cross-encoder local
+   (sentence-transformers, na CPU).
+
+Configuração: `HYBRID_SEARCH=0` volta à busca só vetorial, `HYBRID_CANDIDATES`
+(padrão: 20) candidatos por etapa, `HYBRID_RRF_K` (padrão: 60),
+`HYBRID_RERANK=1` liga o cross-encoder e `HYBRID_RERANK_MODEL` o escolhe
+(padrão: cross-encoder/ms-marco-MiniLM-L-6-v2).
+"""
+import os
+import re
+import json
+import math
+import time
+import unicodedata
+from collections import Counter
+from dotenv import load_dotenv
+from tracing import span
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+HABILITADO = os.getenv("HYBRID_SEARCH", "1") == "1"
+CANDIDATOS = int(os.getenv("HYBRID_CANDIDATES", "20"))
+K_RRF = int(os.getenv("HYBRID_RRF_K", "60"))
+REORDENAR = os.getenv("HYBRID_RERANK", "0") == "1"
+MODELO_REORDENADOR = os.getenv("HYBRID_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+_PALAVRAS_IGNORADAS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "um", "uma", "para", "com", "que",
+    "no", "na", "se", "ao", "por", "qual", "como", "the", "of", "to", "and", "in", "is", "from",
+}
+
+
+def tokenizar(texto: str) -> list:
+    """Termos do texto, sem acentos e em minúsculas; identificadores entram inteiros e em partes."""
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii").lower()
+    termos = []
+    for bruto in re.findall(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*", texto):
+        partes = re.split(r"[._\-]", bruto)
+        if len(partes) > 1:
+            termos.append(bruto)
+            # Nome sem a extensão (chroma_manager.py → chroma_manager)
+            if "." in bruto and len(re.split(r"[_\-]", bruto.rsplit(".", 1)[0])) > 1:
+                termos.append(bruto.rsplit(".", 1)[0])
+        termos.extend(partes)
+    return [termo for termo in termos if termo not in _PALAVRAS_IGNORADAS]
+
+
+class IndiceBM25:
+    """
+    Índice invertido com pontuação BM25, atualizável item a item.
+
+    Cada documento guarda as frequências dos seus termos e os campos usados em
+    filtros (`where` de igualdade, como no Chroma).
+
+    Args:
+        k1: Saturação da frequência do termo.
+        b: Peso da normalização pelo tamanho do documento.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.marcador = None
+        self._documentos = {}
+        self._postings = {}
+        self._total_termos = 0
+
+    def __len__(self):
+        return len(self._documentos)
+
+    def atualizar(self, doc_id: str, texto: str, campos: dict = None):
+        """Indexa (ou reindexa) um documento."""
+        self.remover(doc_id)
+        frequencias = Counter(tokenizar(texto))
+        self._documentos[doc_id] = {"tamanho": sum(frequencias.values()), "campos": campos or {}, "termos": dict(frequencias)}
+        self._total_termos += self._documentos[doc_id]["tamanho"]
+        for termo, frequencia in frequencias.items():
+            self._postings.setdefault(termo, {})[doc_id] = frequencia
+
+    def remover(self, doc_id: str):
+        documento = self._documentos.pop(doc_id, None)
+        if documento is None:
+            return
+        self._total_termos -= documento["tamanho"]
+        for termo in documento["termos"]:
+            postings = self._postings.get(termo)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[termo]
+
+    def buscar(self, consulta: str, n: int = 10, where: dict = None) -> list:
+        """Os `n` documentos de maior pontuação BM25, como [(id, pontuação)]."""
+        if not self._documentos:
+            return []
+        total = len(self._documentos)
+        media = self._total_termos / total or 1.0
+        pontuacoes = {}
+        for termo in set(tokenizar(consulta)):
+            postings = self._postings.get(termo)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequencia in postings.items():
+                documento = self._documentos[doc_id]
+                if where and any(documento["campos"].get(campo) != valor for campo, valor in where.items()):
+                    continue
+                normalizacao = self.k1 * (1 - self.b + self.b * documento["tamanho"] / media)
+                pontuacoes[doc_id] = pontuacoes.get(doc_id, 0.0) + idf * frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+        return sorted(pontuacoes.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def salvar(self, caminho: str):
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({"marcador": self.marcador, "k1": self.k1, "b": self.b, "documentos": self._documentos}, f, ensure_ascii=False)
+
+    @classmethod
+    def carregar(cls, caminho: str):
+        """Lê um índice salvo; None se o arquivo não existir ou estiver corrompido."""
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        indice = cls(dados.get("k1", 1.2), dados.get("b", 0.75))
+        indice.marcador = dados.get("marcador")
+        for doc_id, documento in dados.get("documentos", {}).items():
+            indice._documentos[doc_id] = documento
+            indice._total_termos += documento["tamanho"]
+            for termo, frequencia in documento["termos"].items():
+                indice._postings.setdefault(termo, {})[doc_id] = frequencia
+        return indice
+
+
+def fundir_rrf(listas: list, k: int = K_RRF) -> list:
+    """Reciprocal rank fusion: soma 1 / (k + posição) de cada id em cada lista; devolve [(id, pontuação)]."""
+    pontuacoes = {}
+    for lista in listas:
+        for posicao, doc_id in enumerate(lista, start=1):
+            pontuacoes[doc_id] = pontuacoes.get(doc_id, 0.0) + 1.0 / (k + posicao)
+    return sorted(pontuacoes.items(), key=lambda item: (-item[1], item[0]))
+
+
+class ReordenadorCrossEncoder:
+    """
+    Reordena candidatos com um cross-encoder local do sentence-transformers (CPU).
+
+    Args:
+        modelo: Nome do modelo no Hugging Face Hub ou caminho local.
+    """
+
+    def __init__(self, modelo: str = None):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("HYBRID_RERANK=1 exige o pacote sentence-transformers") from e
+        self.modelo = modelo or MODELO_REORDENADOR
+        self._modelo = CrossEncoder(self.modelo, device="cpu")
+
+    def pontuar(self, consulta: str, documentos: list) -> list:
+        return [float(p) for p in self._modelo.predict([(consulta, documento) for documento in documentos])]
+
+
+class RecuperadorHibrido:
+    """
+    Busca híbrida sobre a coleção de um `ChromaManager`.
+
+    Args:
+        chroma_manager: O gerenciador da coleção (fornece a consulta vetorial e o índice BM25).
+        reordenador: Objeto com `pontuar(consulta, documentos)`; padrão: o cross-encoder, se `reordenar`.
+        reordenar: Usa o cross-encoder quando nenhum reordenador é passado (padrão: `HYBRID_RERANK`).
+        candidatos: Candidatos trazidos por etapa antes da fusão.
+        k_rrf: Constante do RRF.
+    """
+
+    def __init__(self, chroma_manager, reordenador=None, reordenar: bool = None, candidatos: int = None, k_rrf: int = None):
+        self.chroma_manager = chroma_manager
+        if reordenador is None and (REORDENAR if reordenar is None else reordenar):
+            reordenador = ReordenadorCrossEncoder()
+        self.reordenador = reordenador
+        self.candidatos = candidatos or CANDIDATOS
+        self.k_rrf = k_rrf or K_RRF
+
+    def buscar(self, consulta: str, n_results: int = 5, include_edges: bool = False, etapas: tuple = ("lexica", "vetorial")) -> dict:
+        """
+        Executa a busca e devolve um resultado no formato do `collection.query`
+        do Chroma (listas com uma entrada por consulta), acrescido de
+        `scores` e de `latencias_ms` por etapa.
+
+        Args:
+            etapas: Listas combinadas pelo RRF ("lexica", "vetorial" ou ambas), para comparar as etapas.
+        """
+        where = None if include_edges else {"source": "node"}
+        latencias = {}
+        listas = []
+        with span("retrieval.hybrid", consulta=consulta, n_results=n_results) as atual:
+            if "lexica" in etapas:
+                inicio = time.perf_counter()
+                with span("retrieval.lexical"):
+                    listas.append([doc_id for doc_id, _ in self.chroma_manager.lexical_index().buscar(consulta, self.candidatos, where)])
+                latencias["lexica"] = (time.perf_counter() - inicio) * 1000
+
+            documentos = {}
+            if "vetorial" in etapas:
+                inicio = time.perf_counter()
+                with span("retrieval.vector"):
+                    resultado = self.chroma_manager.semantic_query(consulta, n_results=self.candidatos, include_edges=include_edges)
+                ids = resultado["ids"][0] if resultado and resultado.get("ids") else []
+                for i, doc_id in enumerate(ids):
+                    documentos[doc_id] = (resultado["documents"][0][i], resultado["metadatas"][0][i])
+                listas.append(ids)
+                latencias["vetorial"] = (time.perf_counter() - inicio) * 1000
+
+            inicio = time.perf_counter()
+            fundidos = fundir_rrf(listas, self.k_rrf)
+            limite = self.candidatos if self.reordenador is not None else n_results
+            fundidos = fundidos[:limite]
+            # Os itens achados só pela etapa léxica são lidos da coleção
+            faltantes = [doc_id for doc_id, _ in fundidos if doc_id not in documentos]
+            if faltantes:
+                lidos = self.chroma_manager.collection.get(ids=faltantes, include=["documents", "metadatas"])
+                for doc_id, documento, metadados in zip(lidos["ids"], lidos["documents"], lidos["metadatas"]):
+                    documentos[doc_id] = (documento, metadados)
+            fundidos = [(doc_id, pontuacao) for doc_id, pontuacao in fundidos if doc_id in documentos]
+            latencias["fusao"] = (time.perf_counter() - inicio) * 1000
+
+            if self.reordenador is not None and fundidos:
+                inicio = time.perf_counter()
+                with span("retrieval.rerank", candidatos=len(fundidos)):
+                    pontuacoes = self.reordenador.pontuar(consulta, [documentos[doc_id][0] for doc_id, _ in fundidos])
+                fundidos = sorted(zip([doc_id for doc_id, _ in fundidos], pontuacoes), key=lambda item: -item[1])
+                latencias["reordenacao"] = (time.perf_counter() - inicio) * 1000
+
+            fundidos = fundidos[:n_results]
+            latencias["total"] = sum(latencias.values())
+            atual.definir_atributos(resultados=len(fundidos), **{f"latencia_{etapa}_ms": round(ms, 2) for etapa, ms in latencias.items()})
+
+        return {
+            "ids": [[doc_id for doc_id, _ in fundidos]],
+            "documents": [[documentos[doc_id][0] for doc_id, _ in fundidos]],
+            "metadatas": [[documentos[doc_id][1] for doc_id, _ in fundidos]],
+            "scores": [[pontuacao for _, pontuacao in fundidos]],
+            "latencias_ms": latencias,
+        }
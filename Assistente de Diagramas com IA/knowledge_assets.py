@@ -0,0 +1,174 @@
+"""
+Carregamento memoizado dos arquivos de conhecimento dos agentes (manuais .md).
+
+O conteúdo de cada arquivo é lido uma vez e mantido em memória junto com o seu
+hash SHA-256, usado por caches de prompts e de respostas como parte da chave.
+A invalidação acontece de duas formas:
+
+- Com o pacote opcional `watchdog` instalado, um observador do sistema de
+  arquivos (inotify no Linux) invalida a entrada assim que o arquivo muda, e
+  as leituras no caminho quente não tocam o disco.
+- Sem ele, o `mtime`/tamanho do arquivo é conferido no máximo uma vez a cada
+  `KNOWLEDGE_ASSETS_CHECK_INTERVAL` segundos.
+"""
+import os
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+
+BASE_DIR = os.path.dirname(__file__)
+
+INTERVALO_VERIFICACAO = float(os.getenv("KNOWLEDGE_ASSETS_CHECK_INTERVAL", "2"))
+
+
+@dataclass(frozen=True)
+class Ativo:
+    """Conteúdo de um arquivo de conhecimento, com a assinatura usada na invalidação."""
+    caminho: str
+    conteudo: str
+    hash: str
+    mtime_ns: int
+    tamanho: int
+
+
+def _watchdog_disponivel() -> bool:
+    try:
+        import watchdog  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class KnowledgeAssets:
+    """
+    Cache dos arquivos de conhecimento.
+
+    Args:
+        intervalo_verificacao: Segundos entre verificações de `mtime` quando não há observador.
+        observar: Usa o `watchdog` para invalidar as entradas, se estiver instalado.
+    """
+
+    def __init__(self, intervalo_verificacao: float = INTERVALO_VERIFICACAO, observar: bool = True):
+        self.intervalo_verificacao = intervalo_verificacao
+        self.leituras = 0
+        self._ativos = {}
+        self._verificado_em = {}
+        self._lock = threading.Lock()
+        self._observador = None
+        self._diretorios_observados = set()
+        self._observar = observar and _watchdog_disponivel()
+
+    def obter(self, caminho: str) -> Ativo:
+        """
+        Retorna o arquivo (relativo à pasta dos agentes ou absoluto), lendo-o do disco
+        apenas se ainda não estiver em cache ou se tiver mudado.
+
+        Raises:
+            FileNotFoundError: Se o arquivo não existir.
+        """
+        caminho = os.path.abspath(os.path.join(BASE_DIR, caminho))
+        with self._lock:
+            ativo = self._ativos.get(caminho)
+            if ativo is not None and not self._precisa_verificar(caminho):
+                return ativo
+
+        estado = os.stat(caminho)
+        if ativo is not None and (ativo.mtime_ns, ativo.tamanho) == (estado.st_mtime_ns, estado.st_size):
+            with self._lock:
+                self._verificado_em[caminho] = time.monotonic()
+            return ativo
+
+        with open(caminho, "r", encoding="utf-8") as f:
+            conteudo = f.read()
+        ativo = Ativo(
+            caminho=caminho,
+            conteudo=conteudo,
+            hash=hashlib.sha256(conteudo.encode("utf-8")).hexdigest(),
+            mtime_ns=estado.st_mtime_ns,
+            tamanho=estado.st_size,
+        )
+        with self._lock:
+            self.leituras += 1
+            self._ativos[caminho] = ativo
+            self._verificado_em[caminho] = time.monotonic()
+        self._observar_diretorio(os.path.dirname(caminho))
+        return ativo
+
+    def conteudo(self, caminho: str, mensagem_ausente: str = None) -> str:
+        """Atalho para o conteúdo do arquivo; retorna `mensagem_ausente` se ele não existir."""
+        try:
+            return self.obter(caminho).conteudo
+        except FileNotFoundError:
+            if mensagem_ausente is None:
+                raise
+            return mensagem_ausente
+
+    def hash(self, caminho: str) -> str:
+        """Hash SHA-256 do conteúdo atual do arquivo."""
+        return self.obter(caminho).hash
+
+    def invalidar(self, caminho: str = None):
+        """Descarta um arquivo do cache (ou todos, se `caminho` for None)."""
+        with self._lock:
+            if caminho is None:
+                self._ativos.clear()
+                self._verificado_em.clear()
+            else:
+                caminho = os.path.abspath(os.path.join(BASE_DIR, caminho))
+                self._ativos.pop(caminho, None)
+                self._verificado_em.pop(caminho, None)
+
+    def encerrar(self):
+        if self._observador is not None:
+            self._observador.stop()
+            self._observador = None
+
+    def _precisa_verificar(self, caminho: str) -> bool:
+        # Chamado com o lock adquirido
+        if os.path.dirname(caminho) in self._diretorios_observados:
+            # O observador remove a entrada quando o arquivo muda
+            return False
+        return time.monotonic() - self._verificado_em.get(caminho, 0.0) >= self.intervalo_verificacao
+
+    def _observar_diretorio(self, diretorio: str):
+        if not self._observar:
+            return
+        with self._lock:
+            if diretorio in self._diretorios_observados:
+                return
+            try:
+                from watchdog.observers import Observer
+                from watchdog.events import FileSystemEventHandler
+
+                assets = self
+
+                class _Invalidador(FileSystemEventHandler):
+                    def on_any_event(self, event):
+                        for caminho in (event.src_path, getattr(event, "dest_path", None)):
+                            if caminho:
+                                assets.invalidar(os.path.abspath(caminho))
+
+                if self._observador is None:
+                    self._observador = Observer()
+                    self._observador.daemon = True
+                    self._observador.start()
+                self._observador.schedule(_Invalidador(), diretorio, recursive=False)
+                self._diretorios_observados.add(diretorio)
+            except Exception as e:
+                # Sem observador, a verificação periódica de mtime continua valendo
+                print(f"⚠️ Observador de arquivos indisponível ({e}); usando verificação de mtime.")
+                self._observar = False
+
+
+_assets = None
+_assets_lock = threading.Lock()
+
+
+def get_assets() -> KnowledgeAssets:
+    """Retorna o cache de arquivos de conhecimento compartilhado pelo processo."""
+    global _assets
+    with _assets_lock:
+        if _assets is None:
+            _assets = KnowledgeAssets()
+        return _assets
@@ -0,0 +1,477 @@
+"""
+Backends de LLM intercambiáveis para o `llm_client`.
+
+Todos os agentes chamam o `llm_client`, que cuida do cache de respostas, do
+trace da requisição e do tracing; quem de fato atende cada chamada é o backend
+ativo (`llm_client.backend_atual()`):
+
+- `azure` (padrão): o Azure OpenAI configurado no .env.
+- `openai`: um servidor compatível com a API da OpenAI (vLLM, llama.cpp,
+  Ollama, LM Studio...), em `LLM_BASE_URL`, com o modelo `LLM_MODEL`.
+- `stub`: o `llm_stub.StubLLM`, determinístico e offline.
+- `record`: repassa as chamadas a outro backend (`LLM_RECORD_BACKEND`, padrão
+  `azure`) e grava cada resposta como fixture em `LLM_FIXTURES`.
+- `replay`: serve as fixtures gravadas, sem rede, com a latência gravada ou
+  com a distribuição de `LLM_STUB_LATENCY` (ver `llm_stub.Latencia`).
+
+Com `stub` e `replay`, o tempo de uma requisição é o tempo simulado do LLM mais
+o overhead do próprio pipeline, o que permite medir orquestração e
+concorrência isoladamente, sem custo. Um backend é qualquer objeto com
+`nome`, `complete`, `acomplete`, `stream` e `astream` (e, opcionalmente,
+`embed`/`aembed` com `suporta_embeddings`).
+
+Ao gravar, desabilite o cache de respostas (`RESPONSE_CACHE=0`): acertos no
+cache não chegam ao backend e não viram fixtures.
+"""
+import os
+import json
+import time
+import asyncio
+import weakref
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+import llm_client
+from llm_stub import StubLLM, latencias_por_agente, uso_simulado, resposta_simulada, chunks_simulados, \
+    entregar_chunks, aentregar_chunks
+from response_cache import hash_texto
+from validation_cache import CACHE_DIR
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+BACKEND = os.getenv("LLM_BACKEND", "azure")
+CAMINHO_FIXTURES = os.getenv("LLM_FIXTURES", os.path.join(CACHE_DIR, "llm_fixtures.jsonl"))
+BACKENDS = ("azure", "openai", "stub", "record", "replay")
+
+
+class FixtureAusente(KeyError):
+    """Nenhuma fixture gravada para a chamada (backend `replay` com `ausentes="erro"`)."""
+
+
+class _BackendOpenAI(ABC):
+    """Base dos backends que falam a API de chat completions da OpenAI."""
+
+    modelo = None
+    modelo_embeddings = None
+
+    # O servidor aceita `stream_options` (o consumo de tokens no último chunk)
+    aceita_consumo_no_stream = True
+
+    @property
+    def suporta_embeddings(self) -> bool:
+        return bool(self.modelo_embeddings)
+
+    @abstractmethod
+    def _cliente(self):
+        """O cliente síncrono do SDK da OpenAI."""
+
+    @abstractmethod
+    def _cliente_async(self):
+        """O cliente assíncrono do event loop atual."""
+
+    def complete(self, agent: str, messages: list, temperature: float, **kwargs):
+        return self._cliente().chat.completions.create(
+            model=self.modelo, messages=messages, temperature=temperature, **kwargs
+        )
+
+    async def acomplete(self, agent: str, messages: list, temperature: float, **kwargs):
+        return await self._cliente_async().chat.completions.create(
+            model=self.modelo, messages=messages, temperature=temperature, **kwargs
+        )
+
+    def stream(self, agent: str, messages: list, temperature: float, **kwargs):
+        return self._cliente().chat.completions.create(
+            model=self.modelo, messages=messages, temperature=temperature, **llm_client._opcoes_de_stream(self.aceita_consumo_no_stream), **kwargs
+        )
+
+    async def astream(self, agent: str, messages: list, temperature: float, **kwargs):
+        return await self._cliente_async().chat.completions.create(
+            model=self.modelo, messages=messages, temperature=temperature, **llm_client._opcoes_de_stream(self.aceita_consumo_no_stream), **kwargs
+        )
+
+    def embed(self, texto: str) -> list:
+        return self._cliente().embeddings.create(model=self.modelo_embeddings, input=texto).data[0].embedding
+
+    async def aembed(self, texto: str) -> list:
+        resposta = await self._cliente_async().embeddings.create(model=self.modelo_embeddings, input=texto)
+        return resposta.data[0].embedding
+
+
+class BackendAzure(_BackendOpenAI):
+    """O Azure OpenAI do .env, com os clientes compartilhados do `llm_client`."""
+
+    def __init__(self, deployment: str = None, deployment_embeddings: str = None):
+        self.modelo = deployment or llm_client.deployment_name
+        self.modelo_embeddings = deployment_embeddings or llm_client.embedding_deployment_name
+
+    @property
+    def nome(self) -> str:
+        # O próprio deployment, para manter as entradas já gravadas no cache de respostas
+        return self.modelo
+
+    @property
+    def aceita_consumo_no_stream(self) -> bool:
+        # api-versions anteriores a 2024-09-01-preview (ex: 2023-05-15) rejeitam `stream_options`
+        return llm_client.api_version_aceita_stream_usage(os.getenv("AZURE_OPENAI_API_VERSION"))
+
+    def _cliente(self):
+        return llm_client.get_client()
+
+    def _cliente_async(self):
+        return llm_client.get_async_client()
+
+
+class BackendOpenAICompativel(_BackendOpenAI):
+    """
+    Um servidor compatível com a API da OpenAI (ex: um servidor local).
+
+    Usa o mesmo pool de conexões e a mesma política de repetição do Azure.
+
+    Args:
+        base_url: A URL base da API (ex: http://localhost:8000/v1).
+        modelo: O modelo de chat.
+        api_key: A chave, se o servidor exigir (servidores locais costumam aceitar qualquer valor).
+        modelo_embeddings: O modelo de embeddings, se houver.
+    """
+
+    def __init__(self, base_url: str, modelo: str, api_key: str = None, modelo_embeddings: str = None):
+        self.base_url = base_url
+        self.modelo = modelo
+        self.api_key = api_key or "sem-chave"
+        self.modelo_embeddings = modelo_embeddings
+        self._cliente_sync = None
+        self._clientes_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def nome(self) -> str:
+        return f"openai:{self.modelo}@{self.base_url}"
+
+    def _cliente(self) -> OpenAI:
+        with self._lock:
+            if self._cliente_sync is None:
+                transporte = httpx.HTTPTransport(http2=llm_client._http2_disponivel(), limits=llm_client._limites())
+                self._cliente_sync = OpenAI(
+                    base_url=self.base_url,
+                    api_key=self.api_key,
+                    http_client=httpx.Client(transport=llm_client.RetryTransport(transporte), timeout=llm_client._timeout()),
+                    max_retries=0,
+                )
+            return self._cliente_sync
+
+    def _cliente_async(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            cliente = self._clientes_async.get(loop)
+            if cliente is None:
+                transporte = httpx.AsyncHTTPTransport(http2=llm_client._http2_disponivel(), limits=llm_client._limites())
+                cliente = AsyncOpenAI(
+                    base_url=self.base_url,
+                    api_key=self.api_key,
+                    http_client=httpx.AsyncClient(
+                        transport=llm_client.AsyncRetryTransport(transporte), timeout=llm_client._timeout()
+                    ),
+                    max_retries=0,
+                )
+                self._clientes_async[loop] = cliente
+            return cliente
+
+    async def afechar(self):
+        """Fecha o cliente assíncrono do event loop atual (ver `llm_client.fechar_clientes_async`)."""
+        with self._lock:
+            cliente = self._clientes_async.pop(asyncio.get_running_loop(), None)
+        if cliente is not None:
+            await cliente.close()
+
+
+def chave_de_fixture(agent: str, messages: list) -> str:
+    """Identifica uma chamada pelas mensagens enviadas (a temperatura não entra na chave)."""
+    return hash_texto(json.dumps(
+        [agent, [[m.get("role"), m.get("content")] for m in messages]], ensure_ascii=False
+    ))
+
+
+def _uso_para_dict(usage) -> dict:
+    if usage is None:
+        return None
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": (getattr(detalhes, "cached_tokens", 0) or 0) if detalhes is not None else 0,
+    }
+
+
+class BackendGravador:
+    """
+    Repassa as chamadas a outro backend e grava cada resposta como fixture (JSONL).
+
+    Cada linha tem o agente, a chave da chamada, o conteúdo, o consumo de
+    tokens, a latência e, em streaming, o tempo até o primeiro trecho.
+
+    Args:
+        interno: O backend que atende as chamadas.
+        caminho: O arquivo de fixtures (as linhas são acrescentadas).
+    """
+
+    def __init__(self, interno, caminho: str = None):
+        self.interno = interno
+        self.caminho = caminho or CAMINHO_FIXTURES
+        self.gravadas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nome(self) -> str:
+        return self.interno.nome
+
+    @property
+    def suporta_embeddings(self) -> bool:
+        return getattr(self.interno, "suporta_embeddings", False)
+
+    def embed(self, texto: str) -> list:
+        return self.interno.embed(texto)
+
+    async def aembed(self, texto: str) -> list:
+        return await self.interno.aembed(texto)
+
+    async def afechar(self):
+        afechar = getattr(self.interno, "afechar", None)
+        if afechar is not None:
+            await afechar()
+
+    def _gravar(self, agent: str, messages: list, conteudo: str, usage, inicio: float, primeiro_trecho: float = None):
+        fixture = {
+            "agente": agent,
+            "chave": chave_de_fixture(agent, messages),
+            "conteudo": conteudo,
+            "usage": _uso_para_dict(usage),
+            "latencia_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "primeiro_trecho_ms": round((primeiro_trecho - inicio) * 1000, 1) if primeiro_trecho else None,
+            "gravado_em": datetime.now(timezone.utc).isoformat(),
+        }
+        linha = json.dumps(fixture, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(linha)
+            self.gravadas += 1
+
+    def complete(self, agent: str, messages: list, **kwargs):
+        inicio = time.perf_counter()
+        resposta = self.interno.complete(agent=agent, messages=messages, **kwargs)
+        self._gravar(agent, messages, resposta.choices[0].message.content or "", resposta.usage, inicio)
+        return resposta
+
+    async def acomplete(self, agent: str, messages: list, **kwargs):
+        inicio = time.perf_counter()
+        resposta = await self.interno.acomplete(agent=agent, messages=messages, **kwargs)
+        self._gravar(agent, messages, resposta.choices[0].message.content or "", resposta.usage, inicio)
+        return resposta
+
+    def stream(self, agent: str, messages: list, **kwargs):
+        inicio = time.perf_counter()
+        return self._gravar_stream(self.interno.stream(agent=agent, messages=messages, **kwargs), agent, messages, inicio)
+
+    async def astream(self, agent: str, messages: list, **kwargs):
+        inicio = time.perf_counter()
+        resposta = await self.interno.astream(agent=agent, messages=messages, **kwargs)
+        return self._agravar_stream(resposta, agent, messages, inicio)
+
+    def _gravar_stream(self, resposta, agent: str, messages: list, inicio: float):
+        trechos, usage, primeiro_trecho = [], None, None
+        try:
+            for chunk in resposta:
+                usage = getattr(chunk, "usage", None) or usage
+                texto = llm_client._texto_do_chunk(chunk)
+                if texto:
+                    primeiro_trecho = primeiro_trecho or time.perf_counter()
+                    trechos.append(texto)
+                yield chunk
+        finally:
+            resposta.close()
+        # Apenas respostas recebidas por completo viram fixtures
+        self._gravar(agent, messages, "".join(trechos), usage, inicio, primeiro_trecho)
+
+    async def _agravar_stream(self, resposta, agent: str, messages: list, inicio: float):
+        trechos, usage, primeiro_trecho = [], None, None
+        try:
+            async for chunk in resposta:
+                usage = getattr(chunk, "usage", None) or usage
+                texto = llm_client._texto_do_chunk(chunk)
+                if texto:
+                    primeiro_trecho = primeiro_trecho or time.perf_counter()
+                    trechos.append(texto)
+                yield chunk
+        finally:
+            await (getattr(resposta, "aclose", None) or resposta.close)()
+        self._gravar(agent, messages, "".join(trechos), usage, inicio, primeiro_trecho)
+
+
+class BackendReplay:
+    """
+    Serve as fixtures gravadas pelo `BackendGravador`, sem rede.
+
+    Chamadas com a mesma chave recebem as respostas gravadas em rodízio. A
+    latência de cada chamada é a gravada (multiplicada por `escala`) ou, se
+    `latencia` for informada, uma amostra da distribuição do agente.
+
+    Args:
+        caminho: O arquivo de fixtures.
+        latencia: Distribuição(ões) de latência (ver `llm_stub.latencias_por_agente`);
+            None usa a latência gravada.
+        escala: Fator aplicado à latência gravada (ex: 0 para nenhuma espera).
+        ausentes: "stub" responde às chamadas sem fixture com o `StubLLM`;
+            "erro" levanta `FixtureAusente`.
+        seed: Semente das distribuições de latência.
+    """
+
+    suporta_embeddings = True
+
+    def __init__(self, caminho: str = None, latencia=None, escala: float = 1.0, ausentes: str = "stub", seed: int = None):
+        self.caminho = caminho or CAMINHO_FIXTURES
+        self.latencias = latencias_por_agente(latencia, seed) if latencia is not None else None
+        self.escala = escala
+        self.ausentes = ausentes
+        self.fixtures = carregar_fixtures(self.caminho)
+        self.servidas = 0
+        self.sem_fixture = 0
+        self._proximas = {}
+        self._lock = threading.Lock()
+        self._stub = StubLLM(latencia if latencia is not None else 0.0, seed)
+
+    @property
+    def nome(self) -> str:
+        return f"replay:{os.path.basename(self.caminho)}"
+
+    def embed(self, texto: str) -> list:
+        return self._stub.embed(texto)
+
+    async def aembed(self, texto: str) -> list:
+        return self._stub.embed(texto)
+
+    def _fixture(self, agent: str, messages: list):
+        chave = chave_de_fixture(agent, messages)
+        with self._lock:
+            gravadas = self.fixtures.get(chave)
+            if not gravadas:
+                self.sem_fixture += 1
+                if self.ausentes == "erro":
+                    raise FixtureAusente(f"Nenhuma fixture para o agente '{agent}' (chave {chave[:12]}).")
+                return None
+            indice = self._proximas.get(chave, 0)
+            self._proximas[chave] = indice + 1
+            self.servidas += 1
+            return gravadas[indice % len(gravadas)]
+
+    def _esperas(self, agent: str, fixture: dict) -> tuple:
+        """(espera total, espera até o primeiro trecho) da chamada, em segundos."""
+        if self.latencias is not None:
+            return self.latencias.get(agent, self.latencias["*"]).amostrar(), None
+        primeiro = fixture.get("primeiro_trecho_ms")
+        return (
+            (fixture.get("latencia_ms") or 0) / 1000 * self.escala,
+            primeiro / 1000 * self.escala if primeiro is not None else None,
+        )
+
+    @staticmethod
+    def _uso(fixture: dict):
+        uso = fixture.get("usage")
+        return uso_simulado(uso["prompt_tokens"], uso["completion_tokens"], uso.get("cached_tokens", 0)) if uso else None
+
+    def complete(self, agent: str, messages: list, **kwargs):
+        fixture = self._fixture(agent, messages)
+        if fixture is None:
+            return self._stub.complete(agent, messages, **kwargs)
+        espera, _ = self._esperas(agent, fixture)
+        if espera:
+            time.sleep(espera)
+        return resposta_simulada(fixture["conteudo"], self._uso(fixture))
+
+    async def acomplete(self, agent: str, messages: list, **kwargs):
+        fixture = self._fixture(agent, messages)
+        if fixture is None:
+            return await self._stub.acomplete(agent, messages, **kwargs)
+        espera, _ = self._esperas(agent, fixture)
+        if espera:
+            await asyncio.sleep(espera)
+        return resposta_simulada(fixture["conteudo"], self._uso(fixture))
+
+    def stream(self, agent: str, messages: list, **kwargs):
+        fixture = self._fixture(agent, messages)
+        if fixture is None:
+            return self._stub.stream(agent, messages, **kwargs)
+        return entregar_chunks(chunks_simulados(fixture["conteudo"], self._uso(fixture)), *self._esperas(agent, fixture))
+
+    async def astream(self, agent: str, messages: list, **kwargs):
+        fixture = self._fixture(agent, messages)
+        if fixture is None:
+            return await self._stub.astream(agent, messages, **kwargs)
+        return aentregar_chunks(chunks_simulados(fixture["conteudo"], self._uso(fixture)), *self._esperas(agent, fixture))
+
+    def resumo(self) -> str:
+        return (
+            f"Replay de {self.caminho}: {sum(len(v) for v in self.fixtures.values())} fixture(s), "
+            f"{self.servidas} chamada(s) servidas, {self.sem_fixture} sem fixture."
+        )
+
+
+def carregar_fixtures(caminho: str) -> dict:
+    """Lê um arquivo de fixtures e agrupa as respostas por chave, na ordem em que foram gravadas."""
+    fixtures = {}
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    fixture = json.loads(linha)
+                except json.JSONDecodeError:
+                    # Linha truncada por uma interrupção no meio da gravação
+                    continue
+                fixtures.setdefault(fixture["chave"], []).append(fixture)
+    except FileNotFoundError:
+        print(f"⚠️ Arquivo de fixtures não encontrado: {caminho}. As chamadas serão atendidas pelo stub.")
+    return fixtures
+
+
+def criar_backend(nome: str = None):
+    """
+    Cria o backend pelo nome (padrão: `LLM_BACKEND`), configurado pelo .env.
+
+    Variáveis usadas: `LLM_BASE_URL`, `LLM_MODEL`, `LLM_API_KEY` e
+    `LLM_EMBEDDING_MODEL` (openai); `LLM_STUB_LATENCY` e `LLM_STUB_SEED` (stub e
+    replay); `LLM_FIXTURES`, `LLM_RECORD_BACKEND`, `LLM_REPLAY_SCALE` e
+    `LLM_REPLAY_MISSING` (record e replay).
+    """
+    nome = (nome or BACKEND).strip().lower()
+    latencia = os.getenv("LLM_STUB_LATENCY") or None
+    seed = int(os.getenv("LLM_STUB_SEED")) if os.getenv("LLM_STUB_SEED") else None
+    if nome == "azure":
+        return BackendAzure()
+    if nome == "openai":
+        base_url = os.getenv("LLM_BASE_URL")
+        if not base_url:
+            raise ValueError("LLM_BACKEND=openai exige LLM_BASE_URL (ex: http://localhost:8000/v1).")
+        return BackendOpenAICompativel(
+            base_url, os.getenv("LLM_MODEL", "default"), os.getenv("LLM_API_KEY"), os.getenv("LLM_EMBEDDING_MODEL")
+        )
+    if nome == "stub":
+        return StubLLM(latencia or 0.0, seed)
+    if nome == "record":
+        interno = os.getenv("LLM_RECORD_BACKEND", "azure")
+        if interno in ("record", "replay"):
+            raise ValueError(f"LLM_RECORD_BACKEND não pode ser '{interno}'.")
+        return BackendGravador(criar_backend(interno))
+    if nome == "replay":
+        return BackendReplay(
+            latencia=latencia,
+            escala=float(os.getenv("LLM_REPLAY_SCALE", "1.0")),
+            ausentes=os.getenv("LLM_REPLAY_MISSING", "stub"),
+            seed=seed,
+        )
+    raise ValueError(f"Backend de LLM desconhecido: '{nome}'. Use {', '.join(BACKENDS)}.")
@@ -0,0 +1,634 @@
+"""
+Cliente de LLM compartilhado por todos os agentes.
+
+As chamadas são atendidas pelo backend ativo (ver `llm_backends`): o Azure
+OpenAI por padrão, um servidor compatível com a API da OpenAI, o stub
+determinístico ou o replay de fixtures gravadas, escolhido por `LLM_BACKEND`
+ou por `usar_backend`.
+
+Mantém um único pool de conexões HTTP (httpx) com keep-alive e HTTP/2 quando
+o pacote `h2` está instalado, evitando um handshake TLS por agente. As
+requisições que recebem 429 ou 5xx são repetidas com backoff exponencial,
+respeitando o cabeçalho `Retry-After` enviado pelo serviço.
+
+As versões assíncronas (`acreate_chat_completion`) usam um cliente
+`AsyncAzureOpenAI` por event loop, com a mesma política de repetição.
+`stream_chat_completion` e `astream_chat_completion` entregam a resposta em
+trechos, à medida que o modelo gera os tokens.
+
+O consumo de tokens de cada chamada (incluindo os tokens de prompt atendidos
+pelo cache de prefixo do provedor) é acumulado por agente em `uso_de_tokens()`.
+
+Chamadas com temperatura baixa passam pelo cache de respostas
+(`response_cache`); um acerto devolve a resposta armazenada sem chamar a API.
+Só usam o cache as chamadas que informam `validar_resposta`: uma resposta é
+armazenada apenas se terminou normalmente (`finish_reason == "stop"`) e se o
+agente conseguiu interpretá-la.
+
+Dentro de uma requisição do pipeline, cada chamada também é registrada no
+trace da requisição (`request_trace`), com tokens, latência e repetições, e,
+com o tracing habilitado, como um span "llm.chat" (ver `tracing`).
+"""
+import os
+import time
+import random
+import asyncio
+import weakref
+import threading
+from types import SimpleNamespace
+from email.utils import parsedate_to_datetime
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from dotenv import load_dotenv
+import response_cache
+from response_cache import get_response_cache, hash_texto
+from request_trace import contar_repeticoes, registrar_repeticao, registrar_chamada
+import tracing
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+embedding_deployment_name = os.getenv('AZURE_OPENAI_EMBEDDING_DEPLOYMENT')
+
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# Nível semântico do cache de respostas (exige um deployment de embeddings)
+CACHE_SEMANTICO = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+# Pede o consumo de tokens no último chunk das respostas em streaming: "auto" só quando a
+# api-version aceita `stream_options` (2024-09-01-preview ou superior), "1" sempre, "0" nunca
+STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "auto")
+API_VERSION_STREAM_USAGE = "2024-09-01"
+# Sem o chunk de consumo, os tokens são estimados a partir do texto
+CARACTERES_POR_TOKEN = 4
+
+
+def _http2_disponivel() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _limites() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "120")), connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")))
+
+
+def tempo_de_espera(tentativa: int, resposta: httpx.Response = None) -> float:
+    """
+    Calcula quanto esperar antes da próxima tentativa.
+
+    Usa `retry-after-ms` ou `Retry-After` (segundos ou data HTTP) quando presentes;
+    caso contrário, backoff exponencial com jitter.
+    """
+    if resposta is not None:
+        valor_ms = resposta.headers.get("retry-after-ms")
+        if valor_ms:
+            try:
+                return min(float(valor_ms) / 1000, BACKOFF_MAX)
+            except ValueError:
+                pass
+        valor = resposta.headers.get("retry-after")
+        if valor:
+            try:
+                return min(float(valor), BACKOFF_MAX)
+            except ValueError:
+                try:
+                    return min(max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0), BACKOFF_MAX)
+                except (TypeError, ValueError):
+                    pass
+    espera = min(BACKOFF_BASE * (2 ** tentativa), BACKOFF_MAX)
+    return espera * (0.5 + random.random() / 2)
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Transporte httpx que repete requisições com falhas transitórias (429, 5xx, falha de conexão)."""
+
+    def __init__(self, transport: httpx.BaseTransport, max_retries: int = MAX_RETRIES):
+        self._transport = transport
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for tentativa in range(self.max_retries + 1):
+            ultima = tentativa == self.max_retries
+            try:
+                resposta = self._transport.handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if ultima:
+                    raise
+                registrar_repeticao()
+                time.sleep(tempo_de_espera(tentativa))
+                continue
+
+            if resposta.status_code not in STATUS_RETENTAVEIS or ultima:
+                return resposta
+            espera = tempo_de_espera(tentativa, resposta)
+            resposta.close()
+            registrar_repeticao()
+            time.sleep(espera)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Equivalente assíncrono do `RetryTransport`."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_retries: int = MAX_RETRIES):
+        self._transport = transport
+        self.max_retries = max_retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for tentativa in range(self.max_retries + 1):
+            ultima = tentativa == self.max_retries
+            try:
+                resposta = await self._transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if ultima:
+                    raise
+                registrar_repeticao()
+                await asyncio.sleep(tempo_de_espera(tentativa))
+                continue
+
+            if resposta.status_code not in STATUS_RETENTAVEIS or ultima:
+                return resposta
+            espera = tempo_de_espera(tentativa, resposta)
+            await resposta.aclose()
+            registrar_repeticao()
+            await asyncio.sleep(espera)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+_http_client = None
+_client = None
+_lock = threading.Lock()
+# Conexões assíncronas pertencem ao event loop que as criou, então há um cliente por loop
+_async_clients = weakref.WeakKeyDictionary()
+# Backend que atende as chamadas (ver `backend_atual`), criado na primeira chamada
+_backend = None
+# Consumo acumulado de tokens por agente (ver `uso_de_tokens`)
+_uso = {}
+_uso_lock = threading.Lock()
+
+
+def registrar_uso(agent: str, usage):
+    """Acumula o `usage` de uma resposta nas estatísticas do agente."""
+    if usage is None:
+        return
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    em_cache = (getattr(detalhes, "cached_tokens", 0) or 0) if detalhes is not None else 0
+    with _uso_lock:
+        total = _uso.setdefault(agent or "desconhecido", {
+            "chamadas": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+        })
+        total["chamadas"] += 1
+        total["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        total["cached_tokens"] += em_cache
+        total["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+
+def uso_de_tokens() -> dict:
+    """Retorna uma cópia do consumo acumulado de tokens, por agente."""
+    with _uso_lock:
+        return {agente: dict(valores) for agente, valores in _uso.items()}
+
+
+def zerar_uso():
+    with _uso_lock:
+        _uso.clear()
+
+
+def resumo_de_uso() -> str:
+    """Resumo de uma linha do consumo acumulado, com a fração de tokens de prompt vinda do cache."""
+    uso = uso_de_tokens()
+    prompt = sum(v["prompt_tokens"] for v in uso.values())
+    em_cache = sum(v["cached_tokens"] for v in uso.values())
+    resposta = sum(v["completion_tokens"] for v in uso.values())
+    percentual = 100 * em_cache / prompt if prompt else 0.0
+    return f"Tokens de prompt: {prompt} ({em_cache} em cache, {percentual:.1f}%); tokens gerados: {resposta}."
+
+
+def usar_backend(backend):
+    """
+    Direciona todas as chamadas para um backend (ex: `llm_stub.StubLLM`,
+    `llm_backends.BackendReplay`), ou de volta ao backend configurado em
+    `LLM_BACKEND` quando `backend` é None.
+    """
+    global _backend
+    with _lock:
+        _backend = backend
+
+
+# Nome anterior, mantido para os scripts que já o usam
+usar_stub = usar_backend
+
+
+def backend_atual():
+    """Retorna o backend ativo, criado a partir de `LLM_BACKEND` na primeira chamada."""
+    global _backend
+    with _lock:
+        if _backend is None:
+            # Importado aqui porque `llm_backends` depende deste módulo
+            from llm_backends import criar_backend
+            _backend = criar_backend()
+        return _backend
+
+
+def get_http_client() -> httpx.Client:
+    """Retorna o cliente httpx compartilhado (pool de conexões com keep-alive)."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            http2 = _http2_disponivel()
+            transporte = httpx.HTTPTransport(http2=http2, limits=_limites())
+            _http_client = httpx.Client(transport=RetryTransport(transporte), timeout=_timeout())
+        return _http_client
+
+
+def get_client() -> AzureOpenAI:
+    """Retorna o cliente Azure OpenAI compartilhado, criado na primeira chamada."""
+    global _client
+    http_client = get_http_client()
+    with _lock:
+        if _client is None:
+            _client = AzureOpenAI(
+                **_credenciais(),
+                http_client=http_client,
+                # As repetições ficam a cargo do RetryTransport
+                max_retries=0,
+            )
+        return _client
+
+
+def _credenciais() -> dict:
+    return {
+        "api_key": os.getenv("AZURE_OPENAI_KEY") or os.getenv("AZURE_OPENAI_API_KEY"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION"),
+        "azure_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
+    }
+
+
+def get_async_client() -> AsyncAzureOpenAI:
+    """Retorna o cliente assíncrono do event loop atual, criado na primeira chamada."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            http2 = _http2_disponivel()
+            transporte = httpx.AsyncHTTPTransport(http2=http2, limits=_limites())
+            client = AsyncAzureOpenAI(
+                **_credenciais(),
+                http_client=httpx.AsyncClient(transport=AsyncRetryTransport(transporte), timeout=_timeout()),
+                max_retries=0,
+            )
+            _async_clients[loop] = client
+        return client
+
+
+async def fechar_clientes_async():
+    """
+    Fecha os clientes assíncronos do event loop atual e os pools httpx deles.
+
+    Um loop criado por requisição (ex: `asyncio.run` a cada clique no Streamlit)
+    deve chamar esta função antes de terminar; senão as conexões ficam abertas
+    no loop encerrado. `executar` já faz isso.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.pop(loop, None)
+        backend = _backend
+    if client is not None:
+        await client.close()
+    afechar = getattr(backend, "afechar", None)
+    if afechar is not None:
+        await afechar()
+
+
+def executar(corrotina):
+    """Executa `corrotina` em um novo event loop (como `asyncio.run`) e fecha os clientes criados para ele."""
+    async def _executar():
+        try:
+            return await corrotina
+        finally:
+            await fechar_clientes_async()
+    return asyncio.run(_executar())
+
+
+def criar_embedding(texto: str) -> list:
+    """Gera o embedding de um texto no modelo de embeddings do backend ativo."""
+    return backend_atual().embed(texto)
+
+
+async def acriar_embedding(texto: str) -> list:
+    """Versão assíncrona de `criar_embedding`."""
+    return await backend_atual().aembed(texto)
+
+
+def _embeddings_disponiveis() -> bool:
+    return bool(getattr(backend_atual(), "suporta_embeddings", False))
+
+
+def _deployment() -> str:
+    """O deployment (ou o backend) que atende as chamadas."""
+    return backend_atual().nome
+
+
+def _registrar_chamada(agent: str, inicio: float, usage=None, repeticoes: int = 0, **detalhes):
+    """Registra a chamada no trace da requisição e, com o tracing habilitado, como um span."""
+    deployment = _deployment()
+    registrar_chamada(agent, deployment, inicio, usage, repeticoes, **detalhes)
+    if tracing.HABILITADO:
+        tracing.registrar_span_concluido(
+            "llm.chat",
+            inicio,
+            agente=agent,
+            **{
+                "gen_ai.request.model": deployment,
+                "gen_ai.usage.input_tokens": getattr(usage, "prompt_tokens", None),
+                "gen_ai.usage.output_tokens": getattr(usage, "completion_tokens", None),
+            },
+            repeticoes=repeticoes,
+            cache=detalhes.get("cache"),
+            streaming=detalhes.get("streaming", False),
+            erro=detalhes.get("erro"),
+        )
+
+
+def _consulta_de_cache(messages: list, temperature: float, agent: str, kwargs: dict, validar=None):
+    """Retorna (escopo, entrada) se a chamada pode usar o cache de respostas, ou None."""
+    if validar is None or not response_cache.HABILITADO or temperature > response_cache.TEMPERATURA_MAXIMA:
+        return None
+    # O hash das mensagens anteriores à do usuário identifica o template já com o conteúdo dos manuais
+    template_hash = hash_texto("\0".join(m["content"] for m in messages[:-1]))
+    escopo = get_response_cache().escopo(agent, template_hash, _deployment(), {"temperature": temperature, **kwargs})
+    return escopo, messages[-1]["content"]
+
+
+def _resposta_do_cache(conteudo: str, nivel: str) -> SimpleNamespace:
+    # Mesmo formato usado pelos agentes; `usage` None, pois nenhum token foi consumido
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=conteudo), finish_reason="stop")],
+        usage=None,
+        cache=nivel,
+    )
+
+
+def _armazenavel(conteudo: str, finish_reason: str, validar) -> bool:
+    """Só respostas completas que o agente consegue interpretar vão para o cache."""
+    if finish_reason != "stop" or not conteudo:
+        return False
+    try:
+        return bool(validar(conteudo))
+    except Exception:
+        return False
+
+
+def _armazenar_no_cache(agent: str, consulta: tuple, response, validar, embedding: list = None):
+    escolha = response.choices[0]
+    if _armazenavel(escolha.message.content, getattr(escolha, "finish_reason", None), validar):
+        get_response_cache().armazenar(agent, *consulta, escolha.message.content, embedding)
+
+
+def _erro_de_embedding(e: Exception):
+    # Sem embedding, a chamada segue apenas com o nível exato do cache
+    print(f"⚠️ Falha ao gerar embedding para o cache semântico: {e}")
+
+
+def create_chat_completion(messages: list, temperature: float, agent: str = None, **kwargs):
+    """
+    Executa uma chamada de chat completion no deployment configurado.
+
+    Args:
+        messages: As mensagens da conversa (system/user).
+        temperature: A temperatura de amostragem.
+        agent: O nome do agente que faz a chamada (ex: "analista").
+        cache_semantico: Permite reaproveitar a resposta de uma entrada semelhante
+            (nível semântico do cache de respostas, se habilitado).
+        validar_resposta: Função que recebe o conteúdo da resposta e retorna True se
+            o agente consegue interpretá-lo; sem ela, a chamada não usa o cache.
+        **kwargs: Parâmetros adicionais repassados à API (ex: response_format).
+
+    Returns:
+        A resposta da API no formato do SDK da OpenAI.
+    """
+    inicio = time.perf_counter()
+    cache_semantico = kwargs.pop("cache_semantico", False)
+    validar = kwargs.pop("validar_resposta", None)
+    consulta = _consulta_de_cache(messages, temperature, agent, kwargs, validar)
+    embedding = None
+    if consulta is not None:
+        if cache_semantico and CACHE_SEMANTICO and _embeddings_disponiveis():
+            try:
+                embedding = criar_embedding(consulta[1])
+            except Exception as e:
+                _erro_de_embedding(e)
+        encontrado = get_response_cache().obter(*consulta, embedding)
+        if encontrado is not None:
+            _registrar_chamada(agent, inicio, cache=encontrado[1])
+            return _resposta_do_cache(*encontrado)
+
+    with contar_repeticoes() as repeticoes:
+        try:
+            response = backend_atual().complete(agent=agent, messages=messages, temperature=temperature, **kwargs)
+        except Exception as e:
+            _registrar_chamada(agent, inicio, repeticoes=repeticoes[0], erro=str(e))
+            raise
+    registrar_uso(agent, getattr(response, "usage", None))
+    _registrar_chamada(agent, inicio, getattr(response, "usage", None), repeticoes[0])
+    if consulta is not None:
+        _armazenar_no_cache(agent, consulta, response, validar, embedding)
+    return response
+
+
+async def acreate_chat_completion(messages: list, temperature: float, agent: str = None, **kwargs):
+    """Versão assíncrona de `create_chat_completion`."""
+    inicio = time.perf_counter()
+    cache_semantico = kwargs.pop("cache_semantico", False)
+    validar = kwargs.pop("validar_resposta", None)
+    consulta = _consulta_de_cache(messages, temperature, agent, kwargs, validar)
+    embedding = None
+    if consulta is not None:
+        if cache_semantico and CACHE_SEMANTICO and _embeddings_disponiveis():
+            try:
+                embedding = await acriar_embedding(consulta[1])
+            except Exception as e:
+                _erro_de_embedding(e)
+        # Com embedding, a busca semântica percorre as entradas do escopo; fora do event loop
+        encontrado = await asyncio.to_thread(get_response_cache().obter, *consulta, embedding)
+        if encontrado is not None:
+            _registrar_chamada(agent, inicio, cache=encontrado[1])
+            return _resposta_do_cache(*encontrado)
+
+    with contar_repeticoes() as repeticoes:
+        try:
+            response = await backend_atual().acomplete(agent=agent, messages=messages, temperature=temperature, **kwargs)
+        except (Exception, asyncio.CancelledError) as e:
+            # Inclui o cancelamento da tarefa (ex: candidatos descartados)
+            _registrar_chamada(agent, inicio, repeticoes=repeticoes[0], erro=str(e) or type(e).__name__)
+            raise
+    registrar_uso(agent, getattr(response, "usage", None))
+    _registrar_chamada(agent, inicio, getattr(response, "usage", None), repeticoes[0])
+    if consulta is not None:
+        _armazenar_no_cache(agent, consulta, response, validar, embedding)
+    return response
+
+
+def api_version_aceita_stream_usage(api_version: str) -> bool:
+    """Indica se a api-version do Azure aceita `stream_options` (versões são datas, comparáveis como texto)."""
+    return (api_version or "")[:10] >= API_VERSION_STREAM_USAGE
+
+
+def _opcoes_de_stream(aceita_consumo: bool = True) -> dict:
+    """
+    Parâmetros de uma chamada em streaming.
+
+    Args:
+        aceita_consumo: Se o servidor aceita `stream_options` (usado com LLM_STREAM_USAGE=auto).
+    """
+    if STREAM_USAGE == "1" or (STREAM_USAGE == "auto" and aceita_consumo):
+        return {"stream": True, "stream_options": {"include_usage": True}}
+    return {"stream": True}
+
+
+def _uso_estimado(messages: list, texto: str) -> SimpleNamespace:
+    """Consumo aproximado de um stream que não trouxe o chunk de `usage`."""
+    prompt = sum(len(m.get("content") or "") for m in messages)
+    return SimpleNamespace(
+        prompt_tokens=-(-prompt // CARACTERES_POR_TOKEN),
+        completion_tokens=-(-len(texto) // CARACTERES_POR_TOKEN),
+        prompt_tokens_details=None,
+        estimado=True,
+    )
+
+
+def _texto_do_chunk(chunk) -> str:
+    # O Azure envia chunks sem `choices` (ex: resultados do filtro de conteúdo)
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def _finish_reason_do_chunk(chunk) -> str:
+    # Chega no último chunk com `choices`; "length" indica uma resposta truncada
+    if not chunk.choices:
+        return None
+    return getattr(chunk.choices[0], "finish_reason", None)
+
+
+def stream_chat_completion(messages: list, temperature: float, agent: str = None, **kwargs):
+    """
+    Versão em streaming de `create_chat_completion`.
+
+    Gera os trechos de texto da resposta à medida que chegam. Encerrar o gerador
+    antes do fim (`close()` ou `break`) fecha a conexão e interrompe a geração.
+    Um acerto no cache de respostas é entregue de uma vez, em um único trecho;
+    apenas respostas recebidas por completo (`finish_reason == "stop"`) e aceitas
+    por `validar_resposta` são armazenadas.
+    """
+    inicio = time.perf_counter()
+    validar = kwargs.pop("validar_resposta", None)
+    consulta = _consulta_de_cache(messages, temperature, agent, kwargs, validar)
+    if consulta is not None:
+        encontrado = get_response_cache().obter(*consulta)
+        if encontrado is not None:
+            _registrar_chamada(agent, inicio, cache=encontrado[1], streaming=True)
+            yield encontrado[0]
+            return
+
+    with contar_repeticoes() as repeticoes:
+        try:
+            resposta = backend_atual().stream(agent=agent, messages=messages, temperature=temperature, **kwargs)
+        except Exception as e:
+            _registrar_chamada(agent, inicio, repeticoes=repeticoes[0], streaming=True, erro=str(e))
+            raise
+    trechos, usage, primeiro_trecho, erro, finish_reason = [], None, None, "interrompida", None
+    try:
+        for chunk in resposta:
+            # O consumo de tokens chega em um chunk final, sem texto
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+                registrar_uso(agent, usage)
+            finish_reason = _finish_reason_do_chunk(chunk) or finish_reason
+            texto = _texto_do_chunk(chunk)
+            if texto:
+                primeiro_trecho = primeiro_trecho or time.perf_counter()
+                trechos.append(texto)
+                yield texto
+        erro = None
+        if usage is None:
+            usage = _uso_estimado(messages, "".join(trechos))
+            registrar_uso(agent, usage)
+    except Exception as e:
+        erro = str(e)
+        raise
+    finally:
+        resposta.close()
+        _registrar_chamada(agent, inicio, usage, repeticoes[0], streaming=True,
+                           primeiro_trecho=primeiro_trecho, erro=erro)
+    if consulta is not None and _armazenavel("".join(trechos), finish_reason, validar):
+        get_response_cache().armazenar(agent, *consulta, "".join(trechos))
+
+
+async def astream_chat_completion(messages: list, temperature: float, agent: str = None, **kwargs):
+    """Versão assíncrona de `stream_chat_completion`."""
+    inicio = time.perf_counter()
+    validar = kwargs.pop("validar_resposta", None)
+    consulta = _consulta_de_cache(messages, temperature, agent, kwargs, validar)
+    if consulta is not None:
+        encontrado = await asyncio.to_thread(get_response_cache().obter, *consulta)
+        if encontrado is not None:
+            _registrar_chamada(agent, inicio, cache=encontrado[1], streaming=True)
+            yield encontrado[0]
+            return
+
+    with contar_repeticoes() as repeticoes:
+        try:
+            resposta = await backend_atual().astream(agent=agent, messages=messages, temperature=temperature, **kwargs)
+            # Geradores assíncronos fecham com `aclose`; o AsyncStream do SDK, com `close`
+            fechar = getattr(resposta, "aclose", None) or resposta.close
+        except (Exception, asyncio.CancelledError) as e:
+            _registrar_chamada(agent, inicio, repeticoes=repeticoes[0], streaming=True,
+                               erro=str(e) or type(e).__name__)
+            raise
+    trechos, usage, primeiro_trecho, erro, finish_reason = [], None, None, "interrompida", None
+    try:
+        async for chunk in resposta:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+                registrar_uso(agent, usage)
+            finish_reason = _finish_reason_do_chunk(chunk) or finish_reason
+            texto = _texto_do_chunk(chunk)
+            if texto:
+                primeiro_trecho = primeiro_trecho or time.perf_counter()
+                trechos.append(texto)
+                yield texto
+        erro = None
+        if usage is None:
+            usage = _uso_estimado(messages, "".join(trechos))
+            registrar_uso(agent, usage)
+    except Exception as e:
+        erro = str(e)
+        raise
+    finally:
+        await fechar()
+        _registrar_chamada(agent, inicio, usage, repeticoes[0], streaming=True,
+                           primeiro_trecho=primeiro_trecho, erro=erro)
+    if consulta is not None and _armazenavel("".join(trechos), finish_reason, validar):
+        get_response_cache().armazenar(agent, *consulta, "".join(trechos))
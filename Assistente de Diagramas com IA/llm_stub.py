@@ -0,0 +1,292 @@
+"""
+LLM determinístico para execução offline (testes, lotes de exemplo).
+
+Responde a cada agente com saídas plausíveis derivadas da própria entrada,
+sem acesso à rede: o analista gera um plano linear a partir das frases do
+prompt, o crítico aprova, o desenhista converte o plano em Mermaid e o
+corretor devolve o código recebido.
+
+O consumo de tokens é estimado (4 caracteres por token) e imita o cache de
+prefixo do provedor: uma mensagem de sistema já vista conta como tokens em cache.
+
+A latência simulada segue uma distribuição (`Latencia`), global ou por agente,
+para medir o overhead e a concorrência do próprio pipeline sem rede.
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import asyncio
+from types import SimpleNamespace
+
+
+class Latencia:
+    """
+    Distribuição de latência simulada, em segundos.
+
+    Tipos e parâmetros:
+        constante:segundos
+        uniforme:minimo,maximo
+        normal:media,desvio        (truncada em zero)
+        lognormal:mediana,sigma    (cauda longa, como a de um LLM real)
+        exponencial:media
+
+    Args:
+        tipo: Um dos tipos acima.
+        parametros: Os parâmetros do tipo, na ordem acima.
+        seed: Semente do gerador, para sequências reproduzíveis.
+    """
+
+    TIPOS = {"constante": 1, "uniforme": 2, "normal": 2, "lognormal": 2, "exponencial": 1}
+
+    def __init__(self, tipo: str = "constante", parametros: tuple = (0.0,), seed: int = None):
+        if tipo not in self.TIPOS:
+            raise ValueError(f"Distribuição de latência desconhecida: '{tipo}'. Use {', '.join(self.TIPOS)}.")
+        if len(parametros) != self.TIPOS[tipo]:
+            raise ValueError(f"A distribuição '{tipo}' recebe {self.TIPOS[tipo]} parâmetro(s), não {len(parametros)}.")
+        self.tipo = tipo
+        self.parametros = tuple(float(p) for p in parametros)
+        self._aleatorio = random.Random(seed)
+
+    @classmethod
+    def de(cls, valor, seed: int = None) -> "Latencia":
+        """Cria a distribuição a partir de um número (constante), de um texto "tipo:p1,p2" ou de uma `Latencia`."""
+        if isinstance(valor, Latencia):
+            return valor
+        if valor is None or valor == "":
+            return cls(seed=seed)
+        if isinstance(valor, (int, float)):
+            return cls("constante", (valor,), seed)
+        tipo, _, parametros = str(valor).strip().partition(":")
+        if not parametros:
+            return cls("constante", (float(tipo),), seed)
+        return cls(tipo.strip().lower(), tuple(p for p in parametros.split(",") if p.strip()), seed)
+
+    def amostrar(self) -> float:
+        a = self.parametros
+        if self.tipo == "constante":
+            return a[0]
+        if self.tipo == "uniforme":
+            return self._aleatorio.uniform(a[0], a[1])
+        if self.tipo == "normal":
+            return max(self._aleatorio.gauss(a[0], a[1]), 0.0)
+        if self.tipo == "lognormal":
+            return self._aleatorio.lognormvariate(math.log(a[0]), a[1]) if a[0] > 0 else 0.0
+        return self._aleatorio.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+
+    def __repr__(self):
+        return f"{self.tipo}:{','.join(f'{p:g}' for p in self.parametros)}"
+
+
+def latencias_por_agente(valor, seed: int = None) -> dict:
+    """
+    Interpreta a latência de cada agente.
+
+    Aceita uma única distribuição (para todos os agentes), um dicionário
+    {agente: distribuição} ou um texto como "analista=lognormal:2,0.4;critico=0.5;*=0.2",
+    em que "*" vale para os agentes não listados.
+
+    Returns:
+        Um dicionário {agente ou "*": Latencia}.
+    """
+    if isinstance(valor, dict):
+        itens = valor.items()
+    elif isinstance(valor, str) and "=" in valor:
+        itens = [parte.split("=", 1) for parte in valor.split(";") if parte.strip()]
+    else:
+        return {"*": Latencia.de(valor, seed)}
+    latencias = {
+        agente.strip(): Latencia.de(distribuicao, None if seed is None else seed + i)
+        for i, (agente, distribuicao) in enumerate(itens)
+    }
+    latencias.setdefault("*", Latencia(seed=seed))
+    return latencias
+
+
+def _uso(conteudo: str, mensagens: list, tokens_em_cache: int) -> SimpleNamespace:
+    tokens_prompt = sum(len(m.get("content", "")) for m in mensagens) // 4
+    return uso_simulado(tokens_prompt, len(conteudo) // 4, tokens_em_cache)
+
+
+def uso_simulado(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> SimpleNamespace:
+    """Objeto `usage` no formato do SDK da OpenAI."""
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+    )
+
+
+def resposta_simulada(conteudo: str, uso: SimpleNamespace) -> SimpleNamespace:
+    """Resposta de chat completion no formato do SDK da OpenAI."""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=conteudo), finish_reason="stop")],
+        usage=uso,
+    )
+
+
+def chunks_simulados(conteudo: str, uso: SimpleNamespace) -> list:
+    # Mesmo formato dos chunks da API: texto em `delta`, o `finish_reason` em um chunk sem
+    # texto e o consumo em um chunk final sem `choices`
+    chunks = [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=trecho), finish_reason=None)], usage=None)
+        for trecho in _em_trechos(conteudo)
+    ]
+    chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")], usage=None))
+    chunks.append(SimpleNamespace(choices=[], usage=uso))
+    return chunks
+
+
+def _plano_a_partir_do_prompt(prompt: str) -> dict:
+    frases = [f.strip() for f in re.split(r"[.;\n]+", prompt) if f.strip()][:8]
+    passos = [{"id": "A", "tipo": "inicio", "texto": "Início"}]
+    for i, frase in enumerate(frases):
+        passos.append({"id": f"P{i + 1}", "tipo": "processo", "texto": frase[:60]})
+    passos.append({"id": "Z", "tipo": "fim", "texto": "Fim"})
+    conexoes = [
+        {"de": origem["id"], "para": destino["id"], "label": ""}
+        for origem, destino in zip(passos, passos[1:])
+    ]
+    return {"orientacao": "TD", "estilo_preferencial": "cantos arredondados", "passos": passos, "conexoes": conexoes}
+
+
+def _mermaid_a_partir_do_plano(plano: dict) -> str:
+    formas = {"inicio": ('(["', '"])'), "fim": ('(["', '"])'), "decisao": ('{"', '"}'), "dados": ('["', '"]')}
+    linhas = [f"graph {plano.get('orientacao', 'TD')}"]
+    for passo in plano.get("passos", []):
+        abre, fecha = formas.get(passo.get("tipo"), ('("', '")'))
+        texto = str(passo.get("texto", "")).replace('"', "'")
+        linhas.append(f"    {passo['id']}{abre}{texto}{fecha}")
+    for conexao in plano.get("conexoes", []):
+        rotulo = f"|{conexao['label']}|" if conexao.get("label") else ""
+        linhas.append(f"    {conexao['de']} -->{rotulo} {conexao['para']}")
+    return "\n".join(linhas)
+
+
+class StubLLM:
+    """
+    Substituto determinístico do Azure OpenAI (backend "stub", ver `llm_backends`).
+
+    Args:
+        latencia: Espera simulada por chamada: segundos, uma distribuição
+            ("lognormal:1.5,0.5") ou uma por agente (ver `latencias_por_agente`).
+        seed: Semente das distribuições de latência.
+    """
+
+    nome = "stub:StubLLM"
+    suporta_embeddings = True
+
+    def __init__(self, latencia=0.0, seed: int = None):
+        self.latencias = latencias_por_agente(latencia, seed)
+        self.chamadas = 0
+        self._prefixos_vistos = set()
+
+    def _espera(self, agent: str) -> float:
+        return self.latencias.get(agent, self.latencias["*"]).amostrar()
+
+    def _tokens_em_cache(self, mensagens: list) -> int:
+        sistema = next((m["content"] for m in mensagens if m.get("role") == "system"), "")
+        if sistema in self._prefixos_vistos:
+            return len(sistema) // 4
+        self._prefixos_vistos.add(sistema)
+        return 0
+
+    def _responder(self, agent: str, mensagens: list) -> tuple:
+        conteudo = self._conteudo(agent, mensagens)
+        return conteudo, _uso(conteudo, mensagens, self._tokens_em_cache(mensagens))
+
+    def _conteudo(self, agent: str, mensagens: list) -> str:
+        entrada = mensagens[-1]["content"]
+        if agent == "analista":
+            if "--PLANO ANTERIOR PARA REFINAR--" in entrada:
+                anterior = entrada.split("--PLANO ANTERIOR PARA REFINAR--")[1].split("--CRÍTICAS A SEREM APLICADAS--")[0]
+                return anterior.strip()
+            return json.dumps(_plano_a_partir_do_prompt(entrada), ensure_ascii=False)
+        if agent == "critico":
+            return json.dumps({"status": "Aprovado", "criticas": []})
+        if agent == "desenhista":
+            return f"```mermaid\n{_mermaid_a_partir_do_plano(json.loads(entrada))}\n```"
+        if agent == "gerador":
+            return f"```mermaid\n{_mermaid_a_partir_do_plano(_plano_a_partir_do_prompt(entrada))}\n```"
+        if agent == "corretor":
+            codigo = entrada.split("--CÓDIGO MERMAID--\n", 1)[-1]
+            if "--PLANO DE DESIGN" in codigo:
+                # Código interrompido no streaming: redesenha a partir do plano enviado junto
+                plano = json.loads(codigo.split("--PLANO DE DESIGN", 1)[1].split("\n", 1)[1])
+                return f"```mermaid\n{_mermaid_a_partir_do_plano(plano)}\n```"
+            # Devolve o código recebido sem alterações
+            return codigo
+        return entrada
+
+    def embed(self, texto: str, dimensoes: int = 256) -> list:
+        """Embedding de saco de palavras com hashing: textos com as mesmas palavras ficam próximos."""
+        vetor = [0.0] * dimensoes
+        for palavra in re.findall(r"\w+", texto.lower()):
+            vetor[int(hashlib.md5(palavra.encode("utf-8")).hexdigest(), 16) % dimensoes] += 1.0
+        return vetor
+
+    async def aembed(self, texto: str, dimensoes: int = 256) -> list:
+        return self.embed(texto, dimensoes)
+
+    def complete(self, agent: str, messages: list, **kwargs):
+        self.chamadas += 1
+        espera = self._espera(agent)
+        if espera:
+            time.sleep(espera)
+        return resposta_simulada(*self._responder(agent, messages))
+
+    async def acomplete(self, agent: str, messages: list, **kwargs):
+        self.chamadas += 1
+        espera = self._espera(agent)
+        if espera:
+            await asyncio.sleep(espera)
+        return resposta_simulada(*self._responder(agent, messages))
+
+    def stream(self, agent: str, messages: list, **kwargs):
+        """Entrega a resposta em chunks, distribuindo a latência entre eles."""
+        self.chamadas += 1
+        chunks = chunks_simulados(*self._responder(agent, messages))
+        return entregar_chunks(chunks, self._espera(agent))
+
+    async def astream(self, agent: str, messages: list, **kwargs):
+        """Versão assíncrona de `stream`; devolve um gerador assíncrono de chunks."""
+        self.chamadas += 1
+        chunks = chunks_simulados(*self._responder(agent, messages))
+        return aentregar_chunks(chunks, self._espera(agent))
+
+
+def entregar_chunks(chunks: list, espera: float, primeiro: float = None):
+    """
+    Gera os chunks espalhando `espera` segundos entre eles.
+
+    Args:
+        primeiro: Espera antes do primeiro chunk (tempo até o primeiro token);
+            o restante de `espera` é dividido entre os demais.
+    """
+    for chunk, espera_do_chunk in zip(chunks, _esperas(len(chunks), espera, primeiro)):
+        if espera_do_chunk:
+            time.sleep(espera_do_chunk)
+        yield chunk
+
+
+async def aentregar_chunks(chunks: list, espera: float, primeiro: float = None):
+    """Versão assíncrona de `entregar_chunks`."""
+    for chunk, espera_do_chunk in zip(chunks, _esperas(len(chunks), espera, primeiro)):
+        if espera_do_chunk:
+            await asyncio.sleep(espera_do_chunk)
+        yield chunk
+
+
+def _esperas(quantidade: int, espera: float, primeiro: float = None) -> list:
+    if primeiro is None:
+        return [espera / quantidade] * quantidade
+    primeiro = min(primeiro, espera)
+    return [primeiro] + [(espera - primeiro) / max(quantidade - 1, 1)] * (quantidade - 1)
+
+
+def _em_trechos(conteudo: str, tamanho: int = 8) -> list:
+    # Aproxima os tokens de uma resposta real em streaming
+    return [conteudo[i:i + tamanho] for i in range(0, len(conteudo), tamanho)] or [""]
@@ -1,16 +1,19 @@
-import requests
 import json
-import os
 from pathlib import Path
 
 # Carrega a configuração do MCP usando o caminho absoluto
 config_path = Path.home() / '.codeium' / 'windsurf' / 'mcp_config.json'
-with open(config_path, 'r') as f:
-    mcp_config = json.load(f)
-
-CONTEXT7_CONFIG = mcp_config['mcpServers']['context7']
-CONTEXT7_URL = CONTEXT7_CONFIG['serverUrl']
-CONTEXT7_HEADERS = CONTEXT7_CONFIG['headers']
+try:
+    with open(config_path, 'r') as f:
+        mcp_config = json.load(f)
+    CONTEXT7_CONFIG = mcp_config['mcpServers']['context7']
+    CONTEXT7_URL = CONTEXT7_CONFIG['serverUrl']
+    CONTEXT7_HEADERS = CONTEXT7_CONFIG['headers']
+except (OSError, KeyError, json.JSONDecodeError):
+    # Sem configuração do MCP (ex: execução offline), a documentação embutida abaixo é usada
+    CONTEXT7_CONFIG = None
+    CONTEXT7_URL = None
+    CONTEXT7_HEADERS = {}
 
 def get_library_docs(library_id: str, topic: str = None) -> str:
     """
@@ -0,0 +1,392 @@
+"""
+Correções determinísticas de código Mermaid, aplicadas antes do Agente Corretor.
+
+Boa parte dos erros de sintaxe dos agentes são os que o próprio manual de boas
+práticas documenta: `<br>` em rótulos, textos com parênteses ou chaves sem
+aspas, `direction` dentro de subgraph, `end` usado como id, cercas markdown
+esquecidas no código. Cada um tem uma correção mecânica, então não há por que
+gastar uma chamada ao LLM com eles.
+
+Cada regra é acionada por códigos de diagnóstico do `mermaid_parser` ou por
+padrões na mensagem de erro do mmdc. As regras aplicáveis são executadas em
+ordem, o resultado é revalidado e, só se ainda houver erro, o código segue para
+o LLM. Os contadores de cada regra (`metricas()`) mostram quantas chamadas ao
+corretor foram economizadas.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from mermaid_parser import FORMAS, RE_BR, RE_ID, CARACTERES_ESPECIAIS, PALAVRAS_IGNORADAS, e_flowchart, analisar_flowchart, erros
+from mermaid_stream import extrair_codigo_mermaid
+
+RE_CERCA = re.compile(r"^[ \t]*```.*$", re.MULTILINE)
+RE_DIRECTION = re.compile(r"^[ \t]*direction\b.*$")
+RE_ROTULO_CONEXAO = re.compile(r"\|([^|\n]*)\|")
+RE_CONEXAO_COM_TEXTO = re.compile(r"--[ \t]+([^\n>|-][^\n>|]*?)[ \t]*-->")
+RE_TIPO_DE_DIAGRAMA = re.compile(
+    r"^\s*(graph|flowchart|sequenceDiagram|classDiagram|stateDiagram|erDiagram|journey|gantt|pie|mindmap|timeline|gitGraph)\b"
+)
+# Aberturas das formas de nó, da mais longa para a mais curta (">" fica de fora: confunde-se com as setas)
+ABERTURAS = [(abertura, fechamentos[0]) for abertura, fechamentos in FORMAS if abertura != ">"]
+RE_INICIO_DE_NO = re.compile(
+    r"(?<![\w-])(" + RE_ID.pattern + r")(" + "|".join(re.escape(a) for a, _ in ABERTURAS) + r")"
+)
+# O que pode vir depois do fechamento de uma forma na mesma instrução
+RE_APOS_FORMA = re.compile(r"[ \t]*(?:$|;|&|:::|-|=|\.|<|~|\|)")
+
+
+@dataclass
+class Regra:
+    """
+    Uma correção determinística.
+
+    Args:
+        nome: Identificador da regra (usado nas métricas e nos logs).
+        descricao: O que a regra corrige.
+        aplicar: Função código -> código corrigido (devolve o mesmo código se não houver o que corrigir).
+        codigos: Códigos de diagnóstico do `mermaid_parser` que acionam a regra.
+        padroes: Expressões regulares procuradas na mensagem de erro do mmdc.
+        sinal: Expressão regular procurada no próprio código (ex: cercas markdown).
+    """
+    nome: str
+    descricao: str
+    aplicar: callable
+    codigos: frozenset = field(default_factory=frozenset)
+    padroes: tuple = field(default_factory=tuple)
+    sinal: re.Pattern = None
+
+    def acionada_por(self, codigo: str, diagnosticos: set, mensagem_erro: str) -> bool:
+        if self.codigos & diagnosticos:
+            return True
+        if any(re.search(padrao, mensagem_erro, re.IGNORECASE) for padrao in self.padroes):
+            return True
+        return bool(self.sinal and self.sinal.search(codigo))
+
+
+@dataclass
+class ResultadoAutofix:
+    """Resultado de `corrigir_por_regras`: o código final, as regras que o alteraram e se ele passou na revalidação."""
+    codigo: str
+    regras: list = field(default_factory=list)
+    valido: bool = False
+
+    @property
+    def corrigido(self) -> bool:
+        return bool(self.regras) and self.valido
+
+
+# --- utilitários ---------------------------------------------------------------
+
+def _mascarar(codigo: str) -> str:
+    """
+    Substitui o conteúdo entre aspas, os comentários e as linhas de estilo por
+    espaços, mantendo as posições, para que as regras só enxerguem a estrutura.
+    """
+    resultado, em_aspas = [], False
+    for c in codigo:
+        if c == '"':
+            em_aspas = not em_aspas
+            resultado.append(c)
+        elif em_aspas and c != "\n":
+            resultado.append(" ")
+        else:
+            resultado.append(c)
+    mascarado = "".join(resultado)
+    linhas = mascarado.split("\n")
+    for i, linha in enumerate(linhas):
+        primeira_palavra = (linha.split(None, 1) or [""])[0]
+        if primeira_palavra.startswith("%%") or primeira_palavra in PALAVRAS_IGNORADAS or primeira_palavra == "class":
+            linhas[i] = " " * len(linha)
+    return "\n".join(linhas)
+
+
+def _aplicar_edicoes(codigo: str, edicoes: list) -> str:
+    """Aplica substituições (inicio, fim, texto) que não se sobrepõem."""
+    for inicio, fim, texto in sorted(edicoes, reverse=True):
+        codigo = codigo[:inicio] + texto + codigo[fim:]
+    return codigo
+
+
+def _fechamento(mascarado: str, pos: int, fechamento: str) -> int:
+    """Posição do fechamento de uma forma sem aspas que começa em `pos`, ou -1."""
+    fim_linha = mascarado.find("\n", pos)
+    fim_linha = len(mascarado) if fim_linha == -1 else fim_linha
+    ultima = -1
+    candidato = mascarado.find(fechamento, pos, fim_linha)
+    while candidato != -1:
+        ultima = candidato
+        if RE_APOS_FORMA.match(mascarado, candidato + len(fechamento), fim_linha):
+            return candidato
+        candidato = mascarado.find(fechamento, candidato + 1, fim_linha)
+    return ultima
+
+
+def _texto_entre_aspas(texto: str) -> str:
+    texto = RE_BR.sub("\n", texto.strip())
+    return '"' + texto.replace('"', "#quot;") + '"'
+
+
+def _precisa_de_aspas(texto: str) -> bool:
+    return bool(RE_BR.search(texto)) or any(c in CARACTERES_ESPECIAIS for c in texto)
+
+
+def _ids_usados(codigo: str) -> set:
+    return set(RE_ID.findall(_mascarar(codigo)))
+
+
+# --- regras ----------------------------------------------------------------------
+
+def remover_cercas(codigo: str) -> str:
+    """Remove cercas markdown (```mermaid ... ```) e o texto em volta delas."""
+    if not RE_CERCA.search(codigo):
+        return codigo
+    extraido = extrair_codigo_mermaid(codigo)
+    if RE_TIPO_DE_DIAGRAMA.match(extraido):
+        return extraido
+    # Cerca solta (ex: só a de fechamento): descarta apenas as linhas de cerca
+    return RE_CERCA.sub("", codigo).strip("\n")
+
+
+def adicionar_cabecalho(codigo: str) -> str:
+    """Acrescenta `graph TD` a um fluxograma sem a declaração do tipo de diagrama."""
+    if RE_TIPO_DE_DIAGRAMA.match(codigo) or codigo.lstrip().startswith(("---", "%%")):
+        return codigo
+    if "-->" not in codigo and not RE_INICIO_DE_NO.search(_mascarar(codigo)):
+        return codigo
+    return "graph TD\n" + codigo.strip("\n")
+
+
+def colocar_rotulos_entre_aspas(codigo: str) -> str:
+    """
+    Coloca entre aspas os textos de nós e conexões que têm caracteres especiais
+    ou <br>, e troca <br> por quebras de linha literais nos textos já entre aspas.
+    """
+    mascarado = _mascarar(codigo)
+    edicoes = []
+
+    for encontrado in RE_INICIO_DE_NO.finditer(mascarado):
+        if encontrado.group(1) in ("subgraph", "end"):
+            continue
+        abertura = encontrado.group(2)
+        fechamento = dict(ABERTURAS)[abertura]
+        inicio = encontrado.end()
+        primeiro = inicio
+        while primeiro < len(mascarado) and mascarado[primeiro] in " \t":
+            primeiro += 1
+        if mascarado.startswith('"', primeiro):
+            fim_aspas = mascarado.find('"', primeiro + 1)
+            if fim_aspas != -1 and RE_BR.search(codigo[primeiro + 1:fim_aspas]):
+                edicoes.append((primeiro + 1, fim_aspas, RE_BR.sub("\n", codigo[primeiro + 1:fim_aspas])))
+            continue
+        fim = _fechamento(mascarado, inicio, fechamento)
+        if fim == -1:
+            continue
+        texto = codigo[inicio:fim]
+        if _precisa_de_aspas(texto):
+            edicoes.append((inicio, fim, _texto_entre_aspas(texto)))
+
+    for encontrado in RE_ROTULO_CONEXAO.finditer(mascarado):
+        texto = codigo[encontrado.start(1):encontrado.end(1)]
+        if texto.strip().startswith('"'):
+            if RE_BR.search(texto):
+                edicoes.append((encontrado.start(1), encontrado.end(1), RE_BR.sub("\n", texto)))
+        elif _precisa_de_aspas(texto):
+            edicoes.append((encontrado.start(1), encontrado.end(1), _texto_entre_aspas(texto)))
+
+    for encontrado in RE_CONEXAO_COM_TEXTO.finditer(mascarado):
+        texto = codigo[encontrado.start(1):encontrado.end(1)]
+        if _precisa_de_aspas(texto) and not texto.strip().startswith('"'):
+            # "A -- texto (x) --> B" vira "A -->|"texto (x)"| B"
+            edicoes.append((encontrado.start(), encontrado.end(), f"-->|{_texto_entre_aspas(texto)}|"))
+
+    return _aplicar_edicoes(codigo, _sem_sobreposicao(edicoes))
+
+
+def _sem_sobreposicao(edicoes: list) -> list:
+    selecionadas, fim_anterior = [], -1
+    for inicio, fim, texto in sorted(edicoes):
+        if inicio >= fim_anterior:
+            selecionadas.append((inicio, fim, texto))
+            fim_anterior = fim
+    return selecionadas
+
+
+def remover_direction_em_subgraph(codigo: str) -> str:
+    """Remove as diretivas `direction` declaradas dentro de subgraphs (ver o manual, seção 1)."""
+    linhas, profundidade = [], 0
+    for linha, mascarada in zip(codigo.split("\n"), _mascarar(codigo).split("\n")):
+        conteudo = mascarada.strip()
+        if conteudo.startswith("subgraph"):
+            profundidade += 1
+        elif conteudo == "end":
+            profundidade = max(0, profundidade - 1)
+        elif profundidade and RE_DIRECTION.match(mascarada):
+            continue
+        linhas.append(linha)
+    return "\n".join(linhas)
+
+
+def renomear_id_reservado(codigo: str) -> str:
+    """Troca o id `end`, reservado pelo Mermaid, por um id livre."""
+    usados = _ids_usados(codigo)
+    novo_id, sufixo = "Fim", 2
+    while novo_id in usados:
+        novo_id, sufixo = f"Fim{sufixo}", sufixo + 1
+    mascarado = _mascarar(codigo)
+    edicoes = []
+    inicio_linha = 0
+    for mascarada in mascarado.split("\n"):
+        if mascarada.strip() != "end":
+            for encontrado in re.finditer(r"(?<![\w-])end(?![\w-])", mascarada):
+                edicoes.append((inicio_linha + encontrado.start(), inicio_linha + encontrado.end(), novo_id))
+        inicio_linha += len(mascarada) + 1
+    return _aplicar_edicoes(codigo, edicoes)
+
+
+def fechar_subgraphs(codigo: str) -> str:
+    """Acrescenta os `end` que faltam ao final do diagrama."""
+    abertos = 0
+    for mascarada in _mascarar(codigo).split("\n"):
+        conteudo = mascarada.strip()
+        if conteudo.startswith("subgraph"):
+            abertos += 1
+        elif conteudo == "end" and abertos:
+            abertos -= 1
+    if not abertos:
+        return codigo
+    return codigo.rstrip("\n") + "".join(f"\n{'    ' * nivel}end" for nivel in range(abertos, 0, -1))
+
+
+REGRAS = [
+    Regra(
+        "cercas_markdown", "Remove cercas markdown e texto fora do código.", remover_cercas,
+        frozenset({"cabecalho_invalido", "token_inesperado"}),
+        (r"```", r"No diagram type detected", r"UnknownDiagramError"),
+        RE_CERCA,
+    ),
+    Regra(
+        "cabecalho_ausente", "Acrescenta 'graph TD' a um fluxograma sem cabeçalho.", adicionar_cabecalho,
+        frozenset({"cabecalho_invalido"}),
+        (r"No diagram type detected", r"UnknownDiagramError"),
+    ),
+    Regra(
+        "rotulos_sem_aspas", "Coloca entre aspas textos com caracteres especiais ou <br>.", colocar_rotulos_entre_aspas,
+        frozenset({"br_em_rotulo", "caractere_especial_sem_aspas", "forma_nao_fechada"}),
+        (r"<br", r"got '(?:PS|PE|SQS|SQE|DIAMOND_START|DIAMOND_STOP|TAGSTART|TAGEND|STR|PIPE)'"),
+    ),
+    Regra(
+        "direction_em_subgraph", "Remove 'direction' de dentro de subgraphs.", remover_direction_em_subgraph,
+        frozenset({"direction_em_subgraph"}),
+    ),
+    Regra(
+        "id_reservado", "Renomeia nós com o id reservado 'end'.", renomear_id_reservado,
+        frozenset({"id_reservado"}),
+        (r"got 'end'",),
+    ),
+    Regra(
+        "subgraph_sem_end", "Fecha subgraphs abertos.", fechar_subgraphs,
+        frozenset({"subgraph_sem_end"}),
+    ),
+]
+
+
+# --- métricas ----------------------------------------------------------------------
+
+_lock = threading.Lock()
+_metricas = {"tentativas": 0, "corrigidos": 0, "regras": {}}
+
+
+def _registrar(regras: list, corrigido: bool):
+    with _lock:
+        _metricas["tentativas"] += 1
+        _metricas["corrigidos"] += int(corrigido)
+        for nome in regras:
+            contadores = _metricas["regras"].setdefault(nome, {"acionamentos": 0, "sucessos": 0})
+            contadores["acionamentos"] += 1
+            contadores["sucessos"] += int(corrigido)
+
+
+def metricas() -> dict:
+    """
+    Contadores desde o início do processo: `tentativas`, `corrigidos` (chamadas ao
+    corretor economizadas) e, por regra, `acionamentos` e `sucessos`.
+    """
+    with _lock:
+        return {
+            "tentativas": _metricas["tentativas"],
+            "corrigidos": _metricas["corrigidos"],
+            "regras": {nome: dict(contadores) for nome, contadores in _metricas["regras"].items()},
+        }
+
+
+def zerar_metricas():
+    with _lock:
+        _metricas.update(tentativas=0, corrigidos=0, regras={})
+
+
+def resumo() -> str:
+    """Resumo de uma linha das métricas, para logs e para a interface."""
+    m = metricas()
+    if not m["tentativas"]:
+        return "Correções por regras: nenhuma tentativa."
+    regras = ", ".join(f"{nome} {c['sucessos']}/{c['acionamentos']}" for nome, c in m["regras"].items())
+    return (
+        f"Correções por regras: {m['corrigidos']}/{m['tentativas']} erros resolvidos sem LLM"
+        + (f" ({regras})." if regras else ".")
+    )
+
+
+# --- correção ----------------------------------------------------------------------
+
+def _codigos_de_diagnostico(codigo: str) -> set:
+    if not e_flowchart(codigo):
+        return set()
+    return {d.codigo for d in erros(analisar_flowchart(codigo))}
+
+
+def _valido_localmente(codigo: str) -> bool:
+    return e_flowchart(codigo) and not erros(analisar_flowchart(codigo))
+
+
+def aplicar_regras(codigo: str, mensagem_erro: str = "") -> tuple[str, list]:
+    """
+    Aplica, em ordem, as regras acionadas pelo código e pela mensagem de erro.
+
+    Os diagnósticos são recalculados após cada regra que altera o código, pois
+    uma correção pode revelar ou resolver outros erros.
+
+    Returns:
+        Uma tupla (código, nomes das regras que o alteraram).
+    """
+    aplicadas = []
+    diagnosticos = _codigos_de_diagnostico(codigo)
+    for regra in REGRAS:
+        if not regra.acionada_por(codigo, diagnosticos, mensagem_erro or ""):
+            continue
+        novo = regra.aplicar(codigo)
+        if novo != codigo:
+            codigo = novo
+            aplicadas.append(regra.nome)
+            diagnosticos = _codigos_de_diagnostico(codigo)
+    return codigo, aplicadas
+
+
+def corrigir_por_regras(codigo: str, mensagem_erro: str = "", validar=None) -> ResultadoAutofix:
+    """
+    Tenta corrigir o código apenas com as regras determinísticas.
+
+    Args:
+        codigo: O código Mermaid com erro.
+        mensagem_erro: A mensagem de erro do validador (mmdc ou pré-validação local).
+        validar: Função código -> bool usada na revalidação. Por padrão, a
+            pré-validação local do `mermaid_parser` (só reconhece flowcharts).
+
+    Returns:
+        Um `ResultadoAutofix`. Se `corrigido` for False, o código deve seguir para o LLM.
+    """
+    novo, aplicadas = aplicar_regras(codigo, mensagem_erro)
+    if not aplicadas:
+        return ResultadoAutofix(codigo)
+    valido = (validar or _valido_localmente)(novo)
+    _registrar(aplicadas, valido)
+    return ResultadoAutofix(novo, aplicadas, valido)
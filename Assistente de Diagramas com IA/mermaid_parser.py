@@ -0,0 +1,428 @@
+"""
+Analisador léxico/sintático em Python puro para o dialeto `graph`/`flowchart` do Mermaid.
+
+Serve como uma pré-validação rápida, executada antes do mmdc: detecta em
+microssegundos os erros mais comuns do código gerado pelos agentes (colchetes
+desbalanceados, `subgraph` sem `end`, direção inválida, `<br>` em rótulos etc.)
+e devolve diagnósticos com linha e coluna. Diagramas de outros tipos
+(sequenceDiagram, classDiagram...) não são analisados.
+"""
+import re
+import bisect
+from dataclasses import dataclass
+
+DIRECOES_VALIDAS = {"TB", "TD", "BT", "RL", "LR", ">", "<", "^", "V"}
+
+# Formas de nós: abertura -> fechamentos aceitos. A ordem importa: as aberturas
+# mais longas precisam ser testadas antes das mais curtas.
+FORMAS = [
+    ("(((", (")))",)),
+    ("((", ("))",)),
+    ("([", ("])",)),
+    ("(", (")",)),
+    ("[[", ("]]",)),
+    ("[(", (")]",)),
+    ("[/", ("/]", "\\]")),
+    ("[\\", ("\\]", "/]")),
+    ("[", ("]",)),
+    ("{{", ("}}",)),
+    ("{", ("}",)),
+    (">", ("]",)),
+]
+
+CARACTERES_ESPECIAIS = set('()[]{}"')
+
+RE_ID = re.compile(r"\w+(?:-\w+)*")
+RE_BR = re.compile(r"<br\s*/?>", re.IGNORECASE)
+RE_CONEXAO = re.compile(r"[<ox]?(?:-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,}|-\.+-[>ox]?|~{3,})")
+# Texto da conexão (A-- texto -->B, A--texto-->B, A--"texto"-->B): entre aspas, ou
+# começando por um caractere que não continue a própria seta (A-->B não é texto ">B")
+_TEXTO_DA_CONEXAO = r'[ \t]*(?P<texto>"[^"]*"|[^\s"\-=.>~][^"]*?)[ \t]*'
+RE_CONEXAO_COM_TEXTO = [
+    re.compile(r"[<ox]?--" + _TEXTO_DA_CONEXAO + r"(?P<fecha>-{2,}[>ox]|-{3,})"),
+    re.compile(r"[<ox]?==" + _TEXTO_DA_CONEXAO + r"(?P<fecha>={2,}[>ox]|={3,})"),
+    re.compile(r"[<ox]?-\." + _TEXTO_DA_CONEXAO + r"(?P<fecha>\.-+[>ox]?)"),
+]
+RE_CABECALHO = re.compile(r"(graph|flowchart)\b[ \t]*(\S*)")
+
+PALAVRAS_IGNORADAS = ("classDef", "style", "linkStyle", "click", "accTitle", "accDescr")
+# Erros de um diagrama parcial que o restante do código ainda pode resolver
+CODIGOS_PROVISORIOS = {"subgraph_sem_end", "aspas_nao_fechadas", "diagrama_vazio"}
+
+
+@dataclass
+class Diagnostico:
+    """Um problema encontrado no código Mermaid."""
+    linha: int
+    coluna: int
+    codigo: str
+    mensagem: str
+    severidade: str = "erro"  # "erro" bloqueia o diagrama; "aviso" é apenas informativo
+
+    def __str__(self):
+        return f"Linha {self.linha}, coluna {self.coluna}: {self.mensagem}"
+
+
+class _Instrucao:
+    """Uma instrução do diagrama (linha lógica) com seu deslocamento no texto original."""
+
+    def __init__(self, texto: str, inicio: int):
+        self.texto = texto
+        self.inicio = inicio
+
+
+class _Analisador:
+    def __init__(self, codigo: str):
+        self.codigo = codigo.replace("\r\n", "\n").replace("\r", "\n")
+        self.inicios_de_linha = [0] + [i + 1 for i, c in enumerate(self.codigo) if c == "\n"]
+        self.diagnosticos = []
+        self.nos_definidos = set()
+        self.nos_referenciados = {}
+        self.classes_definidas = set()
+        self.classes_usadas = {}
+        self.subgrafos_abertos = []
+
+    # --- utilitários --------------------------------------------------------
+
+    def _posicao(self, deslocamento: int) -> tuple[int, int]:
+        linha = bisect.bisect_right(self.inicios_de_linha, deslocamento)
+        return linha, deslocamento - self.inicios_de_linha[linha - 1] + 1
+
+    def _registrar(self, deslocamento: int, codigo: str, mensagem: str, severidade: str = "erro"):
+        linha, coluna = self._posicao(deslocamento)
+        self.diagnosticos.append(Diagnostico(linha, coluna, codigo, mensagem, severidade))
+
+    def _verificar_rotulo(self, texto: str, deslocamento: int):
+        """Aplica ao texto de um rótulo as regras do manual de boas práticas."""
+        encontrado = RE_BR.search(texto)
+        if encontrado:
+            self._registrar(
+                deslocamento + encontrado.start(), "br_em_rotulo",
+                "Uso de <br> em rótulo. Use quebras de linha literais com o texto entre aspas duplas."
+            )
+
+    # --- divisão em instruções ----------------------------------------------
+
+    def _dividir_instrucoes(self) -> list:
+        instrucoes = []
+        texto = self.codigo
+        i, inicio, em_aspas, abertura_aspas = 0, 0, False, 0
+
+        # Front matter YAML (--- ... ---) no início do diagrama
+        if texto.lstrip().startswith("---"):
+            primeira = texto.index("---")
+            fim = texto.find("\n---", primeira + 3)
+            if fim != -1:
+                quebra = texto.find("\n", fim + 1)
+                i = inicio = len(texto) if quebra == -1 else quebra + 1
+
+        while i < len(texto):
+            c = texto[i]
+            if not em_aspas and i == inicio:
+                primeiro = i
+                while primeiro < len(texto) and texto[primeiro] in " \t":
+                    primeiro += 1
+                if texto.startswith("%%", primeiro):
+                    # Linha de comentário ou diretiva: ignora até o fim da linha
+                    fim = texto.find("\n", primeiro)
+                    i = inicio = len(texto) if fim == -1 else fim + 1
+                    continue
+            if c == '"':
+                em_aspas = not em_aspas
+                abertura_aspas = i
+            elif not em_aspas and c in "\n;":
+                instrucoes.append(_Instrucao(texto[inicio:i], inicio))
+                inicio = i + 1
+            i += 1
+
+        if em_aspas:
+            self._registrar(abertura_aspas, "aspas_nao_fechadas", "Aspas duplas abertas e nunca fechadas.")
+            return instrucoes
+        instrucoes.append(_Instrucao(texto[inicio:], inicio))
+        return instrucoes
+
+    # --- análise --------------------------------------------------------------
+
+    def analisar(self) -> list:
+        instrucoes = [inst for inst in self._dividir_instrucoes() if inst.texto.strip()]
+        if not instrucoes:
+            self._registrar(0, "diagrama_vazio", "O diagrama está vazio.")
+            return self.diagnosticos
+
+        self._analisar_cabecalho(instrucoes[0])
+        for instrucao in instrucoes[1:]:
+            self._analisar_instrucao(instrucao)
+
+        for deslocamento in self.subgrafos_abertos:
+            self._registrar(deslocamento, "subgraph_sem_end", "'subgraph' aberto sem o 'end' correspondente.")
+
+        for no, deslocamento in self.nos_referenciados.items():
+            if no not in self.nos_definidos:
+                self._registrar(
+                    deslocamento, "no_indefinido",
+                    f"O nó '{no}' é referenciado mas nunca recebe forma ou texto.", "aviso"
+                )
+        for classe, deslocamento in self.classes_usadas.items():
+            if classe not in self.classes_definidas:
+                self._registrar(
+                    deslocamento, "classe_indefinida",
+                    f"A classe '{classe}' é aplicada mas não foi definida com classDef.", "aviso"
+                )
+
+        self.diagnosticos.sort(key=lambda d: (d.linha, d.coluna))
+        return self.diagnosticos
+
+    def _analisar_cabecalho(self, instrucao: _Instrucao):
+        texto = instrucao.texto
+        recuo = len(texto) - len(texto.lstrip())
+        encontrado = RE_CABECALHO.match(texto, recuo)
+        if not encontrado:
+            self._registrar(
+                instrucao.inicio + recuo, "cabecalho_invalido",
+                "O diagrama deve começar com 'graph' ou 'flowchart' seguido da direção."
+            )
+            return
+        direcao = encontrado.group(2)
+        if direcao and direcao.upper() not in DIRECOES_VALIDAS:
+            self._registrar(
+                instrucao.inicio + encontrado.start(2), "direcao_invalida",
+                f"Direção '{direcao}' inválida. Use TD, TB, BT, LR ou RL."
+            )
+        resto = texto[encontrado.end():]
+        if resto.strip():
+            # Permite uma instrução na mesma linha do cabeçalho (ex: "graph TD; A-->B" já foi separado por ';')
+            self._analisar_instrucao(_Instrucao(resto, instrucao.inicio + encontrado.end()))
+
+    def _analisar_instrucao(self, instrucao: _Instrucao):
+        texto = instrucao.texto
+        recuo = len(texto) - len(texto.lstrip())
+        conteudo = texto.strip()
+        base = instrucao.inicio + recuo
+        primeira_palavra = conteudo.split(None, 1)[0]
+
+        if primeira_palavra == "subgraph":
+            self.subgrafos_abertos.append(base)
+            titulo = conteudo[len("subgraph"):]
+            self._verificar_rotulo(titulo, base + len("subgraph"))
+            if titulo.count('"') % 2:
+                self._registrar(base, "aspas_nao_fechadas", "Aspas do título do subgraph não fechadas.")
+            return
+        if conteudo == "end":
+            if not self.subgrafos_abertos:
+                self._registrar(base, "end_sem_subgraph", "'end' sem 'subgraph' correspondente.")
+            else:
+                self.subgrafos_abertos.pop()
+            return
+        if primeira_palavra == "direction":
+            partes = conteudo.split()
+            if len(partes) != 2 or partes[1].upper() not in DIRECOES_VALIDAS:
+                self._registrar(base, "direcao_invalida", f"Diretiva '{conteudo}' inválida.")
+            if self.subgrafos_abertos:
+                self._registrar(
+                    base, "direction_em_subgraph",
+                    "'direction' dentro de subgraph causa erros de renderização. Declare a direção apenas no cabeçalho."
+                )
+            return
+        if primeira_palavra == "classDef":
+            partes = conteudo.split()
+            if len(partes) >= 2:
+                for nome in partes[1].split(","):
+                    self.classes_definidas.add(nome)
+            return
+        if primeira_palavra == "class":
+            partes = conteudo.split()
+            if len(partes) < 3:
+                self._registrar(base, "class_invalido", "Uso esperado: 'class id1,id2 nomeDaClasse'.")
+                return
+            for no in partes[1].split(","):
+                self.nos_referenciados.setdefault(no, base)
+            self.classes_usadas.setdefault(partes[2], base)
+            return
+        if primeira_palavra in PALAVRAS_IGNORADAS:
+            if primeira_palavra == "style" and len(conteudo.split()) >= 2:
+                self.nos_referenciados.setdefault(conteudo.split()[1], base)
+            return
+
+        self._analisar_cadeia(conteudo, base)
+
+    # --- nós e conexões -------------------------------------------------------
+
+    def _pular_espacos(self, texto: str, pos: int) -> int:
+        while pos < len(texto) and texto[pos] in " \t":
+            pos += 1
+        return pos
+
+    def _analisar_cadeia(self, texto: str, base: int):
+        """Analisa `no (conexao no)*`, onde cada `no` pode ser um grupo `a & b`."""
+        pos = self._analisar_grupo_de_nos(texto, base, 0)
+        while pos is not None:
+            pos = self._pular_espacos(texto, pos)
+            if pos >= len(texto):
+                return
+            pos = self._analisar_conexao(texto, base, pos)
+            if pos is None:
+                return
+            pos = self._analisar_grupo_de_nos(texto, base, self._pular_espacos(texto, pos))
+
+    def _analisar_grupo_de_nos(self, texto: str, base: int, pos: int):
+        pos = self._analisar_no(texto, base, pos)
+        while pos is not None:
+            proximo = self._pular_espacos(texto, pos)
+            if not texto.startswith("&", proximo):
+                return pos
+            pos = self._analisar_no(texto, base, self._pular_espacos(texto, proximo + 1))
+        return None
+
+    def _analisar_no(self, texto: str, base: int, pos: int):
+        encontrado = RE_ID.match(texto, pos)
+        if not encontrado:
+            trecho = texto[pos:pos + 15]
+            self._registrar(base + pos, "token_inesperado", f"Esperado o identificador de um nó, encontrado '{trecho}'.")
+            return None
+        no_id = encontrado.group()
+        if no_id == "end":
+            self._registrar(
+                base + pos, "id_reservado",
+                "'end' é uma palavra reservada e não pode ser usado como id de nó."
+            )
+            return None
+        self.nos_referenciados.setdefault(no_id, base + pos)
+        pos = encontrado.end()
+
+        for abertura, fechamentos in FORMAS:
+            if texto.startswith(abertura, pos):
+                pos = self._analisar_forma(texto, base, pos, abertura, fechamentos)
+                if pos is None:
+                    return None
+                self.nos_definidos.add(no_id)
+                break
+
+        if texto.startswith(":::", pos):
+            classe = RE_ID.match(texto, pos + 3)
+            if not classe:
+                self._registrar(base + pos, "class_invalido", "Nome de classe esperado após ':::'.")
+                return None
+            self.classes_usadas.setdefault(classe.group(), base + pos)
+            pos = classe.end()
+        return pos
+
+    def _analisar_forma(self, texto: str, base: int, pos: int, abertura: str, fechamentos: tuple):
+        inicio_forma = pos
+        pos += len(abertura)
+        if texto[pos:].lstrip(" \t").startswith('"'):
+            pos = self._pular_espacos(texto, pos)
+            fim_aspas = texto.find('"', pos + 1)
+            # As aspas já foram balanceadas na divisão em instruções
+            self._verificar_rotulo(texto[pos + 1:fim_aspas], base + pos + 1)
+            pos = self._pular_espacos(texto, fim_aspas + 1)
+            for fechamento in fechamentos:
+                if texto.startswith(fechamento, pos):
+                    return pos + len(fechamento)
+            self._registrar(
+                base + pos, "forma_nao_fechada",
+                f"Esperado '{fechamentos[0]}' após o texto entre aspas."
+            )
+            return None
+
+        inicio_texto = pos
+        while pos < len(texto):
+            for fechamento in fechamentos:
+                if texto.startswith(fechamento, pos):
+                    self._verificar_rotulo(texto[inicio_texto:pos], base + inicio_texto)
+                    return pos + len(fechamento)
+            if texto[pos] in CARACTERES_ESPECIAIS:
+                self._registrar(
+                    base + pos, "caractere_especial_sem_aspas",
+                    f"Caractere '{texto[pos]}' no texto do nó sem aspas. Envolva o texto com aspas duplas."
+                )
+                return None
+            pos += 1
+
+        self._registrar(
+            base + inicio_forma, "forma_nao_fechada",
+            f"'{abertura}' aberto e não fechado com '{fechamentos[0]}'."
+        )
+        return None
+
+    def _analisar_conexao(self, texto: str, base: int, pos: int):
+        for padrao in RE_CONEXAO_COM_TEXTO:
+            encontrado = padrao.match(texto, pos)
+            if encontrado:
+                self._verificar_rotulo(encontrado.group("texto"), base + encontrado.start("texto"))
+                return encontrado.end()
+
+        encontrado = RE_CONEXAO.match(texto, pos)
+        if not encontrado:
+            # O Mermaid aceita mais sintaxes de conexão do que as reconhecidas aqui: quem decide é o mmdc
+            trecho = texto[pos:pos + 15]
+            self._registrar(
+                base + pos, "conexao_nao_reconhecida",
+                f"Conexão não reconhecida pela pré-validação: '{trecho}'.", "aviso"
+            )
+            return None
+        pos = encontrado.end()
+
+        proximo = self._pular_espacos(texto, pos)
+        if texto.startswith("|", proximo):
+            fim = texto.find("|", proximo + 1)
+            if fim == -1:
+                self._registrar(base + proximo, "rotulo_conexao_nao_fechado", "Texto da conexão aberto com '|' e não fechado.")
+                return None
+            self._verificar_rotulo(texto[proximo + 1:fim], base + proximo + 1)
+            pos = fim + 1
+        return pos
+
+
+def e_flowchart(codigo_mermaid: str) -> bool:
+    """Indica se o código usa o dialeto graph/flowchart (o único analisado aqui)."""
+    for linha in codigo_mermaid.splitlines():
+        conteudo = linha.strip()
+        if not conteudo or conteudo.startswith("%%"):
+            continue
+        if conteudo == "---":
+            # Front matter: decide pela primeira linha após o bloco
+            partes = codigo_mermaid.split("---", 2)
+            return len(partes) == 3 and e_flowchart(partes[2])
+        return bool(RE_CABECALHO.match(conteudo))
+    return False
+
+
+def analisar_flowchart(codigo_mermaid: str) -> list:
+    """
+    Analisa um diagrama graph/flowchart e retorna os diagnósticos encontrados.
+
+    Args:
+        codigo_mermaid: O código Mermaid a ser analisado.
+
+    Returns:
+        Uma lista de `Diagnostico` ordenada por posição. Diagnósticos com
+        severidade "erro" indicam que o mmdc certamente rejeitaria o diagrama.
+    """
+    return _Analisador(codigo_mermaid).analisar()
+
+
+def erros_no_prefixo(codigo_parcial: str) -> list:
+    """
+    Analisa o início de um diagrama que ainda está sendo gerado (streaming).
+
+    Considera apenas as linhas completas e descarta os erros que o restante do
+    código ainda pode resolver (subgraph sem 'end', aspas abertas em um rótulo
+    de várias linhas, diagrama vazio).
+
+    Returns:
+        Os erros que certamente permanecerão no diagrama completo.
+    """
+    prefixo = codigo_parcial[:codigo_parcial.rfind("\n") + 1]
+    if not e_flowchart(prefixo):
+        return []
+    return [d for d in erros(analisar_flowchart(prefixo)) if d.codigo not in CODIGOS_PROVISORIOS]
+
+
+def erros(diagnosticos: list) -> list:
+    """Filtra apenas os diagnósticos que impedem a renderização."""
+    return [d for d in diagnosticos if d.severidade == "erro"]
+
+
+def formatar_diagnosticos(diagnosticos: list) -> str:
+    """Formata os diagnósticos no estilo das mensagens de erro do mmdc."""
+    return "\n".join(str(d) for d in diagnosticos)
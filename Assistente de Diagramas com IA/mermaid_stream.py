@@ -0,0 +1,90 @@
+"""
+Extração incremental do código Mermaid de respostas em streaming.
+
+Os modelos costumam envolver o código em blocos markdown (```mermaid ... ```),
+às vezes precedidos de uma frase de introdução. O `FiltroDeCercas` recebe a
+resposta em pedaços e mantém, a cada momento, apenas o código já recebido,
+sem esperar a resposta completa.
+"""
+
+CERCA = "```"
+
+
+class FiltroDeCercas:
+    """
+    Máquina de estados que remove as cercas markdown de uma resposta em streaming.
+
+    Estados:
+        "inicio": nada relevante recebido ainda.
+        "sem_cerca": o texto começou sem cerca; é tratado como código até que
+            uma cerca apareça (nesse caso o que veio antes era texto explicativo
+            e é descartado).
+        "dentro": dentro de um bloco ```; as linhas são código.
+        "fim": a cerca de fechamento foi recebida; o restante é ignorado.
+    """
+
+    def __init__(self):
+        self.estado = "inicio"
+        self._linhas = []
+        self._pendente = ""
+
+    @property
+    def codigo(self) -> str:
+        """O código recebido até agora, incluindo a linha ainda incompleta."""
+        parcial = self._pendente if self.estado in ("sem_cerca", "dentro") and "`" not in self._pendente else ""
+        return "\n".join(self._linhas + ([parcial] if parcial else [])).strip()
+
+    def alimentar(self, trecho: str) -> bool:
+        """
+        Processa um novo pedaço da resposta.
+
+        Returns:
+            True se o código visível mudou.
+        """
+        if self.estado == "fim" or not trecho:
+            return False
+        antes = self.codigo
+        self._pendente += trecho
+        while "\n" in self._pendente and self.estado != "fim":
+            linha, self._pendente = self._pendente.split("\n", 1)
+            self._processar_linha(linha)
+        return self.codigo != antes
+
+    def finalizar(self) -> str:
+        """Processa a última linha (sem quebra final) e retorna o código completo."""
+        if self._pendente and self.estado != "fim":
+            linha, self._pendente = self._pendente, ""
+            self._processar_linha(linha)
+        self._pendente = ""
+        return self.codigo
+
+    def _processar_linha(self, linha: str):
+        if self.estado in ("inicio", "sem_cerca"):
+            if linha.lstrip().startswith(CERCA):
+                # Abertura do bloco (```mermaid ou ```); o que veio antes era prosa
+                self._linhas = []
+                self.estado = "dentro"
+                resto = linha.lstrip()[len(CERCA):]
+                if CERCA in resto:
+                    # Bloco inteiro em uma linha: ```graph TD```
+                    self._linhas.append(resto.split(CERCA)[0].strip().removeprefix("mermaid").strip())
+                    self.estado = "fim"
+                elif resto.strip().removeprefix("mermaid").strip():
+                    # Código na mesma linha da abertura: ```mermaid graph TD
+                    self._linhas.append(resto.strip().removeprefix("mermaid").strip())
+            elif self.estado == "sem_cerca" or linha.strip():
+                self.estado = "sem_cerca"
+                self._linhas.append(linha)
+        elif self.estado == "dentro":
+            if CERCA in linha:
+                self._linhas.append(linha.split(CERCA)[0])
+                self.estado = "fim"
+            else:
+                self._linhas.append(linha)
+
+
+def extrair_codigo_mermaid(resposta: str) -> str:
+    """Remove as cercas markdown de uma resposta completa."""
+    filtro = FiltroDeCercas()
+    filtro.alimentar(resposta)
+    return filtro.finalizar()
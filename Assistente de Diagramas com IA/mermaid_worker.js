@@ -0,0 +1,79 @@
+// Worker de validação Mermaid de longa duração.
+//
+// Mantém um Chromium headless aquecido com a biblioteca Mermaid carregada e
+// valida diagramas recebidos pelo stdin, um JSON por linha:
+//   entrada: {"id": 1, "code": "graph TD\n A --> B"}
+//   saída:   {"id": 1, "ok": true} ou {"id": 1, "ok": false, "error": "..."}
+// Ao ficar pronto, emite {"ready": true}. Usado por mermaid_worker_pool.py.
+
+const path = require('path');
+const readline = require('readline');
+const puppeteer = require('puppeteer');
+
+function caminhoMermaid() {
+  if (process.env.MERMAID_JS_PATH) {
+    return process.env.MERMAID_JS_PATH;
+  }
+  try {
+    return path.join(path.dirname(require.resolve('mermaid/package.json')), 'dist', 'mermaid.min.js');
+  } catch (e) {
+    return path.join(__dirname, '..', 'node_modules', 'mermaid', 'dist', 'mermaid.min.js');
+  }
+}
+
+function responder(mensagem) {
+  process.stdout.write(JSON.stringify(mensagem) + '\n');
+}
+
+async function main() {
+  const args = process.env.MERMAID_WORKER_NO_SANDBOX === '1' ? ['--no-sandbox'] : [];
+  const browser = await puppeteer.launch({ headless: 'new', args });
+  const page = await browser.newPage();
+  await page.addScriptTag({ path: caminhoMermaid() });
+  await page.evaluate(() => {
+    window.mermaid.initialize({ startOnLoad: false });
+  });
+
+  const encerrar = async () => {
+    try {
+      await browser.close();
+    } finally {
+      process.exit(0);
+    }
+  };
+  process.on('SIGTERM', encerrar);
+
+  // As requisições são processadas em série: o pool nunca envia uma nova
+  // antes de receber a resposta da anterior.
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  rl.on('close', encerrar);
+
+  responder({ ready: true });
+
+  for await (const linha of rl) {
+    if (!linha.trim()) {
+      continue;
+    }
+    let requisicao;
+    try {
+      requisicao = JSON.parse(linha);
+    } catch (e) {
+      responder({ id: null, ok: false, error: `Requisição inválida: ${e.message}` });
+      continue;
+    }
+    const resultado = await page.evaluate(async (codigo) => {
+      try {
+        await window.mermaid.parse(codigo);
+        return { ok: true };
+      } catch (e) {
+        return { ok: false, error: String((e && (e.message || e.str)) || e) };
+      }
+    }, requisicao.code);
+    responder({ id: requisicao.id, ...resultado });
+  }
+}
+
+main().catch((e) => {
+  process.stderr.write(`Falha no worker Mermaid: ${e && e.stack ? e.stack : e}\n`);
+  process.exit(1);
+});
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import subprocess
+from dotenv import load_dotenv
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "mermaid_worker.js")
+
+# Após este número de falhas seguidas ao iniciar um worker, o pool é desativado
+# e o validador passa a usar apenas o caminho via subprocesso do mmdc.
+MAX_FALHAS_INICIALIZACAO = 3
+
+
+class WorkerIndisponivelError(RuntimeError):
+    """Nenhum worker do pool pôde atender a requisição."""
+
+
+class _MermaidWorker:
+    """Um processo Node com Chromium aquecido que valida diagramas via stdin/stdout."""
+
+    def __init__(self, node_path: str, timeout_inicializacao: float):
+        self._respostas = queue.Queue()
+        self._proximo_id = 0
+        self.processo = subprocess.Popen(
+            [node_path, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            cwd=os.path.dirname(__file__),
+        )
+        self._leitor = threading.Thread(target=self._ler_saida, daemon=True)
+        self._leitor.start()
+
+        pronto = self._aguardar_resposta(timeout_inicializacao)
+        if not pronto or not pronto.get("ready"):
+            self.encerrar()
+            raise WorkerIndisponivelError("O worker Mermaid não ficou pronto a tempo.")
+
+    def _ler_saida(self):
+        """Encaminha cada linha do stdout do worker para a fila de respostas."""
+        for linha in self.processo.stdout:
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                self._respostas.put(json.loads(linha))
+            except json.JSONDecodeError:
+                continue
+        # EOF: o processo terminou, acorda quem estiver esperando
+        self._respostas.put(None)
+
+    def _aguardar_resposta(self, timeout: float):
+        try:
+            return self._respostas.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def esta_vivo(self) -> bool:
+        return self.processo.poll() is None
+
+    def validar(self, codigo_mermaid: str, timeout: float) -> tuple[bool, str]:
+        """Envia um diagrama ao worker e devolve (válido, mensagem de erro)."""
+        self._proximo_id += 1
+        requisicao_id = self._proximo_id
+        try:
+            self.processo.stdin.write(json.dumps({"id": requisicao_id, "code": codigo_mermaid}) + "\n")
+            self.processo.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerIndisponivelError(f"Falha ao enviar o diagrama ao worker: {e}")
+
+        resposta = self._aguardar_resposta(timeout)
+        if resposta is None or resposta.get("id") != requisicao_id:
+            raise WorkerIndisponivelError("O worker Mermaid não respondeu ou encerrou inesperadamente.")
+        return bool(resposta.get("ok")), resposta.get("error", "")
+
+    def encerrar(self):
+        if self.esta_vivo():
+            try:
+                self.processo.stdin.close()
+                self.processo.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.processo.kill()
+
+
+class MermaidWorkerPool:
+    """
+    Pool de workers Node/Chromium que permanecem ativos entre validações,
+    evitando o custo de iniciar o mmdc (Node + Chromium) a cada verificação.
+
+    Os workers são criados sob demanda até `tamanho`. Um worker que trava ou
+    encerra é descartado e substituído na próxima requisição.
+    """
+
+    def __init__(self, tamanho: int = None, timeout: float = None, timeout_inicializacao: float = None, node_path: str = None):
+        self.tamanho = tamanho if tamanho is not None else int(os.getenv("MERMAID_POOL_SIZE", "2"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("MERMAID_POOL_TIMEOUT", "30"))
+        self.timeout_inicializacao = (
+            timeout_inicializacao if timeout_inicializacao is not None
+            else float(os.getenv("MERMAID_POOL_STARTUP_TIMEOUT", "60"))
+        )
+        self.node_path = node_path or os.getenv("MERMAID_NODE_BIN", "node")
+
+        self._ociosos = queue.Queue()
+        self._lock = threading.Lock()
+        self._criados = 0
+        self._falhas_inicializacao = 0
+        self._encerrado = False
+        self.reinicios = 0
+
+    @property
+    def ativo(self) -> bool:
+        return (
+            not self._encerrado
+            and self.tamanho > 0
+            and self._falhas_inicializacao < MAX_FALHAS_INICIALIZACAO
+        )
+
+    def _obter_worker(self) -> _MermaidWorker:
+        prazo = time.monotonic() + self.timeout
+        espera = 0
+        while True:
+            try:
+                worker = self._ociosos.get(timeout=espera) if espera else self._ociosos.get_nowait()
+            except queue.Empty:
+                worker = None
+            if worker is not None:
+                if worker.esta_vivo():
+                    return worker
+                # O worker morreu enquanto estava ocioso; libera a vaga para um novo
+                self._descartar_worker(worker)
+                continue
+
+            with self._lock:
+                pode_criar = self._criados < self.tamanho
+                if pode_criar:
+                    self._criados += 1
+            if pode_criar:
+                break
+
+            # Espera em intervalos curtos: uma vaga também é liberada por um worker que
+            # falha ao iniciar, e nesse caso nada volta à fila de ociosos
+            if not self.ativo:
+                raise WorkerIndisponivelError("O pool de workers Mermaid está desativado.")
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                raise WorkerIndisponivelError("Todos os workers Mermaid estão ocupados.")
+            espera = min(0.1, restante)
+
+        try:
+            worker = _MermaidWorker(self.node_path, self.timeout_inicializacao)
+        except (OSError, WorkerIndisponivelError) as e:
+            with self._lock:
+                self._criados -= 1
+                self._falhas_inicializacao += 1
+            raise WorkerIndisponivelError(f"Não foi possível iniciar um worker Mermaid: {e}")
+
+        with self._lock:
+            self._falhas_inicializacao = 0
+        return worker
+
+    def _descartar_worker(self, worker: _MermaidWorker):
+        worker.encerrar()
+        with self._lock:
+            self._criados -= 1
+            self.reinicios += 1
+
+    def validar(self, codigo_mermaid: str) -> tuple[bool, str]:
+        """
+        Valida o código em um worker do pool.
+
+        Returns:
+            Uma tupla (válido, mensagem de erro).
+
+        Raises:
+            WorkerIndisponivelError: Se o pool estiver desativado ou nenhum worker
+            conseguir responder; o chamador deve recorrer ao mmdc via subprocesso.
+        """
+        if not self.ativo:
+            raise WorkerIndisponivelError("O pool de workers Mermaid está desativado.")
+
+        # Uma segunda tentativa cobre o caso de um worker que caiu entre duas
+        # requisições; ele é substituído por um novo processo.
+        for tentativa in range(2):
+            worker = self._obter_worker()
+            try:
+                resultado = worker.validar(codigo_mermaid, self.timeout)
+                break
+            except WorkerIndisponivelError:
+                self._descartar_worker(worker)
+                if tentativa == 1:
+                    raise
+
+        if worker.esta_vivo() and not self._encerrado:
+            self._ociosos.put(worker)
+        else:
+            self._descartar_worker(worker)
+        return resultado
+
+    def encerrar(self):
+        """Encerra todos os workers ociosos e impede novas validações."""
+        self._encerrado = True
+        while True:
+            try:
+                worker = self._ociosos.get_nowait()
+            except queue.Empty:
+                break
+            worker.encerrar()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> MermaidWorkerPool:
+    """Retorna o pool compartilhado do processo, criando-o na primeira chamada."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MermaidWorkerPool()
+            atexit.register(_pool.encerrar)
+        return _pool
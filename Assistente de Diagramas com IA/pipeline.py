@@ -0,0 +1,390 @@
+"""
+Pipeline assíncrono de geração de diagramas.
+
+Reproduz o fluxo da aba "Gerar Diagrama" do app.py (analista → verificador de
+plano → crítico → desenhista → validador → corretor) usando as versões assíncronas dos agentes,
+de modo que vários pipelines possam rodar ao mesmo tempo em um único event loop.
+
+Com `streaming=True`, o código do desenhista e do corretor é repassado a
+`on_codigo_parcial` à medida que chega, e a geração do desenhista é
+interrompida assim que as primeiras linhas já têm um erro de sintaxe
+definitivo; o código parcial segue direto para o corretor, junto com o plano.
+
+Com `candidatos > 1`, quando o plano não pode ser compilado sem o LLM, o
+desenhista gera vários candidatos ao mesmo tempo (temperaturas e sementes
+diferentes), cada um validado assim que fica pronto; o primeiro válido vence e
+os demais são cancelados. Isso troca tokens por latência: um primeiro rascunho
+inválido não custa mais uma rodada serial de correção.
+
+O número de ciclos de qualidade e de tentativas de correção é decidido pelo
+orçamento de refinamento (ver `refinement_budget`): os máximos passados ao
+pipeline são a base, encerrada antes quando o plano converge e estendida
+quando há progresso mensurável, dentro do prazo e do teto de tokens.
+"""
+import os
+import json
+import time
+import asyncio
+from agente_analista import analisar_prompt_e_criar_plano_async
+from agente_critico import criticar_plano_de_design_async
+from agente_desenhista import (
+    desenhar_diagrama_com_plano_async, desenhar_diagrama_com_plano_astream, tentar_compilar, estimar_tokens
+)
+from agente_corretor import corrigir_diagrama_mermaid_async, corrigir_diagrama_mermaid_astream
+from agente_validador import validar_diagrama_mermaid
+from mermaid_parser import erros_no_prefixo, formatar_diagnosticos
+from plan_checker import verificar_plano
+import refinement_budget
+from refinement_budget import OrcamentoDeRefinamento
+from request_trace import rastrear_requisicao, medir_etapa
+from tracing import span
+
+# Geração especulativa de candidatos do desenhista (1 = desativada)
+CANDIDATOS = int(os.getenv("PIPELINE_CANDIDATES", "1"))
+TEMPERATURAS_CANDIDATOS = [float(t) for t in os.getenv("PIPELINE_CANDIDATE_TEMPERATURES", "0,0.3,0.6,0.9").split(",")]
+# Teto estimado de tokens para o conjunto de candidatos (0 = sem teto)
+LIMITE_TOKENS_CANDIDATOS = int(os.getenv("PIPELINE_CANDIDATES_MAX_TOKENS", "0"))
+
+
+class DiagramPipeline:
+    """
+    Executa o ciclo completo de criação de um diagrama para um prompt.
+
+    Args:
+        max_ciclos_refinamento: Ciclos crítico ↔ analista da base do orçamento de refinamento.
+        max_tentativas_sintaxe: Tentativas de correção de sintaxe da base do orçamento.
+        on_log: Função opcional chamada a cada nova mensagem de log.
+        streaming: Usa as versões em streaming do desenhista e do corretor.
+        on_codigo_parcial: Função opcional chamada com o código parcial durante o streaming.
+        cancelar_cedo: Interrompe o desenhista quando as linhas já geradas têm erro de sintaxe.
+        candidatos: Número de candidatos gerados em paralelo pelo desenhista (padrão: PIPELINE_CANDIDATES).
+        limite_tokens_candidatos: Teto estimado de tokens do conjunto de candidatos; reduz o
+            número de candidatos quando excedido (padrão: PIPELINE_CANDIDATES_MAX_TOKENS, 0 = sem teto).
+        prazo_s: Prazo da requisição para novos ciclos e correções (padrão: REQUEST_DEADLINE_S, 0 = sem prazo).
+        limite_tokens: Teto de tokens da requisição (padrão: REQUEST_MAX_TOKENS, 0 = sem teto).
+        orcamento_adaptativo: Encerra ou estende os ciclos pela convergência do plano
+            (padrão: REFINEMENT_ADAPTIVE); False mantém os máximos fixos.
+    """
+
+    def __init__(self, max_ciclos_refinamento: int = 3, max_tentativas_sintaxe: int = 3, on_log=None,
+                 streaming: bool = False, on_codigo_parcial=None, cancelar_cedo: bool = True,
+                 candidatos: int = None, limite_tokens_candidatos: int = None, prazo_s: float = None,
+                 limite_tokens: int = None, orcamento_adaptativo: bool = None):
+        self.max_ciclos_refinamento = max_ciclos_refinamento
+        self.max_tentativas_sintaxe = max_tentativas_sintaxe
+        self.on_log = on_log
+        self.streaming = streaming
+        self.on_codigo_parcial = on_codigo_parcial
+        self.cancelar_cedo = cancelar_cedo
+        self.candidatos = max(1, candidatos if candidatos is not None else CANDIDATOS)
+        self.limite_tokens_candidatos = (
+            limite_tokens_candidatos if limite_tokens_candidatos is not None else LIMITE_TOKENS_CANDIDATOS
+        )
+        self.prazo_s = prazo_s
+        self.limite_tokens = limite_tokens
+        self.orcamento_adaptativo = orcamento_adaptativo
+
+    def _log(self, resultado: dict, mensagem: str):
+        resultado["log_messages"].append(mensagem)
+        if self.on_log:
+            self.on_log(mensagem)
+
+    async def run(self, prompt_usuario: str) -> dict:
+        """
+        Executa o pipeline para um prompt.
+
+        Returns:
+            Um dicionário com `status` ("sucesso", "falha_analise" ou "falha_sintaxe"),
+            `mermaid_code`, `plano`, `plano_aprovado`, `log_messages`, `erros`
+            (mensagens destinadas ao usuário), `candidatos` (estatísticas da
+            geração especulativa, ou None se ela não foi usada), `orcamento` (ciclos e
+            tentativas usados, economizados e o motivo de cada parada; ver
+            `refinement_budget.OrcamentoDeRefinamento.relatorio`) e `trace` (tokens,
+            custo e latência de cada chamada; ver `request_trace.RequestTrace.to_dict`).
+        """
+        resultado = {
+            "status": "executando",
+            "mermaid_code": None,
+            "plano": None,
+            "plano_aprovado": False,
+            "log_messages": [],
+            "erros": [],
+            "candidatos": None,
+            "orcamento": None,
+            "trace": None,
+        }
+        with rastrear_requisicao(prompt_usuario) as trace, span("pipeline.run", requisicao=trace.id) as raiz:
+            orcamento = OrcamentoDeRefinamento(
+                self.max_ciclos_refinamento, self.max_tentativas_sintaxe, prazo_s=self.prazo_s,
+                limite_tokens=self.limite_tokens, adaptativo=self.orcamento_adaptativo,
+            )
+            await self._executar(prompt_usuario, resultado, orcamento)
+            resultado["orcamento"] = orcamento.relatorio()
+            refinement_budget.registrar(resultado["orcamento"])
+            trace.finalizar(resultado["status"])
+            raiz.definir_atributos(status=resultado["status"], plano_aprovado=resultado["plano_aprovado"])
+        resultado["trace"] = trace.to_dict()
+        return resultado
+
+    async def _executar(self, prompt_usuario: str, resultado: dict, orcamento: OrcamentoDeRefinamento):
+        self._log(resultado, "▶️ **Iniciando processo**: Prompt do usuário recebido.")
+
+        plano_atual = await self._criar_plano(prompt_usuario, resultado, orcamento)
+        if plano_atual is None:
+            return
+        resultado["plano"] = plano_atual
+
+        codigo_atual = await self._desenhar(plano_atual, resultado)
+        await self._validar_e_corrigir(codigo_atual, resultado, orcamento)
+
+    async def _criar_plano(self, prompt_usuario: str, resultado: dict, orcamento: OrcamentoDeRefinamento):
+        """Etapas 1 a 3: plano inicial e ciclos de crítica e refinamento."""
+        plano_atual, log_analista = await analisar_prompt_e_criar_plano_async(prompt_usuario)
+        self._log(resultado, log_analista)
+
+        if "erro" in plano_atual:
+            resultado["status"] = "falha_analise"
+            resultado["erros"].append("O Agente Analista falhou em criar o plano inicial.")
+            self._log(resultado, "❌ **Processo finalizado com falha crítica na análise.**")
+            return None
+
+        while orcamento.permite_ciclo():
+            with span("pipeline.ciclo_qualidade", ciclo=orcamento.ciclos_usados) as ciclo_span:
+                self._log(resultado, f"▶️ **Ciclo de Qualidade {orcamento.rotulo_ciclo()}**: Verificando a estrutura do plano.")
+                plano_atual = self._reparar(plano_atual, resultado)
+                verificacao = verificar_plano(plano_atual, reparar=False)
+                ciclo_span.definir_atributo("criticas_estruturais", len(verificacao.criticas))
+                plano_atual_str = json.dumps(plano_atual, indent=2)
+
+                if verificacao.criticas:
+                    # Problemas mecânicos: vão direto para o analista, sem gastar uma chamada ao crítico
+                    criticas_list = verificacao.criticas
+                    self._log(resultado, f"⚠️ **Verificador de Plano**: Problemas estruturais encontrados. Críticas: {', '.join(criticas_list)}")
+                else:
+                    self._log(resultado, "▶️ **Estrutura válida**: Acionando Agente Crítico.")
+                    critica, log_critico = await criticar_plano_de_design_async(prompt_usuario, plano_atual_str)
+                    self._log(resultado, log_critico)
+                    ciclo_span.definir_atributo("critico.status", critica.get("status"))
+
+                    if critica.get("status") == "Aprovado":
+                        self._log(resultado, "✅ **Agente Crítico**: Plano de design aprovado.")
+                        resultado["plano_aprovado"] = True
+                        orcamento.encerrar_ciclos("aprovado")
+                        break
+                    elif critica.get("status") == "Requer Refinamento":
+                        criticas_list = critica.get('criticas', [])
+                        self._log(resultado, f"⚠️ **Agente Crítico**: Plano requer refinamento. Críticas: {', '.join(criticas_list)}")
+                    else:
+                        resultado["erros"].append("O Agente Crítico encontrou um erro inesperado.")
+                        self._log(resultado, f"❌ **Processo finalizado com falha crítica na auditoria.** Detalhes: {critica.get('criticas', ['N/A'])}")
+                        orcamento.encerrar_ciclos("falha do crítico")
+                        break
+
+                plano_refinado, log_analista_refino = await analisar_prompt_e_criar_plano_async(
+                    prompt_usuario=prompt_usuario,
+                    plano_anterior_str=plano_atual_str,
+                    criticas=criticas_list
+                )
+                self._log(resultado, log_analista_refino)
+                if "erro" in plano_refinado:
+                    # Mantém o último plano válido em vez de desenhar a partir do erro
+                    resultado["erros"].append("O Agente Analista falhou durante o ciclo de refinamento.")
+                    self._log(resultado, "❌ **Processo finalizado com falha crítica no refinamento.**")
+                    orcamento.encerrar_ciclos("falha do analista")
+                    break
+                registro = orcamento.registrar_refinamento(plano_atual, plano_refinado, criticas_list)
+                ciclo_span.definir_atributos(diferenca=registro.diferenca, sobreposicao=registro.sobreposicao)
+                plano_atual = plano_refinado
+        else:
+            self._log_fim_dos_ciclos(resultado, orcamento)
+
+        if not resultado["plano_aprovado"]:
+            # O último refinamento não passou por um ciclo; ao menos os reparos automáticos são aplicados
+            plano_atual = self._reparar(plano_atual, resultado)
+            self._log(resultado, "⚠️ **Aviso**: O plano não foi formalmente aprovado. Prosseguindo com a melhor versão disponível após os ciclos de refinamento.")
+        return plano_atual
+
+    def _log_fim_dos_ciclos(self, resultado: dict, orcamento: OrcamentoDeRefinamento):
+        economizados = orcamento.ciclos_economizados()
+        mensagem = f"⏹️ **Orçamento de Refinamento**: Ciclos de qualidade encerrados após {orcamento.ciclos_usados}: {orcamento.motivo_ciclos}."
+        if economizados:
+            mensagem += f" {economizados} ciclo(s) economizado(s)."
+        self._log(resultado, mensagem)
+
+    def _reparar(self, plano: dict, resultado: dict) -> dict:
+        """Aplica os reparos automáticos do verificador de plano."""
+        verificacao = verificar_plano(plano)
+        if verificacao.reparos:
+            self._log(resultado, f"🔧 **Verificador de Plano**: Reparos automáticos aplicados: {' '.join(verificacao.reparos)}")
+        return verificacao.plano
+
+    async def _desenhar(self, plano: dict, resultado: dict) -> str:
+        """Etapa 4: o Agente Desenhista cria o código."""
+        log_desenho = "com plano aprovado" if resultado["plano_aprovado"] else "com a melhor versão do plano"
+        self._log(resultado, f"▶️ **Iniciando fase de desenho** {log_desenho}.")
+
+        if self.candidatos > 1:
+            compilado = tentar_compilar(plano)
+            if compilado is not None:
+                # Código determinístico: candidatos extras não trariam nada
+                codigo_atual, log_desenhista = compilado
+                self._log(resultado, log_desenhista)
+                return codigo_atual
+            return await self._desenhar_candidatos(plano, resultado)
+
+        if not self.streaming:
+            codigo_atual, log_desenhista = await desenhar_diagrama_com_plano_async(plano)
+            self._log(resultado, log_desenhista)
+            return codigo_atual
+
+        codigo_atual, log_desenhista, erros_antecipados = await self._consumir_stream(
+            desenhar_diagrama_com_plano_astream(plano), self.cancelar_cedo
+        )
+        if not erros_antecipados:
+            self._log(resultado, log_desenhista)
+            return codigo_atual
+
+        # As primeiras linhas já são inválidas: não vale a pena esperar o restante
+        mensagem_erro = formatar_diagnosticos(erros_antecipados)
+        self._log(resultado, f"⏹️ **Agente Desenhista**: Geração interrompida na linha {erros_antecipados[0].linha} por erro de sintaxe. Erro: {mensagem_erro}")
+        self._log(resultado, "▶️ **Iniciando correção do código parcial** com o plano de design...")
+        return await self._corrigir(codigo_atual, mensagem_erro, resultado, plano)
+
+    def _numero_de_candidatos(self, plano: dict, resultado: dict) -> int:
+        if self.limite_tokens_candidatos <= 0:
+            return self.candidatos
+        estimativa = estimar_tokens(plano)
+        numero = max(1, min(self.candidatos, self.limite_tokens_candidatos // max(1, estimativa)))
+        if numero < self.candidatos:
+            self._log(
+                resultado,
+                f"ℹ️ **Candidatos**: Reduzidos de {self.candidatos} para {numero} pelo teto de "
+                f"{self.limite_tokens_candidatos} tokens (~{estimativa} tokens por candidato)."
+            )
+        return numero
+
+    async def _desenhar_candidatos(self, plano: dict, resultado: dict) -> str:
+        """Gera candidatos em paralelo e devolve o primeiro válido (ou o de menor temperatura, se nenhum for)."""
+        numero = self._numero_de_candidatos(plano, resultado)
+        inicio = time.perf_counter()
+
+        async def candidato(indice: int):
+            temperatura = TEMPERATURAS_CANDIDATOS[indice % len(TEMPERATURAS_CANDIDATOS)]
+            with span("pipeline.candidato", candidato=indice, temperatura=temperatura) as candidato_span:
+                codigo, log_desenhista = await desenhar_diagrama_com_plano_async(
+                    plano, temperature=temperatura, seed=indice, compilar=False
+                )
+                with medir_etapa("validador"):
+                    valido, _, _ = await asyncio.to_thread(validar_diagrama_mermaid, codigo)
+                candidato_span.definir_atributo("valido", valido)
+            return indice, codigo, log_desenhista, valido, time.perf_counter() - inicio
+
+        self._log(resultado, f"▶️ **Agente Desenhista**: Gerando {numero} candidatos em paralelo.")
+        tarefas = [asyncio.create_task(candidato(indice)) for indice in range(numero)]
+        concluidos, vencedor = {}, None
+        try:
+            for proxima in asyncio.as_completed(tarefas):
+                indice, codigo, log_desenhista, valido, latencia = await proxima
+                concluidos[indice] = (codigo, log_desenhista, valido, latencia)
+                if valido:
+                    vencedor = indice
+                    break
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+
+        escolhido = vencedor if vencedor is not None else min(concluidos)
+        codigo, log_desenhista, _, latencia = concluidos[escolhido]
+        resultado["candidatos"] = {
+            "lancados": numero,
+            "concluidos": len(concluidos),
+            "vencedor": vencedor,
+            "latencia_vencedor_s": round(latencia, 3) if vencedor is not None else None,
+            "latencias_s": {indice: round(c[3], 3) for indice, c in sorted(concluidos.items())},
+        }
+        self._log(resultado, log_desenhista)
+        if vencedor is None:
+            self._log(resultado, f"⚠️ **Candidatos**: Nenhum dos {numero} candidatos é válido. Seguindo com o candidato {escolhido} para correção.")
+        else:
+            temperatura = TEMPERATURAS_CANDIDATOS[vencedor % len(TEMPERATURAS_CANDIDATOS)]
+            comparacao = ""
+            if vencedor != 0 and 0 in concluidos:
+                # O candidato de temperatura zero é o que o fluxo sequencial usaria
+                comparacao = " O candidato 0 (fluxo sequencial) era inválido e exigiria ao menos uma rodada de correção."
+            elif vencedor != 0:
+                comparacao = " O candidato 0 (fluxo sequencial) ainda não havia terminado."
+            self._log(
+                resultado,
+                f"🏁 **Candidatos**: Candidato {vencedor} (temperatura {temperatura}) válido em {latencia:.2f}s; "
+                f"{numero - len(concluidos)} cancelado(s).{comparacao}"
+            )
+        return codigo
+
+    async def _corrigir(self, codigo_atual: str, mensagem_erro: str, resultado: dict, plano: dict = None) -> str:
+        if self.streaming:
+            codigo_corrigido, log_corretor, _ = await self._consumir_stream(
+                corrigir_diagrama_mermaid_astream(codigo_atual, mensagem_erro, plano), cancelar=False
+            )
+        else:
+            codigo_corrigido, log_corretor = await corrigir_diagrama_mermaid_async(codigo_atual, mensagem_erro, plano)
+        self._log(resultado, log_corretor)
+        return codigo_corrigido
+
+    async def _consumir_stream(self, gerador, cancelar: bool) -> tuple:
+        """
+        Consome um gerador `*_astream` de agente, repassando o código parcial.
+
+        Returns:
+            Uma tupla (código, mensagem de log, erros antecipados). Se a geração foi
+            interrompida, a mensagem de log é None e os erros não estão vazios.
+        """
+        codigo, linhas_analisadas = "", 0
+        try:
+            async for codigo, log_message in gerador:
+                if log_message is not None:
+                    return codigo, log_message, []
+                if self.on_codigo_parcial:
+                    self.on_codigo_parcial(codigo)
+                if cancelar:
+                    # Só reanalisa quando uma nova linha foi concluída
+                    linhas = codigo.count("\n")
+                    if linhas > linhas_analisadas:
+                        linhas_analisadas = linhas
+                        erros_antecipados = erros_no_prefixo(codigo)
+                        if erros_antecipados:
+                            return codigo, None, erros_antecipados
+        finally:
+            await gerador.aclose()
+        return codigo, None, []
+
+    async def _validar_e_corrigir(self, codigo_atual: str, resultado: dict, orcamento: OrcamentoDeRefinamento):
+        """Etapa 5: validação e correção de sintaxe, até o código ser válido ou o orçamento acabar."""
+        while True:
+            with span("pipeline.tentativa_sintaxe", tentativa=orcamento.tentativas + 1):
+                # O mmdc é bloqueante; roda em uma thread para não travar o event loop
+                with medir_etapa("validador"):
+                    valido, mensagem_erro, log_validador = await asyncio.to_thread(validar_diagrama_mermaid, codigo_atual)
+                self._log(resultado, log_validador)
+
+                if valido:
+                    resultado["status"] = "sucesso"
+                    resultado["mermaid_code"] = codigo_atual
+                    self._log(resultado, "✅ **Processo finalizado com sucesso.**")
+                    return
+
+                if not orcamento.permite_tentativa(codigo_atual, mensagem_erro):
+                    break
+                self._log(resultado, f"▶️ **Iniciando correção de sintaxe {orcamento.rotulo_tentativa()}**...")
+                codigo_atual = await self._corrigir(codigo_atual, mensagem_erro, resultado)
+
+        economizadas = orcamento.tentativas_economizadas()
+        self._log(
+            resultado,
+            f"⏹️ **Orçamento de Refinamento**: Correções encerradas após {orcamento.tentativas} tentativa(s): "
+            f"{orcamento.motivo_sintaxe}." + (f" {economizadas} tentativa(s) economizada(s)." if economizadas else "")
+        )
+        resultado["status"] = "falha_sintaxe"
+        resultado["mermaid_code"] = codigo_atual
+        resultado["erros"].append("Não foi possível gerar um diagrama com sintaxe válida após várias tentativas.")
+        self._log(resultado, "❌ **Processo finalizado com falha na correção de sintaxe.**")
@@ -0,0 +1,171 @@
+"""
+Verificação estrutural do plano de design, antes do Agente Crítico.
+
+Boa parte das críticas a um plano é mecânica: conexões para passos que não
+existem, passos inalcançáveis, decisões com menos de duas saídas, ids
+duplicados, ausência de início ou fim. Este módulo encontra esses problemas
+localmente, sem LLM:
+
+- Os que têm uma correção inequívoca são reparados no próprio plano
+  (ex: acrescentar um nó de início ou de fim, preencher um texto vazio).
+- Os demais viram críticas prontas, enviadas direto ao Agente Analista para
+  refinamento, sem gastar uma chamada ao Agente Crítico.
+"""
+import copy
+import unicodedata
+from dataclasses import dataclass, field
+from plan_compiler import TIPOS_DE_DECISAO
+
+
+@dataclass
+class ResultadoVerificacao:
+    """Resultado de `verificar_plano`: o plano (já com os reparos), os reparos feitos e as críticas restantes."""
+    plano: dict
+    reparos: list = field(default_factory=list)
+    criticas: list = field(default_factory=list)
+
+    @property
+    def aprovado(self) -> bool:
+        return not self.criticas
+
+
+def _tipo(passo: dict) -> str:
+    texto = unicodedata.normalize("NFKD", str(passo.get("tipo") or "")).encode("ascii", "ignore").decode("ascii")
+    return texto.strip().lower()
+
+
+def _id_livre(base: str, usados: set) -> str:
+    candidato, sufixo = base, 2
+    while candidato in usados:
+        candidato, sufixo = f"{base}{sufixo}", sufixo + 1
+    return candidato
+
+
+def verificar_plano(plano: dict, reparar: bool = True) -> ResultadoVerificacao:
+    """
+    Verifica a estrutura de um plano de design.
+
+    Args:
+        plano: O plano no formato do manual de design.
+        reparar: Aplica os reparos automáticos (em uma cópia do plano).
+
+    Returns:
+        Um `ResultadoVerificacao`. Se `criticas` não estiver vazia, o plano
+        precisa voltar ao Agente Analista.
+    """
+    resultado = ResultadoVerificacao(plano=copy.deepcopy(plano) if reparar else plano)
+    plano = resultado.plano
+    passos = plano.get("passos")
+    conexoes = plano.get("conexoes")
+    if not isinstance(passos, list) or not passos:
+        resultado.criticas.append("O plano não tem passos: inclua a lista 'passos' com as etapas do processo.")
+        return resultado
+    if conexoes is None:
+        conexoes = plano["conexoes"] = []
+    if not isinstance(conexoes, list):
+        resultado.criticas.append("O campo 'conexoes' deve ser uma lista de objetos com 'de', 'para' e 'label'.")
+        return resultado
+
+    passos_validos = [p for p in passos if isinstance(p, dict) and p.get("id") not in (None, "")]
+    if len(passos_validos) != len(passos):
+        resultado.criticas.append("Todos os passos devem ser objetos com 'id', 'tipo' e 'texto'.")
+
+    # Ids duplicados
+    ids, duplicados = set(), set()
+    for passo in passos_validos:
+        chave = str(passo["id"])
+        if chave in ids:
+            duplicados.add(chave)
+        ids.add(chave)
+    for chave in sorted(duplicados):
+        resultado.criticas.append(f"O id '{chave}' é usado por mais de um passo. Cada passo deve ter um id único.")
+
+    # Textos vazios
+    for passo in passos_validos:
+        if not str(passo.get("texto") or "").strip():
+            if reparar:
+                passo["texto"] = str(passo["id"])
+                resultado.reparos.append(f"Passo '{passo['id']}' sem texto: o id foi usado como texto.")
+            else:
+                resultado.criticas.append(f"O passo '{passo['id']}' não tem texto.")
+
+    # Conexões para passos inexistentes
+    saidas = {chave: [] for chave in ids}
+    entradas = {chave: 0 for chave in ids}
+    for conexao in conexoes:
+        if not isinstance(conexao, dict):
+            resultado.criticas.append(f"Conexão inválida: {conexao!r}. Use objetos com 'de', 'para' e 'label'.")
+            continue
+        origem, destino = str(conexao.get("de")), str(conexao.get("para"))
+        inexistentes = [extremidade for extremidade in (origem, destino) if extremidade not in ids]
+        if inexistentes:
+            resultado.criticas.append(
+                f"A conexão {origem} -> {destino} referencia o passo '{inexistentes[0]}', que não existe. "
+                "Crie o passo ou corrija a conexão."
+            )
+            continue
+        saidas[origem].append(conexao)
+        entradas[destino] += 1
+
+    # Início e fim
+    inicios = [p for p in passos_validos if _tipo(p) == "inicio"]
+    fins = [p for p in passos_validos if _tipo(p) == "fim"]
+    if not inicios:
+        # Liga o início apenas ao primeiro passo sem entradas; os demais continuam como inalcançáveis
+        raizes = ([p for p in passos_validos if entradas.get(str(p["id"]), 0) == 0] or passos_validos)[:1]
+        if reparar and raizes:
+            novo_id = _id_livre("Inicio", ids)
+            passos.insert(0, {"id": novo_id, "tipo": "inicio", "texto": "Início"})
+            ids.add(novo_id)
+            saidas[novo_id] = []
+            for raiz in raizes:
+                conexao = {"de": novo_id, "para": str(raiz["id"]), "label": ""}
+                conexoes.append(conexao)
+                saidas[novo_id].append(conexao)
+                entradas[str(raiz["id"])] += 1
+            inicios = [passos[0]]
+            resultado.reparos.append(f"Nó de início '{novo_id}' adicionado antes de {', '.join(str(r['id']) for r in raizes)}.")
+        else:
+            resultado.criticas.append("O plano não tem um passo do tipo 'inicio'.")
+    if not fins:
+        folhas = list({
+            str(p["id"]): p for p in passos_validos
+            if not saidas.get(str(p["id"])) and _tipo(p) != "inicio" and _tipo(p) not in TIPOS_DE_DECISAO
+        }.values())
+        if reparar and folhas:
+            novo_id = _id_livre("Fim", ids)
+            passos.append({"id": novo_id, "tipo": "fim", "texto": "Fim"})
+            ids.add(novo_id)
+            saidas[novo_id] = []
+            for folha in folhas:
+                conexao = {"de": str(folha["id"]), "para": novo_id, "label": ""}
+                conexoes.append(conexao)
+                saidas[str(folha["id"])].append(conexao)
+            resultado.reparos.append(f"Nó de fim '{novo_id}' adicionado após {', '.join(str(f['id']) for f in folhas)}.")
+        else:
+            resultado.criticas.append("O plano não tem um passo do tipo 'fim'.")
+
+    # Decisões precisam de pelo menos dois caminhos
+    for passo in passos_validos:
+        if _tipo(passo) in TIPOS_DE_DECISAO and len(saidas.get(str(passo["id"]), [])) < 2:
+            resultado.criticas.append(
+                f"A decisão '{passo['id']}' ({passo.get('texto', '')}) tem {len(saidas.get(str(passo['id']), []))} saída(s); "
+                "uma decisão deve ter pelo menos dois caminhos rotulados (ex: 'Sim' e 'Não')."
+            )
+
+    # Passos inalcançáveis a partir do início
+    visitados = set()
+    pendentes = [str(p["id"]) for p in inicios]
+    while pendentes:
+        atual = pendentes.pop()
+        if atual in visitados:
+            continue
+        visitados.add(atual)
+        pendentes.extend(str(c["para"]) for c in saidas.get(atual, []))
+    inalcancaveis = list(dict.fromkeys(str(p["id"]) for p in passos_validos if str(p["id"]) not in visitados))
+    if inicios and inalcancaveis:
+        resultado.criticas.append(
+            f"Os passos {', '.join(inalcancaveis)} não são alcançáveis a partir do início. Conecte-os ao fluxo ou remova-os."
+        )
+
+    return resultado
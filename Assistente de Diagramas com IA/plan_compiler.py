@@ -0,0 +1,180 @@
+"""
+Compilação determinística de um plano de design em código Mermaid.
+
+O plano produzido pelo Agente Analista (ver `manual_de_boas_praticas_design.md`)
+já descreve a orientação, os passos e as conexões do fluxograma; convertê-lo em
+Mermaid é mecânico. Este módulo faz a conversão sem chamar o LLM, aplicando as
+regras dos manuais (formas por tipo, textos sempre entre aspas, quebras de linha
+literais em vez de <br>, nada de `direction` em subgraphs) e confere o
+resultado com o `mermaid_parser` antes de devolvê-lo.
+
+Planos fora do formato (ids duplicados, conexões para passos inexistentes,
+orientação desconhecida...) levantam `PlanoIncompativelError`; nesse caso o
+Agente Desenhista usa o LLM.
+"""
+import re
+import unicodedata
+from mermaid_parser import analisar_flowchart, erros, formatar_diagnosticos, DIRECOES_VALIDAS, RE_BR
+
+# Tipos desenhados como losango; o `plan_checker` usa o mesmo conjunto para as decisões
+TIPOS_DE_DECISAO = {"decisao", "condicao"}
+
+# tipo normalizado -> (abertura, fechamento, classe)
+FORMAS_POR_TIPO = {
+    "inicio": ("([", "])", "inicioFim"),
+    "fim": ("([", "])", "inicioFim"),
+    "processo": ("(", ")", "processo"),
+    "acao": ("(", ")", "processo"),
+    **{tipo: ("{", "}", "decisao") for tipo in TIPOS_DE_DECISAO},
+    "dados": ("[", "]", "dados"),
+    "entrada": ("[", "]", "dados"),
+    "saida": ("[", "]", "dados"),
+    "documento": ("[", "]", "dados"),
+    "subprocesso": ("[[", "]]", "processo"),
+    "banco_de_dados": ("[(", ")]", "dados"),
+}
+FORMA_PADRAO = FORMAS_POR_TIPO["processo"]
+
+CLASSES = {
+    "inicioFim": "fill:#e8f5e9,stroke:#2e7d32,stroke-width:2px",
+    "processo": "fill:#e0f7fa,stroke:#00796b,stroke-width:1px",
+    "decisao": "fill:#fff9c4,stroke:#fbc02d,stroke-width:2px",
+    "dados": "fill:#e3f2fd,stroke:#1565c0,stroke-width:1px",
+}
+
+# Conexão padrão e variações aceitas no campo opcional "tipo" das conexões
+SETAS = {"": "-->", "seta": "-->", "tracejada": "-.->", "pontilhada": "-.->", "grossa": "==>", "linha": "---"}
+
+# Palavras que o Mermaid não aceita como id de nó
+IDS_RESERVADOS = {"end", "graph", "flowchart", "subgraph", "class", "classdef", "style", "linkstyle", "click", "default", "direction"}
+RE_ID_SEGURO = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class PlanoIncompativelError(ValueError):
+    """O plano não segue o formato esperado e não pode ser compilado."""
+
+
+def _normalizar(texto) -> str:
+    """Minúsculas, sem acentos e com "_" no lugar de espaços ("Decisão" -> "decisao")."""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[\s/-]+", "_", texto.strip().lower())
+
+
+def escapar_texto(texto) -> str:
+    """Prepara um texto para ficar entre aspas duplas em um nó ou rótulo."""
+    texto = RE_BR.sub("\n", str(texto)).strip()
+    return texto.replace('"', "#quot;").replace("|", "#124;")
+
+
+class _Compilador:
+    def __init__(self, plano: dict):
+        if not isinstance(plano, dict):
+            raise PlanoIncompativelError("O plano deve ser um objeto JSON.")
+        self.plano = plano
+        self.ids = {}
+        self.usados = set()
+        self.linhas = []
+
+    def _id_seguro(self, original) -> str:
+        # Ids apenas com ASCII: "Área logada" -> "Area_logada"
+        texto = unicodedata.normalize("NFKD", str(original).strip()).encode("ascii", "ignore").decode("ascii")
+        base = re.sub(r"[^A-Za-z0-9_]", "_", texto)
+        if not base:
+            raise PlanoIncompativelError("Passo sem id.")
+        if not RE_ID_SEGURO.match(base) or base.lower() in IDS_RESERVADOS:
+            base = f"n_{base}"
+        candidato, sufixo = base, 2
+        while candidato in self.usados:
+            candidato, sufixo = f"{base}_{sufixo}", sufixo + 1
+        self.usados.add(candidato)
+        return candidato
+
+    def compilar(self) -> str:
+        orientacao = str(self.plano.get("orientacao") or "TD").strip().upper()
+        if orientacao not in DIRECOES_VALIDAS:
+            raise PlanoIncompativelError(f"Orientação '{orientacao}' desconhecida.")
+
+        passos = self.plano.get("passos")
+        if not isinstance(passos, list) or not passos:
+            raise PlanoIncompativelError("O plano não tem passos.")
+        conexoes = self.plano.get("conexoes") or []
+        if not isinstance(conexoes, list):
+            raise PlanoIncompativelError("O campo 'conexoes' deve ser uma lista.")
+
+        for passo in passos:
+            if not isinstance(passo, dict) or passo.get("id") in (None, ""):
+                raise PlanoIncompativelError(f"Passo inválido: {passo!r}")
+            chave = str(passo["id"])
+            if chave in self.ids:
+                raise PlanoIncompativelError(f"Id de passo duplicado: '{chave}'.")
+            self.ids[chave] = self._id_seguro(chave)
+
+        self.linhas.append(f"graph {orientacao}")
+        classes_usadas = {}
+        for grupo, passos_do_grupo in self._agrupar(passos):
+            recuo = "    "
+            if grupo is not None:
+                self.linhas.append(f'    subgraph {self._id_seguro(f"sg_{grupo}")} ["{escapar_texto(grupo)}"]')
+                recuo = "        "
+            for passo in passos_do_grupo:
+                abertura, fechamento, classe = FORMAS_POR_TIPO.get(_normalizar(passo.get("tipo") or "processo"), FORMA_PADRAO)
+                texto = escapar_texto(passo.get("texto") or passo["id"])
+                no = self.ids[str(passo["id"])]
+                self.linhas.append(f'{recuo}{no}{abertura}"{texto}"{fechamento}')
+                classes_usadas.setdefault(classe, []).append(no)
+            if grupo is not None:
+                self.linhas.append("    end")
+
+        for conexao in conexoes:
+            self.linhas.append("    " + self._conexao(conexao))
+
+        for classe, nos in classes_usadas.items():
+            self.linhas.append(f"    classDef {classe} {CLASSES[classe]}")
+            self.linhas.append(f"    class {','.join(nos)} {classe}")
+
+        codigo = "\n".join(self.linhas)
+        problemas = erros(analisar_flowchart(codigo))
+        if problemas:
+            # Não deve acontecer; se acontecer, o LLM assume em vez de entregar código inválido
+            raise PlanoIncompativelError(f"O código compilado não passou na pré-validação:\n{formatar_diagnosticos(problemas)}")
+        return codigo
+
+    def _agrupar(self, passos: list) -> list:
+        """Agrupa os passos pelo campo opcional "subgrafo" (ou "grupo"), mantendo a ordem de aparição."""
+        grupos = {}
+        for passo in passos:
+            grupo = passo.get("subgrafo") or passo.get("grupo")
+            grupos.setdefault(str(grupo) if grupo else None, []).append(passo)
+        return list(grupos.items())
+
+    def _conexao(self, conexao) -> str:
+        if not isinstance(conexao, dict):
+            raise PlanoIncompativelError(f"Conexão inválida: {conexao!r}")
+        origem, destino = str(conexao.get("de")), str(conexao.get("para"))
+        for extremidade in (origem, destino):
+            if extremidade not in self.ids:
+                raise PlanoIncompativelError(f"A conexão {origem} -> {destino} usa o passo inexistente '{extremidade}'.")
+        seta = SETAS.get(_normalizar(conexao.get("tipo") or ""))
+        if seta is None:
+            raise PlanoIncompativelError(f"Tipo de conexão '{conexao.get('tipo')}' desconhecido.")
+        rotulo = escapar_texto(conexao.get("label") or "")
+        rotulo = f'|"{rotulo}"|' if rotulo else ""
+        return f"{self.ids[origem]} {seta}{rotulo} {self.ids[destino]}"
+
+
+def compilar_plano(plano: dict) -> str:
+    """
+    Converte um plano de design em código Mermaid válido.
+
+    Args:
+        plano: O plano no formato do manual de design (orientacao, passos, conexoes).
+            Campos opcionais: "subgrafo" nos passos e "tipo" nas conexões
+            ("tracejada", "grossa", "linha").
+
+    Returns:
+        O código Mermaid.
+
+    Raises:
+        PlanoIncompativelError: Se o plano não puder ser compilado.
+    """
+    return _Compilador(plano).compilar()
@@ -0,0 +1,211 @@
+"""
+Montagem dos prompts dos agentes.
+
+Os provedores (Azure OpenAI incluído) reaproveitam o processamento do início
+idêntico de prompts recentes ("prompt caching"), desde que o prefixo comum seja
+longo o bastante. Por isso as mensagens são montadas sempre na mesma ordem:
+
+1. As fontes de conhecimento imutáveis (manuais e documentação do MCP), em uma
+   ordem canônica, para que agentes que usam as mesmas fontes compartilhem o prefixo.
+2. As instruções fixas do agente.
+3. Por último, na mensagem do usuário, todo o conteúdo variável (prompt,
+   plano, código, mensagem de erro).
+
+Cada template tem uma versão e um hash do seu texto, que identificam o prompt
+em caches de respostas e nas métricas.
+"""
+import json
+import hashlib
+import functools
+from dataclasses import dataclass, field
+from mcp_client import get_library_docs
+from knowledge_assets import get_assets
+
+
+def _hash_texto(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _documentacao_mermaid() -> str:
+    # Buscada uma vez por processo: o prefixo fica estável e cada prompt não refaz a chamada ao MCP
+    return get_library_docs('/mermaid-js/mermaid', topic='flowchart syntax')
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_documentacao_mermaid() -> str:
+    return _hash_texto(_documentacao_mermaid())
+
+
+def _hash_arquivo(nome: str) -> str:
+    try:
+        return get_assets().hash(nome)
+    except FileNotFoundError:
+        return "ausente"
+
+
+# Fontes de conhecimento, na ordem em que aparecem no prefixo: (título, conteúdo, hash do conteúdo)
+FONTES = {
+    "manual_design": (
+        "MANUAL DE DESIGN",
+        lambda: get_assets().conteudo("manual_de_boas_praticas_design.md", "Manual de design não encontrado."),
+        lambda: _hash_arquivo("manual_de_boas_praticas_design.md"),
+    ),
+    "manual_mermaid": (
+        "MANUAL DE BOAS PRÁTICAS",
+        lambda: get_assets().conteudo("manual_de_boas_praticas_mermaid.md", "Manual de boas práticas não encontrado."),
+        lambda: _hash_arquivo("manual_de_boas_praticas_mermaid.md"),
+    ),
+    "docs_mermaid": (
+        "DOCUMENTAÇÃO DE REFERÊNCIA (MERMAID)",
+        _documentacao_mermaid,
+        _hash_documentacao_mermaid,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Template de prompt de um agente.
+
+    Args:
+        nome: Identificador do template (ex: "corretor").
+        versao: Versão do template; incremente ao alterar o texto.
+        instrucoes: Instruções fixas do agente (sem variáveis).
+        entrada: Modelo da mensagem do usuário, preenchido com `str.format`.
+        fontes: Nomes das fontes de conhecimento (chaves de `FONTES`) incluídas no prefixo.
+    """
+    nome: str
+    versao: str
+    instrucoes: str
+    entrada: str = "{entrada}"
+    fontes: tuple = field(default_factory=tuple)
+
+    @property
+    def hash(self) -> str:
+        """Hash do texto do template (não inclui o conteúdo das fontes)."""
+        conteudo = json.dumps([self.nome, self.versao, self.instrucoes, self.entrada, list(self.fontes)], ensure_ascii=False)
+        return _hash_texto(conteudo)[:12]
+
+    def hash_do_prefixo(self) -> str:
+        """Hash do template combinado com o conteúdo atual das fontes; muda quando um manual é editado."""
+        partes = [self.hash] + [FONTES[nome][2]() for nome in FONTES if nome in self.fontes]
+        return _hash_texto("|".join(partes))[:16]
+
+    def prefixo(self) -> str:
+        """A mensagem de sistema: fontes de conhecimento seguidas das instruções."""
+        secoes = []
+        for nome in FONTES:
+            if nome in self.fontes:
+                titulo, carregar, _ = FONTES[nome]
+                secoes.append(f"--- INÍCIO DO {titulo} ---\n{carregar().strip()}\n--- FIM DO {titulo} ---")
+        secoes.append(self.instrucoes.strip())
+        return "\n\n".join(secoes)
+
+    def mensagens(self, **variaveis) -> list:
+        """Monta as mensagens system/user da chamada."""
+        return [
+            {"role": "system", "content": self.prefixo()},
+            {"role": "user", "content": self.entrada.format(**variaveis)},
+        ]
+
+
+ANALISTA_CRIACAO = PromptTemplate(
+    nome="analista",
+    versao="2",
+    fontes=("manual_design",),
+    instrucoes="""
+Você é um especialista em Análise e Design de Processos. Sua tarefa é converter a descrição de um processo, fornecida pelo usuário, em um plano de design estruturado em JSON.
+
+Siga RIGOROSAMENTE as regras e a estrutura de saída definidas no manual de design acima.
+
+Analise o prompt do usuário e gere APENAS o objeto JSON correspondente ao plano de design.
+""",
+    entrada="{prompt_usuario}",
+)
+
+ANALISTA_REFINO = PromptTemplate(
+    nome="analista_refino",
+    versao="2",
+    fontes=("manual_design",),
+    instrucoes="""
+Você é um especialista em Análise e Design de Processos. Sua tarefa é refinar um "Plano de Design" JSON com base em uma lista de "Críticas".
+O objetivo é garantir que o plano final seja uma representação fiel e completa do "Prompt Original" do usuário.
+
+Siga RIGOROSAMENTE as regras do manual de design acima para manter a consistência.
+
+Analise o plano anterior e as críticas, e gere uma nova versão do plano em JSON que resolva TODOS os pontos levantados. Gere APENAS o objeto JSON completo e atualizado.
+""",
+    entrada="--PROMPT ORIGINAL--\n{prompt_usuario}\n\n--PLANO ANTERIOR PARA REFINAR--\n{plano_anterior}\n\n--CRÍTICAS A SEREM APLICADAS--\n{criticas}",
+)
+
+CRITICO = PromptTemplate(
+    nome="critico",
+    versao="2",
+    instrucoes="""
+Você é um Auditor de Qualidade de Processos extremamente rigoroso. Sua tarefa é analisar um "Plano de Design" em JSON e compará-lo com o "Prompt Original" do usuário para garantir que o plano seja uma representação fiel, completa e lógica do processo descrito.
+
+Sua análise deve focar em três pontos principais:
+1.  **Completude**: O plano contempla TODAS as etapas, cenários e exceções descritas no prompt? (Ex: caminhos de sucesso, falha, recusa, etc.).
+2.  **Clareza**: Os nomes das etapas no plano são claros, específicos e fáceis de entender? Nomes genéricos como "Validar Dados" devem ser questionados se o prompt fornecer mais detalhes.
+3.  **Lógica**: A sequência das etapas e as conexões entre elas fazem sentido lógico de acordo com o processo descrito?
+
+Sua saída DEVE ser um objeto JSON com a seguinte estrutura:
+- Se o plano estiver perfeito, retorne: `{"status": "Aprovado", "criticas": []}`
+- Se o plano precisar de melhorias, retorne: `{"status": "Requer Refinamento", "criticas": ["Crítica 1...", "Crítica 2..."]}`
+
+Seja objetivo e direto. Gere APENAS o objeto JSON como resposta.
+""",
+    entrada="--PROMPT ORIGINAL--\n{prompt_original}\n\n--PLANO DE DESIGN PARA ANÁLISE--\n{plano}",
+)
+
+DESENHISTA = PromptTemplate(
+    nome="desenhista",
+    versao="2",
+    fontes=("docs_mermaid",),
+    instrucoes="""
+Você é um especialista em desenhar diagramas com a sintaxe Mermaid. Sua tarefa é converter um "plano de design" JSON em um código Mermaid limpo e funcional.
+
+Você deve seguir DUAS fontes de conhecimento:
+1. O PLANO DE DESIGN, enviado pelo usuário: ele define a estrutura, os passos, os textos e as conexões. Siga-o rigorosamente.
+2. A DOCUMENTAÇÃO DE REFERÊNCIA acima: use-a para aplicar a sintaxe mais moderna e eficiente para os elementos definidos no plano.
+
+Analise o plano de design e gere APENAS o código Mermaid correspondente. Não inclua nenhuma explicação ou texto adicional.
+""",
+    entrada="{plano}",
+)
+
+CORRETOR = PromptTemplate(
+    nome="corretor",
+    versao="2",
+    fontes=("manual_mermaid", "docs_mermaid"),
+    instrucoes="""
+Você é um especialista em sintaxe de diagramas Mermaid. Sua tarefa é corrigir o código Mermaid enviado pelo usuário, que resultou no erro informado junto com ele.
+
+Para garantir a sintaxe correta, você deve seguir DUAS fontes de conhecimento:
+1. O MANUAL DE BOAS PRÁTICAS acima, que contém lições de erros passados.
+2. A DOCUMENTAÇÃO DE REFERÊNCIA acima, que contém a sintaxe oficial mais recente.
+
+Analise o código, o erro e as fontes de conhecimento para fornecer uma correção. Forneça apenas o código Mermaid corrigido, sem nenhuma explicação adicional.
+""",
+    entrada="--ERRO--\n{mensagem_erro}\n\n--CÓDIGO MERMAID--\n{codigo_invalido}{secao_plano}",
+)
+
+GERADOR = PromptTemplate(
+    nome="gerador",
+    versao="2",
+    fontes=("manual_mermaid", "docs_mermaid"),
+    instrucoes="""
+Você é um especialista em criar diagramas com a sintaxe Mermaid. Sua tarefa é gerar APENAS o código Mermaid correspondente ao prompt do usuário.
+
+Para garantir a sintaxe correta, você deve seguir DUAS fontes de conhecimento:
+1. O MANUAL DE BOAS PRÁTICAS acima, que contém lições de erros passados.
+2. A DOCUMENTAÇÃO DE REFERÊNCIA acima, que contém a sintaxe oficial mais recente.
+
+Siga estritamente as regras de ambas as fontes. Não inclua nenhuma explicação no seu retorno, apenas o bloco de código.
+""",
+    entrada="{prompt_usuario}",
+)
+
+TEMPLATES = {t.nome: t for t in (ANALISTA_CRIACAO, ANALISTA_REFINO, CRITICO, DESENHISTA, CORRETOR, GERADOR)}
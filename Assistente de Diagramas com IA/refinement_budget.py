@@ -0,0 +1,367 @@
+"""
+Orçamento adaptativo dos ciclos de refinamento de uma requisição.
+
+Em vez de um número fixo de ciclos crítico ↔ analista e de tentativas de
+correção de sintaxe, o `OrcamentoDeRefinamento` acompanha a convergência:
+
+- Ciclos de qualidade: mede a diferença estrutural entre planos sucessivos
+  (passos e conexões) e a sobreposição entre as críticas de ciclos seguidos.
+  Encerra cedo quando o refinamento deixa de mudar o plano ou quando o crítico
+  repete as mesmas críticas sem que elas diminuam; concede ciclos além da base
+  apenas quando há progresso mensurável (menos críticas e um plano que ainda muda).
+- Tentativas de sintaxe: encerra quando o corretor devolve o mesmo código ou
+  o mesmo erro se repete; concede tentativas além da base quando o erro muda.
+
+Os dois respeitam um prazo (segundos) e um teto de tokens por requisição: um
+novo ciclo só começa se, pela média dos anteriores, couber no que resta.
+Os ciclos e tentativas economizados ficam no relatório da requisição e em
+contadores do processo (ver `resumo()`).
+
+Configuração (variáveis de ambiente):
+
+- `REFINEMENT_ADAPTIVE=0` volta aos limites fixos (padrão: 1).
+- `REFINEMENT_MAX_CYCLES` / `REFINEMENT_MAX_SYNTAX_ATTEMPTS`: teto com ciclos
+  e tentativas adicionais (padrão: 5 e 4).
+- `REFINEMENT_STABLE_THRESHOLD`: diferença entre planos abaixo da qual o plano
+  é considerado estável (padrão: 0, só planos idênticos; uma correção de um
+  rótulo em um plano de 20 passos já dá 0.05).
+- `REFINEMENT_REPEAT_THRESHOLD`: fração de críticas repetidas que encerra os
+  ciclos (padrão: 0.8).
+- `REQUEST_DEADLINE_S` / `REQUEST_MAX_TOKENS`: prazo e teto de tokens por
+  requisição (padrão: 0, sem limite).
+"""
+import os
+import re
+import time
+import threading
+import unicodedata
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from request_trace import trace_atual
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+ADAPTATIVO = os.getenv("REFINEMENT_ADAPTIVE", "1") == "1"
+CICLOS_MAXIMOS = int(os.getenv("REFINEMENT_MAX_CYCLES", "5"))
+TENTATIVAS_MAXIMAS = int(os.getenv("REFINEMENT_MAX_SYNTAX_ATTEMPTS", "4"))
+LIMIAR_ESTAVEL = float(os.getenv("REFINEMENT_STABLE_THRESHOLD", "0"))
+LIMIAR_REPETICAO = float(os.getenv("REFINEMENT_REPEAT_THRESHOLD", "0.8"))
+PRAZO_S = float(os.getenv("REQUEST_DEADLINE_S", "0"))
+LIMITE_TOKENS = int(os.getenv("REQUEST_MAX_TOKENS", "0"))
+
+# Semelhança mínima para duas críticas contarem como a mesma
+_SEMELHANCA_CRITICA = 0.6
+_PALAVRAS_IGNORADAS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "um", "uma", "para", "com", "que", "no", "na", "se", "ao"}
+
+
+def _normalizar(texto) -> str:
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.lower().split())
+
+
+def _elementos(plano: dict) -> set:
+    """Passos e conexões do plano como um conjunto comparável."""
+    if not isinstance(plano, dict):
+        return set()
+    elementos = {
+        ("passo", _normalizar(p.get("id")), _normalizar(p.get("tipo")), _normalizar(p.get("texto")))
+        for p in plano.get("passos") or [] if isinstance(p, dict)
+    }
+    elementos.update(
+        ("conexao", _normalizar(c.get("de")), _normalizar(c.get("para")), _normalizar(c.get("label")))
+        for c in plano.get("conexoes") or [] if isinstance(c, dict)
+    )
+    return elementos
+
+
+def diferenca_entre_planos(anterior: dict, atual: dict) -> float:
+    """Diferença estrutural entre dois planos: 0.0 para planos iguais, 1.0 para nada em comum."""
+    a, b = _elementos(anterior), _elementos(atual)
+    if not a and not b:
+        return 0.0
+    return 1 - len(a & b) / len(a | b)
+
+
+def _palavras(critica: str) -> set:
+    return {p for p in re.findall(r"\w+", _normalizar(critica)) if p not in _PALAVRAS_IGNORADAS}
+
+
+def sobreposicao_de_criticas(anteriores: list, atuais: list) -> float:
+    """Fração das críticas atuais que repetem (por semelhança de palavras) uma crítica anterior."""
+    if not anteriores or not atuais:
+        return 0.0
+    conjuntos_anteriores = [_palavras(c) for c in anteriores]
+    repetidas = 0
+    for critica in atuais:
+        palavras = _palavras(critica)
+        for anterior in conjuntos_anteriores:
+            uniao = palavras | anterior
+            if uniao and len(palavras & anterior) / len(uniao) >= _SEMELHANCA_CRITICA:
+                repetidas += 1
+                break
+    return repetidas / len(atuais)
+
+
+@dataclass
+class CicloRegistrado:
+    """Um ciclo de qualidade concluído com refinamento."""
+    numero: int
+    criticas: list
+    diferenca: float
+    sobreposicao: float
+    duracao_s: float
+    tokens: int
+
+
+class OrcamentoDeRefinamento:
+    """
+    Decide, ciclo a ciclo, se a requisição ainda merece refinamento ou correção.
+
+    Args:
+        ciclos_base: Ciclos crítico ↔ analista concedidos sem exigir progresso.
+        tentativas_base: Tentativas de correção de sintaxe concedidas sem exigir progresso.
+        ciclos_maximos: Teto de ciclos, com os adicionais por progresso.
+        tentativas_maximas: Teto de tentativas de correção, com as adicionais.
+        prazo_s: Prazo da requisição, em segundos (0 = sem prazo).
+        limite_tokens: Teto de tokens (prompt + gerados) da requisição (0 = sem teto).
+        adaptativo: False mantém exatamente `ciclos_base` e `tentativas_base`
+            (ainda limitados pelo prazo e pelo teto de tokens).
+    """
+
+    def __init__(self, ciclos_base: int = 3, tentativas_base: int = 3, ciclos_maximos: int = None,
+                 tentativas_maximas: int = None, prazo_s: float = None, limite_tokens: int = None,
+                 adaptativo: bool = None):
+        self.ciclos_base = ciclos_base
+        self.tentativas_base = tentativas_base
+        self.ciclos_maximos = max(ciclos_maximos if ciclos_maximos is not None else CICLOS_MAXIMOS, ciclos_base)
+        self.tentativas_maximas = max(
+            tentativas_maximas if tentativas_maximas is not None else TENTATIVAS_MAXIMAS, tentativas_base
+        )
+        self.prazo_s = prazo_s if prazo_s is not None else PRAZO_S
+        self.limite_tokens = limite_tokens if limite_tokens is not None else LIMITE_TOKENS
+        self.adaptativo = adaptativo if adaptativo is not None else ADAPTATIVO
+        self.limiar_estavel = LIMIAR_ESTAVEL
+        self.limiar_repeticao = LIMIAR_REPETICAO
+        self.ciclos = []
+        self.ciclos_usados = 0
+        self.tentativas = 0
+        self.motivo_ciclos = None
+        self.motivo_sintaxe = None
+        self._inicio = time.perf_counter()
+        self._inicio_etapa = None
+        self._tokens_etapa = 0
+        self._duracoes_tentativas = []
+        self._erros = []
+        self._codigos = []
+
+    # Prazo e tokens
+
+    def _decorrido(self) -> float:
+        return time.perf_counter() - self._inicio
+
+    @staticmethod
+    def _tokens_consumidos() -> int:
+        trace = trace_atual()
+        if trace is None:
+            return 0
+        totais = trace.totais()
+        return totais["prompt_tokens"] + totais["completion_tokens"]
+
+    def _limite_excedido(self, duracoes: list, tokens: list) -> str:
+        """None se mais uma etapa (pela média das anteriores) cabe no prazo e no teto; senão, o motivo."""
+        if self.prazo_s > 0:
+            estimativa = sum(duracoes) / len(duracoes) if duracoes else 0.0
+            if self._decorrido() + estimativa > self.prazo_s:
+                return f"prazo de {self.prazo_s:g}s (decorridos {self._decorrido():.1f}s)"
+        if self.limite_tokens > 0:
+            estimativa = sum(tokens) / len(tokens) if tokens else 0
+            if self._tokens_consumidos() + estimativa > self.limite_tokens:
+                return f"teto de {self.limite_tokens} tokens ({self._tokens_consumidos()} consumidos)"
+        return None
+
+    def _iniciar_etapa(self):
+        self._inicio_etapa = time.perf_counter()
+        self._tokens_etapa = self._tokens_consumidos()
+
+    def _medir_etapa(self) -> tuple:
+        if self._inicio_etapa is None:
+            return 0.0, 0
+        return time.perf_counter() - self._inicio_etapa, self._tokens_consumidos() - self._tokens_etapa
+
+    # Ciclos de qualidade
+
+    def permite_ciclo(self) -> bool:
+        """Decide se um novo ciclo de qualidade começa (registrando o motivo da parada, se não)."""
+        numero = self.ciclos_usados
+        motivo = self._motivo_para_encerrar_ciclos(numero)
+        if motivo is not None:
+            self.motivo_ciclos = motivo
+            return False
+        self.ciclos_usados += 1
+        self._iniciar_etapa()
+        return True
+
+    def _motivo_para_encerrar_ciclos(self, numero: int) -> str:
+        if numero == 0:
+            # O primeiro ciclo sempre acontece
+            return None
+        motivo = self._limite_excedido([c.duracao_s for c in self.ciclos], [c.tokens for c in self.ciclos])
+        if motivo is not None:
+            return motivo
+        if not self.adaptativo:
+            return None if numero < self.ciclos_base else "limite de ciclos"
+        if not self.ciclos:
+            return None if numero < self.ciclos_base else "limite de ciclos"
+        ultimo = self.ciclos[-1]
+        # Menos críticas que no ciclo anterior: o analista resolveu parte delas
+        diminuiram = len(self.ciclos) >= 2 and len(ultimo.criticas) < len(self.ciclos[-2].criticas)
+        if ultimo.diferenca == 0 or ultimo.diferenca < self.limiar_estavel:
+            return f"plano estável (diferença de {ultimo.diferenca:.0%} entre versões)"
+        if ultimo.sobreposicao >= self.limiar_repeticao and not diminuiram:
+            return f"críticas repetidas ({ultimo.sobreposicao:.0%} iguais às do ciclo anterior)"
+        if numero < self.ciclos_base:
+            return None
+        if numero >= self.ciclos_maximos:
+            return "limite de ciclos"
+        if diminuiram:
+            return None
+        return "limite de ciclos (sem progresso mensurável para um ciclo adicional)"
+
+    def registrar_refinamento(self, plano_anterior: dict, plano_refinado: dict, criticas: list) -> CicloRegistrado:
+        """Registra um ciclo que terminou em refinamento: diferença entre os planos e repetição das críticas."""
+        duracao, tokens = self._medir_etapa()
+        anteriores = self.ciclos[-1].criticas if self.ciclos else []
+        ciclo = CicloRegistrado(
+            numero=self.ciclos_usados,
+            criticas=list(criticas or []),
+            diferenca=round(diferenca_entre_planos(plano_anterior, plano_refinado), 3),
+            sobreposicao=round(sobreposicao_de_criticas(anteriores, criticas or []), 3),
+            duracao_s=round(duracao, 3),
+            tokens=tokens,
+        )
+        self.ciclos.append(ciclo)
+        return ciclo
+
+    def encerrar_ciclos(self, motivo: str):
+        """Registra o motivo do fim dos ciclos quando ele não veio do orçamento (ex: aprovação)."""
+        self.motivo_ciclos = self.motivo_ciclos or motivo
+
+    def rotulo_ciclo(self) -> str:
+        """Rótulo do ciclo atual para os logs (ex: "2/3" ou "4, adicional")."""
+        if self.ciclos_usados <= self.ciclos_base:
+            return f"{self.ciclos_usados}/{self.ciclos_base}"
+        return f"{self.ciclos_usados}, adicional"
+
+    # Tentativas de sintaxe
+
+    def permite_tentativa(self, codigo: str, erro: str) -> bool:
+        """Decide se o código inválido vai para mais uma correção."""
+        if self._inicio_etapa is not None and self.tentativas:
+            self._duracoes_tentativas.append(self._medir_etapa())
+        motivo = self._motivo_para_encerrar_tentativas(codigo, erro)
+        self._codigos.append(codigo)
+        self._erros.append(_normalizar(erro))
+        if motivo is not None:
+            self.motivo_sintaxe = motivo
+            return False
+        self.tentativas += 1
+        self._iniciar_etapa()
+        return True
+
+    def _motivo_para_encerrar_tentativas(self, codigo: str, erro: str) -> str:
+        motivo = self._limite_excedido([d for d, _ in self._duracoes_tentativas], [t for _, t in self._duracoes_tentativas])
+        if motivo is not None:
+            return motivo
+        if not self.adaptativo:
+            return None if self.tentativas < self.tentativas_base else "limite de tentativas"
+        if self._codigos and codigo == self._codigos[-1]:
+            return "o corretor devolveu o mesmo código"
+        erro = _normalizar(erro)
+        if len(self._erros) >= 2 and self._erros[-1] == self._erros[-2] == erro:
+            return "o mesmo erro se repetiu em três validações"
+        if self.tentativas < self.tentativas_base:
+            return None
+        if self.tentativas >= self.tentativas_maximas:
+            return "limite de tentativas"
+        if self._erros and erro != self._erros[-1]:
+            # O erro mudou: a correção anterior avançou
+            return None
+        return "limite de tentativas (o erro não mudou)"
+
+    def rotulo_tentativa(self) -> str:
+        if self.tentativas <= self.tentativas_base:
+            return f"{self.tentativas}/{self.tentativas_base}"
+        return f"{self.tentativas}, adicional"
+
+    # Relatório
+
+    def ciclos_economizados(self) -> int:
+        # Só conta o que o orçamento cortou; uma aprovação no primeiro ciclo não é economia do orçamento
+        if self.motivo_ciclos is None or self.motivo_ciclos.startswith(("limite", "aprovado", "falha")):
+            return 0
+        return max(self.ciclos_base - self.ciclos_usados, 0)
+
+    def tentativas_economizadas(self) -> int:
+        if self.motivo_sintaxe is None or self.motivo_sintaxe.startswith("limite"):
+            return 0
+        return max(self.tentativas_base - self.tentativas, 0)
+
+    def relatorio(self) -> dict:
+        return {
+            "adaptativo": self.adaptativo,
+            "ciclos": self.ciclos_usados,
+            "ciclos_base": self.ciclos_base,
+            "ciclos_economizados": self.ciclos_economizados(),
+            "ciclos_adicionais": max(self.ciclos_usados - self.ciclos_base, 0),
+            "motivo_ciclos": self.motivo_ciclos,
+            "tentativas_sintaxe": self.tentativas,
+            "tentativas_base": self.tentativas_base,
+            "tentativas_economizadas": self.tentativas_economizadas(),
+            "tentativas_adicionais": max(self.tentativas - self.tentativas_base, 0),
+            "motivo_sintaxe": self.motivo_sintaxe,
+            "diferencas": [c.diferenca for c in self.ciclos],
+            "sobreposicoes": [c.sobreposicao for c in self.ciclos],
+        }
+
+
+# Contadores do processo (ver `resumo`)
+_metricas = {
+    "requisicoes": 0, "ciclos_economizados": 0, "ciclos_adicionais": 0,
+    "tentativas_economizadas": 0, "tentativas_adicionais": 0,
+}
+_metricas_lock = threading.Lock()
+
+
+def registrar(relatorio: dict):
+    """Acumula o relatório de uma requisição nos contadores do processo."""
+    with _metricas_lock:
+        _metricas["requisicoes"] += 1
+        for chave in ("ciclos_economizados", "ciclos_adicionais", "tentativas_economizadas", "tentativas_adicionais"):
+            _metricas[chave] += relatorio[chave]
+
+
+def metricas() -> dict:
+    with _metricas_lock:
+        return dict(_metricas)
+
+
+def zerar_metricas():
+    with _metricas_lock:
+        for chave in _metricas:
+            _metricas[chave] = 0
+
+
+def resumo() -> str:
+    """Resumo de uma linha dos ciclos e tentativas economizados (ou adicionados) pelo orçamento."""
+    m = metricas()
+    if not m["requisicoes"]:
+        return "Orçamento de refinamento: nenhuma requisição."
+    return (
+        f"Orçamento de refinamento: {m['ciclos_economizados']} ciclo(s) de qualidade e "
+        f"{m['tentativas_economizadas']} tentativa(s) de correção economizados em {m['requisicoes']} requisição(ões); "
+        f"{m['ciclos_adicionais']} ciclo(s) e {m['tentativas_adicionais']} tentativa(s) adicionais por progresso."
+    )
@@ -0,0 +1,367 @@
+"""
+Contabilidade de tokens, custo e latência por requisição.
+
+Cada execução do pipeline abre um `RequestTrace` (ver `rastrear_requisicao`),
+guardado em uma `ContextVar`: as chamadas feitas pelos agentes, inclusive em
+tarefas asyncio e em threads de `asyncio.to_thread`, são registradas no trace
+da requisição que as originou, sem precisar repassá-lo por parâmetro.
+
+Para cada chamada ao LLM ficam registrados o agente, o deployment, os tokens
+de prompt, em cache e gerados, a latência (e o tempo até o primeiro trecho, no
+streaming), as repetições feitas pela política de retry, acertos no cache de
+respostas e o custo estimado. Etapas sem LLM (ex: o validador e, dentro dele, o
+mmdc) entram como etapas com duração.
+
+Os traces concluídos ficam em um histórico em memória e, se `REQUEST_TRACE_PATH`
+não estiver vazio, são acrescentados a um JSONL (padrão:
+.cache/request_traces.jsonl), de onde saem os percentis p50/p95 de
+`estatisticas()` e de painéis externos.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from validation_cache import CACHE_DIR
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+# Preços em US$ por milhão de tokens (padrão: tabela pública do gpt-4o)
+PRECO_ENTRADA = float(os.getenv("LLM_PRICE_INPUT_PER_1M", "2.50"))
+PRECO_ENTRADA_EM_CACHE = float(os.getenv("LLM_PRICE_CACHED_INPUT_PER_1M", "1.25"))
+PRECO_SAIDA = float(os.getenv("LLM_PRICE_OUTPUT_PER_1M", "10.00"))
+
+CAMINHO_HISTORICO = os.getenv("REQUEST_TRACE_PATH", os.path.join(CACHE_DIR, "request_traces.jsonl"))
+TAMANHO_HISTORICO = int(os.getenv("REQUEST_TRACE_HISTORY", "500"))
+
+
+def custo_estimado(prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """Custo em US$ de uma chamada; os tokens em cache são cobrados com desconto."""
+    return (
+        (prompt_tokens - cached_tokens) * PRECO_ENTRADA
+        + cached_tokens * PRECO_ENTRADA_EM_CACHE
+        + completion_tokens * PRECO_SAIDA
+    ) / 1_000_000
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil `p` (0 a 100) por interpolação linear; 0.0 para uma lista vazia."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+@dataclass
+class ChamadaLLM:
+    """Uma chamada ao LLM (ou um acerto no cache de respostas) feita durante a requisição."""
+    agente: str
+    deployment: str
+    inicio_ms: float
+    latencia_ms: float
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    repeticoes: int = 0
+    cache: str = None  # "exato" | "semantico" quando a resposta veio do cache de respostas
+    streaming: bool = False
+    primeiro_trecho_ms: float = None
+    erro: str = None
+
+    @property
+    def custo_usd(self) -> float:
+        return custo_estimado(self.prompt_tokens, self.cached_tokens, self.completion_tokens)
+
+    def to_dict(self) -> dict:
+        dados = asdict(self)
+        dados["custo_usd"] = round(self.custo_usd, 6)
+        return dados
+
+
+@dataclass
+class Etapa:
+    """Uma etapa sem LLM (ex: validação) e sua duração."""
+    nome: str
+    inicio_ms: float
+    duracao_ms: float
+
+
+def _totais(chamadas: list) -> dict:
+    return {
+        "chamadas": len(chamadas),
+        "prompt_tokens": sum(c.prompt_tokens for c in chamadas),
+        "cached_tokens": sum(c.cached_tokens for c in chamadas),
+        "completion_tokens": sum(c.completion_tokens for c in chamadas),
+        "repeticoes": sum(c.repeticoes for c in chamadas),
+        "acertos_cache": sum(1 for c in chamadas if c.cache),
+        "erros": sum(1 for c in chamadas if c.erro),
+        "latencia_ms": round(sum(c.latencia_ms for c in chamadas), 1),
+        "custo_usd": round(sum(c.custo_usd for c in chamadas), 6),
+    }
+
+
+class RequestTrace:
+    """
+    Registro estruturado de uma requisição ao pipeline.
+
+    Args:
+        prompt: O prompt do usuário.
+        requisicao_id: Identificador da requisição (padrão: gerado).
+    """
+
+    def __init__(self, prompt: str = "", requisicao_id: str = None):
+        self.id = requisicao_id or uuid.uuid4().hex[:12]
+        self.prompt = prompt
+        self.criado_em = datetime.now(timezone.utc).isoformat()
+        self.status = None
+        self.duracao_ms = None
+        self.chamadas = []
+        self.etapas = []
+        self._inicio = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _ms_desde_o_inicio(self, instante: float) -> float:
+        return round((instante - self._inicio) * 1000, 1)
+
+    def registrar_chamada(self, chamada: ChamadaLLM):
+        with self._lock:
+            self.chamadas.append(chamada)
+
+    def registrar_etapa(self, nome: str, inicio: float, fim: float):
+        """Registra uma etapa a partir dos instantes de `time.perf_counter()`."""
+        etapa = Etapa(nome, self._ms_desde_o_inicio(inicio), round((fim - inicio) * 1000, 1))
+        with self._lock:
+            self.etapas.append(etapa)
+
+    def finalizar(self, status: str = None):
+        if self.duracao_ms is None:
+            self.duracao_ms = self._ms_desde_o_inicio(time.perf_counter())
+        if status is not None:
+            self.status = status
+
+    def totais(self) -> dict:
+        with self._lock:
+            return _totais(list(self.chamadas))
+
+    def por_agente(self) -> dict:
+        with self._lock:
+            chamadas = list(self.chamadas)
+        agentes = {}
+        for chamada in chamadas:
+            agentes.setdefault(chamada.agente, []).append(chamada)
+        return {agente: _totais(lista) for agente, lista in agentes.items()}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            chamadas = [c.to_dict() for c in self.chamadas]
+            etapas = [asdict(e) for e in self.etapas]
+        return {
+            "id": self.id,
+            "prompt": self.prompt,
+            "criado_em": self.criado_em,
+            "status": self.status,
+            "duracao_ms": self.duracao_ms,
+            "totais": self.totais(),
+            "por_agente": self.por_agente(),
+            "chamadas": chamadas,
+            "etapas": etapas,
+        }
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def resumo(self) -> str:
+        """Resumo de uma linha, para logs e para a interface."""
+        t = self.totais()
+        duracao = f"{self.duracao_ms / 1000:.2f}s" if self.duracao_ms is not None else "em andamento"
+        return (
+            f"Requisição {self.id}: {t['chamadas']} chamadas ao LLM ({t['acertos_cache']} do cache), "
+            f"{t['prompt_tokens']} tokens de prompt ({t['cached_tokens']} em cache), "
+            f"{t['completion_tokens']} gerados, US$ {t['custo_usd']:.4f}, {duracao} "
+            f"(LLM {t['latencia_ms'] / 1000:.2f}s)."
+        )
+
+
+_atual = contextvars.ContextVar("request_trace", default=None)
+_repeticoes = contextvars.ContextVar("repeticoes_llm", default=None)
+_historico = deque(maxlen=TAMANHO_HISTORICO)
+_historico_lock = threading.Lock()
+
+
+def trace_atual():
+    """O `RequestTrace` da requisição em andamento no contexto atual, ou None."""
+    return _atual.get()
+
+
+@contextmanager
+def rastrear_requisicao(prompt: str = "", requisicao_id: str = None):
+    """
+    Abre o trace de uma requisição para o contexto atual.
+
+    Ao sair, o trace é finalizado, guardado no histórico e, se configurado,
+    acrescentado ao JSONL de `REQUEST_TRACE_PATH`.
+    """
+    trace = RequestTrace(prompt, requisicao_id)
+    token = _atual.set(trace)
+    try:
+        yield trace
+    finally:
+        _atual.reset(token)
+        trace.finalizar()
+        _arquivar(trace)
+
+
+def _arquivar(trace: RequestTrace):
+    dados = trace.to_dict()
+    with _historico_lock:
+        _historico.append(dados)
+        if not CAMINHO_HISTORICO:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(CAMINHO_HISTORICO)), exist_ok=True)
+            with open(CAMINHO_HISTORICO, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dados, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ Não foi possível gravar o trace da requisição em {CAMINHO_HISTORICO}: {e}")
+
+
+@contextmanager
+def contar_repeticoes():
+    """Conta, no contexto atual, as repetições feitas pela política de retry durante uma chamada."""
+    contador = [0]
+    token = _repeticoes.set(contador)
+    try:
+        yield contador
+    finally:
+        _repeticoes.reset(token)
+
+
+def registrar_repeticao():
+    """Chamado pelo transporte HTTP a cada nova tentativa de uma requisição."""
+    contador = _repeticoes.get()
+    if contador is not None:
+        contador[0] += 1
+
+
+def registrar_chamada(agente: str, deployment: str, inicio: float, usage=None, repeticoes: int = 0,
+                      cache: str = None, streaming: bool = False, primeiro_trecho: float = None, erro: str = None):
+    """
+    Registra uma chamada ao LLM no trace atual (sem efeito fora de uma requisição).
+
+    Args:
+        agente: O agente que fez a chamada.
+        deployment: O deployment (ou o stub) que atendeu a chamada.
+        inicio: O `time.perf_counter()` do início da chamada.
+        usage: O `usage` da resposta, se houver.
+        repeticoes: Repetições feitas pela política de retry.
+        cache: Nível do acerto no cache de respostas, se a resposta veio de lá.
+        streaming: Se a resposta foi recebida em streaming.
+        primeiro_trecho: O `time.perf_counter()` da chegada do primeiro trecho.
+        erro: A mensagem de erro, se a chamada falhou.
+    """
+    trace = _atual.get()
+    if trace is None:
+        return
+    fim = time.perf_counter()
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    trace.registrar_chamada(ChamadaLLM(
+        agente=agente or "desconhecido",
+        deployment=deployment or "desconhecido",
+        inicio_ms=trace._ms_desde_o_inicio(inicio),
+        latencia_ms=round((fim - inicio) * 1000, 1),
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        cached_tokens=(getattr(detalhes, "cached_tokens", 0) or 0) if detalhes is not None else 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        repeticoes=repeticoes,
+        cache=cache,
+        streaming=streaming,
+        primeiro_trecho_ms=round((primeiro_trecho - inicio) * 1000, 1) if primeiro_trecho is not None else None,
+        erro=erro,
+    ))
+
+
+@contextmanager
+def medir_etapa(nome: str):
+    """Mede a duração de uma etapa sem LLM e a registra no trace atual (sem efeito fora de uma requisição)."""
+    trace = _atual.get()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.registrar_etapa(nome, inicio, time.perf_counter())
+
+
+def historico() -> list:
+    """Os traces concluídos neste processo (os mais recentes, até `REQUEST_TRACE_HISTORY`)."""
+    with _historico_lock:
+        return list(_historico)
+
+
+def carregar_historico(caminho: str = None) -> list:
+    """Lê os traces gravados no JSONL (linhas inválidas são ignoradas)."""
+    traces = []
+    try:
+        with open(caminho or CAMINHO_HISTORICO, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    traces.append(json.loads(linha))
+                except json.JSONDecodeError:
+                    continue
+    except (FileNotFoundError, TypeError):
+        pass
+    return traces
+
+
+def estatisticas(traces: list = None) -> dict:
+    """
+    Percentis p50/p95 de latência, tokens e custo das requisições.
+
+    Args:
+        traces: Traces no formato de `RequestTrace.to_dict()` (padrão: o histórico em memória).
+
+    Returns:
+        Um dicionário com `requisicoes`, `duracao_ms`, `custo_usd`, `tokens` (cada um
+        com p50 e p95) e `por_agente` (latência p50/p95 por chamada de cada agente).
+    """
+    traces = historico() if traces is None else traces
+
+    def p50_p95(valores: list) -> dict:
+        return {"p50": round(percentil(valores, 50), 3), "p95": round(percentil(valores, 95), 3)}
+
+    latencias_por_agente = {}
+    for trace in traces:
+        for chamada in trace.get("chamadas", []):
+            latencias_por_agente.setdefault(chamada["agente"], []).append(chamada["latencia_ms"])
+    return {
+        "requisicoes": len(traces),
+        "duracao_ms": p50_p95([t["duracao_ms"] for t in traces if t.get("duracao_ms") is not None]),
+        "custo_usd": p50_p95([t["totais"]["custo_usd"] for t in traces]),
+        "tokens": p50_p95([t["totais"]["prompt_tokens"] + t["totais"]["completion_tokens"] for t in traces]),
+        "por_agente": {agente: p50_p95(valores) for agente, valores in latencias_por_agente.items()},
+    }
+
+
+def resumo_de_estatisticas(traces: list = None) -> str:
+    """Resumo de uma linha de `estatisticas()`."""
+    e = estatisticas(traces)
+    if not e["requisicoes"]:
+        return "Nenhuma requisição rastreada."
+    return (
+        f"{e['requisicoes']} requisição(ões): duração p50 {e['duracao_ms']['p50'] / 1000:.2f}s, "
+        f"p95 {e['duracao_ms']['p95'] / 1000:.2f}s; custo p50 US$ {e['custo_usd']['p50']:.4f}, "
+        f"p95 US$ {e['custo_usd']['p95']:.4f}."
+    )
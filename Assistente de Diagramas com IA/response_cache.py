@@ -0,0 +1,222 @@
+"""
+Cache das respostas do LLM para os agentes de baixa temperatura.
+
+O analista, o crítico e o desenhista rodam com temperatura entre 0 e 0.2,
+então a mesma entrada produz, na prática, a mesma saída. Só são armazenadas
+respostas completas que o agente conseguiu interpretar (ver `llm_client`); o
+corretor fica de fora, pois a mesma entrada só volta a ele quando a correção
+anterior falhou. O cache tem dois níveis, ambos em SQLite:
+
+- Exato: a chave é o SHA-256 de (agente, hash do template, deployment,
+  parâmetros da chamada, entrada normalizada). O hash do template é o hash da
+  mensagem de sistema, que já inclui o conteúdo atual dos manuais, então editar
+  um manual ou um template invalida as entradas correspondentes.
+- Semântico (opcional): para as chamadas que pedem (o plano inicial do
+  analista), o prompt do usuário é convertido em embedding e uma resposta
+  armazenada é reaproveitada quando a similaridade de cosseno passa do limiar.
+
+As entradas expiram após `RESPONSE_CACHE_TTL` segundos e as menos usadas
+recentemente são removidas acima de `RESPONSE_CACHE_MAX_ENTRIES`.
+"""
+import os
+import json
+import math
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+from validation_cache import CACHE_DIR
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+HABILITADO = os.getenv("RESPONSE_CACHE", "1") == "1"
+TEMPERATURA_MAXIMA = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0.2"))
+LIMIAR_SEMANTICO = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+
+
+def normalizar_entrada(texto: str) -> str:
+    """Remove diferenças irrelevantes: quebras de linha, espaços finais e linhas vazias nas pontas."""
+    linhas = texto.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(linha.rstrip() for linha in linhas).strip()
+
+
+def hash_texto(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _similaridade(a, b) -> float:
+    produto = sum(x * y for x, y in zip(a, b))
+    normas = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return produto / normas if normas else 0.0
+
+
+class ResponseCache:
+    """
+    Cache de respostas do LLM em SQLite.
+
+    Args:
+        db_path: Caminho do banco (padrão: .cache/respostas_llm.sqlite3).
+        ttl: Validade das entradas, em segundos (0 = sem expiração).
+        max_entradas: Número máximo de entradas antes da remoção LRU.
+        limiar_semantico: Similaridade de cosseno mínima para um acerto semântico.
+    """
+
+    def __init__(self, db_path: str = None, ttl: float = None, max_entradas: int = None, limiar_semantico: float = LIMIAR_SEMANTICO):
+        self.db_path = db_path or os.getenv("RESPONSE_CACHE_PATH", os.path.join(CACHE_DIR, "respostas_llm.sqlite3"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+        self.max_entradas = max_entradas if max_entradas is not None else int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+        self.limiar_semantico = limiar_semantico
+        self._lock = threading.Lock()
+        self._conexao = None
+        self._metricas = {"consultas": 0, "acertos_exatos": 0, "acertos_semanticos": 0, "faltas": 0, "armazenadas": 0, "removidas": 0}
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conexao = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS respostas ("
+                "chave TEXT PRIMARY KEY, agente TEXT NOT NULL, escopo TEXT NOT NULL, "
+                "conteudo TEXT NOT NULL, embedding BLOB, "
+                "criado_em REAL NOT NULL, acessado_em REAL NOT NULL, acertos INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_respostas_escopo ON respostas (escopo)")
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (acessado_em)")
+        return self._conexao
+
+    @staticmethod
+    def escopo(agente: str, template_hash: str, deployment: str, parametros: dict) -> str:
+        """Identifica o conjunto de respostas intercambiáveis: mesmo agente, template, modelo e parâmetros."""
+        return hash_texto(json.dumps([agente, template_hash, deployment, parametros], sort_keys=True, default=str))
+
+    @staticmethod
+    def chave(escopo: str, entrada: str) -> str:
+        return hash_texto(f"{escopo}\0{normalizar_entrada(entrada)}")
+
+    def _expirada(self, criado_em: float, agora: float) -> bool:
+        return self.ttl > 0 and agora - criado_em > self.ttl
+
+    def obter(self, escopo: str, entrada: str, embedding: list = None):
+        """
+        Procura uma resposta armazenada.
+
+        Args:
+            escopo: O valor de `escopo(...)` da chamada.
+            entrada: A mensagem do usuário.
+            embedding: Embedding da entrada, para o nível semântico (opcional).
+
+        Returns:
+            Uma tupla (conteúdo, "exato" | "semantico"), ou None.
+        """
+        agora = time.time()
+        chave = self.chave(escopo, entrada)
+        with self._lock:
+            self._metricas["consultas"] += 1
+            try:
+                conexao = self._conectar()
+                linha = conexao.execute(
+                    "SELECT conteudo, criado_em FROM respostas WHERE chave = ?", (chave,)
+                ).fetchone()
+                if linha is not None and not self._expirada(linha[1], agora):
+                    self._registrar_acesso(conexao, chave, agora)
+                    self._metricas["acertos_exatos"] += 1
+                    return linha[0], "exato"
+
+                if embedding is not None:
+                    melhor, similaridade_melhor = None, self.limiar_semantico
+                    for chave_candidata, conteudo, criado_em, blob in conexao.execute(
+                        "SELECT chave, conteudo, criado_em, embedding FROM respostas "
+                        "WHERE escopo = ? AND embedding IS NOT NULL", (escopo,)
+                    ):
+                        if self._expirada(criado_em, agora):
+                            continue
+                        similaridade = _similaridade(embedding, array.array("f", blob))
+                        if similaridade >= similaridade_melhor:
+                            melhor, similaridade_melhor = (chave_candidata, conteudo), similaridade
+                    if melhor is not None:
+                        self._registrar_acesso(conexao, melhor[0], agora)
+                        self._metricas["acertos_semanticos"] += 1
+                        return melhor[1], "semantico"
+            except sqlite3.Error:
+                pass
+            self._metricas["faltas"] += 1
+            return None
+
+    def _registrar_acesso(self, conexao: sqlite3.Connection, chave: str, agora: float):
+        conexao.execute("UPDATE respostas SET acessado_em = ?, acertos = acertos + 1 WHERE chave = ?", (agora, chave))
+        conexao.commit()
+
+    def armazenar(self, agente: str, escopo: str, entrada: str, conteudo: str, embedding: list = None):
+        agora = time.time()
+        blob = array.array("f", embedding).tobytes() if embedding is not None else None
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                conexao.execute(
+                    "INSERT OR REPLACE INTO respostas (chave, agente, escopo, conteudo, embedding, criado_em, acessado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.chave(escopo, entrada), agente or "", escopo, conteudo, blob, agora, agora)
+                )
+                self._metricas["armazenadas"] += 1
+                self._remover_excedentes(conexao, agora)
+                conexao.commit()
+            except sqlite3.Error:
+                # O cache é apenas uma otimização; falhas não afetam a chamada
+                pass
+
+    def _remover_excedentes(self, conexao: sqlite3.Connection, agora: float):
+        removidas = 0
+        if self.ttl > 0:
+            removidas += conexao.execute("DELETE FROM respostas WHERE criado_em < ?", (agora - self.ttl,)).rowcount
+        excedentes = conexao.execute("SELECT COUNT(*) FROM respostas").fetchone()[0] - self.max_entradas
+        if excedentes > 0:
+            removidas += conexao.execute(
+                "DELETE FROM respostas WHERE chave IN (SELECT chave FROM respostas ORDER BY acessado_em LIMIT ?)",
+                (excedentes,)
+            ).rowcount
+        self._metricas["removidas"] += removidas
+
+    def limpar(self):
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                conexao.execute("DELETE FROM respostas")
+                conexao.commit()
+            except sqlite3.Error:
+                pass
+
+    def metricas(self) -> dict:
+        """Contadores desde o início do processo, com a taxa de acerto."""
+        with self._lock:
+            metricas = dict(self._metricas)
+        acertos = metricas["acertos_exatos"] + metricas["acertos_semanticos"]
+        metricas["taxa_de_acerto"] = acertos / metricas["consultas"] if metricas["consultas"] else 0.0
+        return metricas
+
+    def resumo(self) -> str:
+        """Resumo de uma linha das métricas, para logs e para a interface."""
+        m = self.metricas()
+        return (
+            f"Cache de respostas: {m['acertos_exatos'] + m['acertos_semanticos']}/{m['consultas']} acertos "
+            f"({100 * m['taxa_de_acerto']:.1f}%; {m['acertos_semanticos']} semânticos)."
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Retorna o cache de respostas compartilhado do processo."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
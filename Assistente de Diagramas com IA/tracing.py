@@ -0,0 +1,372 @@
+"""
+Spans no estilo OpenTelemetry para o caminho completo de uma requisição.
+
+Cada etapa instrumentada (funções dos agentes, `validar_diagrama_mermaid`,
+métodos do `ChromaManager`, ciclos do pipeline e chamadas ao LLM) abre um span
+com início, fim, atributos e o span pai, de modo que um clique em "Gerar
+Diagrama" vira uma árvore: pipeline → ciclos de qualidade → analista/crítico
+→ chamadas ao LLM, desenhista, cada execução do validador, cada tentativa do
+corretor.
+
+Configuração (variáveis de ambiente, lidas na importação):
+
+- `TRACING=1` habilita os spans (padrão: desabilitado).
+- `TRACING_EXPORTER`: `console` (uma linha por span no stdout) ou `otlp_file`
+  (padrão), que grava lotes no formato JSON do OTLP (`resourceSpans`), um por
+  linha, em `TRACING_FILE` (padrão: .cache/spans.otlp.jsonl). O arquivo pode
+  ser importado por um OpenTelemetry Collector (receiver `otlpjsonfile`).
+
+Com o tracing desabilitado, `rastreado` devolve a própria função decorada, sem
+envoltório, e `span()` devolve um span nulo compartilhado: o custo é zero nas
+funções decoradas e uma chamada de função nos blocos `with span(...)`.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import secrets
+import threading
+import functools
+import contextvars
+from dotenv import load_dotenv
+from validation_cache import CACHE_DIR
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+HABILITADO = os.getenv("TRACING", "0") == "1"
+EXPORTADOR = os.getenv("TRACING_EXPORTER", "otlp_file")
+CAMINHO_ARQUIVO = os.getenv("TRACING_FILE", os.path.join(CACHE_DIR, "spans.otlp.jsonl"))
+NOME_DO_SERVICO = os.getenv("TRACING_SERVICE_NAME", "assistente-de-diagramas")
+
+
+class _SpanNulo:
+    """Span usado com o tracing desabilitado: aceita tudo e não registra nada."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+    def definir_atributo(self, chave: str, valor):
+        pass
+
+    def definir_atributos(self, **atributos):
+        pass
+
+    def registrar_erro(self, erro: BaseException):
+        pass
+
+
+SPAN_NULO = _SpanNulo()
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+
+
+class Span:
+    """
+    Um intervalo de tempo nomeado, com atributos e um span pai.
+
+    Use como gerenciador de contexto (`with span(...)`): na entrada ele passa a
+    ser o span atual do contexto, e os spans abertos dentro dele viram filhos.
+    """
+
+    def __init__(self, nome: str, atributos: dict = None, pai: "Span" = None):
+        self.nome = nome
+        self.trace_id = pai.trace_id if pai is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.pai_id = pai.span_id if pai is not None else None
+        self.atributos = {chave: valor for chave, valor in (atributos or {}).items() if valor is not None}
+        self.inicio_ns = time.time_ns()
+        self.fim_ns = None
+        self.erro = None
+        self._token = None
+
+    def definir_atributo(self, chave: str, valor):
+        if valor is not None:
+            self.atributos[chave] = valor
+
+    def definir_atributos(self, **atributos):
+        for chave, valor in atributos.items():
+            self.definir_atributo(chave, valor)
+
+    def registrar_erro(self, erro: BaseException):
+        self.erro = f"{type(erro).__name__}: {erro}"
+
+    def finalizar(self):
+        if self.fim_ns is None:
+            self.fim_ns = time.time_ns()
+            if _exportador is not None:
+                _exportador.exportar(self)
+
+    @property
+    def duracao_ms(self) -> float:
+        return ((self.fim_ns or time.time_ns()) - self.inicio_ns) / 1e6
+
+    def __enter__(self):
+        self._token = _span_atual.set(self)
+        return self
+
+    def __exit__(self, tipo, erro, _rastro):
+        if erro is not None and not isinstance(erro, GeneratorExit):
+            self.registrar_erro(erro)
+        _span_atual.reset(self._token)
+        self.finalizar()
+        return False
+
+
+def _valor_otlp(valor) -> dict:
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def span_para_otlp(span: Span) -> dict:
+    """Converte um span para o formato JSON do OTLP."""
+    dados = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.nome,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.inicio_ns),
+        "endTimeUnixNano": str(span.fim_ns),
+        "attributes": [{"key": chave, "value": _valor_otlp(valor)} for chave, valor in span.atributos.items()],
+        "status": {"code": 2, "message": span.erro} if span.erro else {"code": 1},
+    }
+    if span.pai_id:
+        dados["parentSpanId"] = span.pai_id
+    return dados
+
+
+class ExportadorConsole:
+    """Imprime uma linha por span concluído, recuada pela profundidade na árvore."""
+
+    def __init__(self, saida=None):
+        self.saida = saida or sys.stdout
+        self._profundidades = {}
+        self._lock = threading.Lock()
+
+    def iniciar(self, span: Span):
+        with self._lock:
+            self._profundidades[span.span_id] = self._profundidades.get(span.pai_id, -1) + 1
+
+    def exportar(self, span: Span):
+        with self._lock:
+            profundidade = self._profundidades.pop(span.span_id, 0)
+        atributos = " ".join(f"{chave}={valor}" for chave, valor in span.atributos.items())
+        status = f" ❌ {span.erro}" if span.erro else ""
+        print(f"🔭 {'  ' * profundidade}{span.nome} {span.duracao_ms:.1f}ms {atributos}{status}".rstrip(), file=self.saida)
+
+    def encerrar(self):
+        pass
+
+
+class ExportadorArquivoOTLP:
+    """
+    Acumula spans e grava lotes no formato JSON do OTLP, um lote por linha.
+
+    Args:
+        caminho: Arquivo JSONL de destino.
+        tamanho_do_lote: Spans acumulados antes de uma gravação.
+    """
+
+    def __init__(self, caminho: str = None, tamanho_do_lote: int = 64):
+        self.caminho = caminho or CAMINHO_ARQUIVO
+        self.tamanho_do_lote = tamanho_do_lote
+        self._pendentes = []
+        self._lock = threading.Lock()
+
+    def iniciar(self, span: Span):
+        pass
+
+    def exportar(self, span: Span):
+        with self._lock:
+            self._pendentes.append(span_para_otlp(span))
+            if len(self._pendentes) < self.tamanho_do_lote:
+                return
+            lote, self._pendentes = self._pendentes, []
+        self._gravar(lote)
+
+    def _gravar(self, lote: list):
+        if not lote:
+            return
+        registro = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": NOME_DO_SERVICO}}]},
+                "scopeSpans": [{"scope": {"name": "assistente_de_diagramas.tracing"}, "spans": lote}],
+            }]
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            with self._lock, open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ Não foi possível gravar os spans em {self.caminho}: {e}")
+
+    def encerrar(self):
+        """Grava os spans pendentes."""
+        with self._lock:
+            lote, self._pendentes = self._pendentes, []
+        self._gravar(lote)
+
+
+def _criar_exportador(nome: str):
+    if nome == "console":
+        return ExportadorConsole()
+    return ExportadorArquivoOTLP()
+
+
+_exportador = _criar_exportador(EXPORTADOR) if HABILITADO else None
+if _exportador is not None:
+    atexit.register(_exportador.encerrar)
+
+
+def configurar(habilitado: bool = True, exportador=None):
+    """
+    Liga ou desliga o tracing em tempo de execução (ex: em scripts de teste).
+
+    Funções decoradas com `rastreado` antes da configuração mantêm o
+    comportamento da importação; os blocos `with span(...)` passam a seguir a
+    nova configuração imediatamente.
+    """
+    global HABILITADO, _exportador
+    if _exportador is not None:
+        _exportador.encerrar()
+    HABILITADO = habilitado
+    _exportador = (exportador or _criar_exportador(EXPORTADOR)) if habilitado else None
+
+
+def encerrar():
+    """Grava os spans pendentes do exportador atual."""
+    if _exportador is not None:
+        _exportador.encerrar()
+
+
+def span(nome: str, **atributos):
+    """
+    Abre um span filho do span atual (use com `with`).
+
+    Returns:
+        Um `Span`, ou o span nulo compartilhado se o tracing estiver desabilitado.
+    """
+    if not HABILITADO:
+        return SPAN_NULO
+    novo = Span(nome, atributos, _span_atual.get())
+    _exportador.iniciar(novo)
+    return novo
+
+
+def span_atual():
+    """O span aberto no contexto atual (ou o span nulo), para acrescentar atributos."""
+    if not HABILITADO:
+        return SPAN_NULO
+    return _span_atual.get() or SPAN_NULO
+
+
+def rastreado(nome: str = None, **atributos):
+    """
+    Decorador que envolve cada chamada da função em um span.
+
+    Funciona com funções comuns, corrotinas, geradores e geradores assíncronos;
+    nos geradores, o span cobre a iteração inteira e só é o span atual enquanto
+    o corpo do gerador executa. Com o tracing desabilitado na importação, a
+    função é devolvida sem alterações.
+    """
+    def decorar(funcao):
+        if not HABILITADO:
+            return funcao
+        nome_do_span = nome or f"{funcao.__module__}.{funcao.__qualname__}"
+
+        if inspect.isasyncgenfunction(funcao):
+            @functools.wraps(funcao)
+            async def envoltorio_async_gen(*args, **kwargs):
+                atual = span(nome_do_span, **atributos)
+                gerador = funcao(*args, **kwargs)
+                try:
+                    while True:
+                        token = _span_atual.set(atual)
+                        try:
+                            item = await gerador.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            _span_atual.reset(token)
+                        yield item
+                except BaseException as e:
+                    if not isinstance(e, GeneratorExit):
+                        atual.registrar_erro(e)
+                    raise
+                finally:
+                    await gerador.aclose()
+                    atual.finalizar()
+            return envoltorio_async_gen
+
+        if inspect.isgeneratorfunction(funcao):
+            @functools.wraps(funcao)
+            def envoltorio_gen(*args, **kwargs):
+                atual = span(nome_do_span, **atributos)
+                gerador = funcao(*args, **kwargs)
+                try:
+                    while True:
+                        token = _span_atual.set(atual)
+                        try:
+                            item = next(gerador)
+                        except StopIteration:
+                            break
+                        finally:
+                            _span_atual.reset(token)
+                        yield item
+                except BaseException as e:
+                    if not isinstance(e, GeneratorExit):
+                        atual.registrar_erro(e)
+                    raise
+                finally:
+                    gerador.close()
+                    atual.finalizar()
+            return envoltorio_gen
+
+        if inspect.iscoroutinefunction(funcao):
+            @functools.wraps(funcao)
+            async def envoltorio_async(*args, **kwargs):
+                with span(nome_do_span, **atributos):
+                    return await funcao(*args, **kwargs)
+            return envoltorio_async
+
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with span(nome_do_span, **atributos):
+                return funcao(*args, **kwargs)
+        return envoltorio
+
+    return decorar
+
+
+def registrar_span_concluido(nome: str, inicio: float, **atributos):
+    """
+    Registra, como filho do span atual, um span que já terminou.
+
+    Útil onde a duração já é medida por outro motivo (ex: as chamadas ao LLM,
+    medidas para o `request_trace`), sem reestruturar o código em blocos `with`.
+
+    Args:
+        nome: O nome do span.
+        inicio: O `time.perf_counter()` do início.
+    """
+    if not HABILITADO:
+        return
+    concluido = Span(nome, atributos, _span_atual.get())
+    concluido.inicio_ns = time.time_ns() - int((time.perf_counter() - inicio) * 1e9)
+    _exportador.iniciar(concluido)
+    if atributos.get("erro"):
+        concluido.erro = str(atributos["erro"])
+    concluido.finalizar()
@@ -0,0 +1,155 @@
+import os
+import json
+import sqlite3
+import subprocess
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Define o caminho para o arquivo .env na pasta pai
+dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+# Carrega as variáveis de ambiente do arquivo especificado
+load_dotenv(dotenv_path=dotenv_path)
+
+HABILITADO = os.getenv("VALIDATION_CACHE", "1") == "1"
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '.cache')
+MERMAID_CLI_PACKAGE = os.path.join(os.path.dirname(__file__), '..', 'node_modules', '@mermaid-js', 'mermaid-cli', 'package.json')
+
+
+def caminho_mmdc() -> str:
+    """Retorna o caminho do executável do mermaid-cli (mmdc)."""
+    if os.getenv("MERMAID_CLI_PATH"):
+        return os.getenv("MERMAID_CLI_PATH")
+    # Constrói o caminho para o executável do mmdc, subindo um nível no diretório
+    # para encontrar a pasta node_modules na raiz do projeto.
+    # No Windows, usa .cmd; em outros sistemas, usa o executável sem extensão
+    if os.name == 'nt':  # Windows
+        return os.path.join(os.path.dirname(__file__), "..", "node_modules", ".bin", "mmdc.cmd")
+    return os.path.join(os.path.dirname(__file__), "..", "node_modules", ".bin", "mmdc")
+
+
+def versao_mmdc() -> str:
+    """
+    Retorna a versão do mermaid-cli usado pelo validador.
+
+    Para o mmdc do node_modules do projeto, lê o package.json (sem iniciar o Node);
+    com `MERMAID_CLI_PATH` (ex: uma instalação global) ou sem o package.json,
+    executa `mmdc --version`.
+    """
+    if not os.getenv("MERMAID_CLI_PATH"):
+        try:
+            with open(MERMAID_CLI_PACKAGE, "r", encoding="utf-8") as f:
+                return json.load(f)["version"]
+        except (OSError, KeyError, json.JSONDecodeError):
+            pass
+    try:
+        resultado = subprocess.run(
+            [caminho_mmdc(), "--version"], capture_output=True, text=True, check=True, encoding="utf-8", timeout=30
+        )
+        return resultado.stdout.strip() or "desconhecida"
+    except (OSError, subprocess.SubprocessError):
+        return "desconhecida"
+
+
+def normalizar_codigo(codigo_mermaid: str) -> str:
+    """Remove diferenças irrelevantes para o mmdc: quebras de linha, espaços finais e linhas vazias nas pontas."""
+    linhas = codigo_mermaid.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(linha.rstrip() for linha in linhas).strip("\n")
+
+
+class ValidationCache:
+    """
+    Cache endereçado por conteúdo dos resultados de validação do mmdc.
+
+    A chave é o SHA-256 do código normalizado junto com a versão do mermaid-cli,
+    de modo que uma atualização do mmdc invalida automaticamente as entradas.
+    Só vereditos do mmdc entram no cache: o validador não armazena falhas de
+    infraestrutura (Chromium que não inicia, tempo esgotado).
+
+    O caminho da validação (`via`) também entra na chave: o pool só executa o
+    `mermaid.parse`, enquanto o mmdc avulso renderiza o diagrama inteiro, então
+    o veredito de um não vale pelo do outro.
+    Há dois níveis: um LRU em memória e uma tabela SQLite em disco, que
+    sobrevive a reinícios do Streamlit.
+    """
+
+    def __init__(self, db_path: str = None, tamanho_memoria: int = None, versao: str = None):
+        self.db_path = db_path or os.getenv("VALIDATION_CACHE_PATH", os.path.join(CACHE_DIR, "validacao_mermaid.sqlite3"))
+        self.tamanho_memoria = tamanho_memoria if tamanho_memoria is not None else int(os.getenv("VALIDATION_CACHE_SIZE", "256"))
+        self.versao = versao or versao_mmdc()
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexao = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conexao = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS validacoes ("
+                "chave TEXT PRIMARY KEY, valido INTEGER NOT NULL, erro TEXT NOT NULL)"
+            )
+        return self._conexao
+
+    def chave(self, codigo_mermaid: str, via: str = "pool") -> str:
+        conteudo = f"{self.versao}\0{via}\0{normalizar_codigo(codigo_mermaid)}"
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def obter(self, codigo_mermaid: str, via: str = "pool"):
+        """Retorna (válido, erro) se o código já foi validado pelo caminho `via` ("pool" ou "subprocesso"), ou None."""
+        chave = self.chave(codigo_mermaid, via)
+        with self._lock:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                return self._memoria[chave]
+            try:
+                linha = self._conectar().execute(
+                    "SELECT valido, erro FROM validacoes WHERE chave = ?", (chave,)
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+            if linha is None:
+                return None
+            resultado = (bool(linha[0]), linha[1])
+            self._guardar_em_memoria(chave, resultado)
+            return resultado
+
+    def armazenar(self, codigo_mermaid: str, valido: bool, erro: str, via: str = "pool"):
+        chave = self.chave(codigo_mermaid, via)
+        resultado = (valido, erro)
+        with self._lock:
+            self._guardar_em_memoria(chave, resultado)
+            try:
+                conexao = self._conectar()
+                conexao.execute(
+                    "INSERT OR REPLACE INTO validacoes (chave, valido, erro) VALUES (?, ?, ?)",
+                    (chave, int(valido), erro)
+                )
+                conexao.commit()
+            except sqlite3.Error:
+                # O nível em disco é apenas uma otimização; falhas não afetam a validação
+                pass
+
+    def _guardar_em_memoria(self, chave: str, resultado: tuple):
+        if self.tamanho_memoria <= 0:
+            return
+        self._memoria[chave] = resultado
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.tamanho_memoria:
+            self._memoria.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ValidationCache:
+    """Retorna o cache de validação compartilhado do processo."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ValidationCache()
+        return _cache
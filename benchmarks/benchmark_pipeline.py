@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the diagram pipeline with recorded LLM responses
+
+Runs every prompt of the corpus through the full analyst -> critic -> designer
+-> validator -> corrector path, with the LLM replaced by the fixtures recorded
+in benchmarks/fixtures.jsonl (see `llm_backends.BackendReplay`), and reports
+throughput, p50/p95/p99 latency per stage and the share of time spent in mmdc.
+The result is compared against benchmarks/baseline.json to flag regressions.
+
+Usage:
+    python benchmarks/benchmark_pipeline.py --seed-corpus      # corpus from requests.jsonl and diagrams/*.mmd
+    python benchmarks/benchmark_pipeline.py --record           # record fixtures (real LLM, LLM_RECORD_BACKEND)
+    python benchmarks/benchmark_pipeline.py                    # replay and compare against the baseline
+    python benchmarks/benchmark_pipeline.py --save-baseline    # replay and store the result as the new baseline
+
+Prompts without a recorded fixture are answered by the deterministic stub.
+The exit code is 1 when a metric regressed beyond --threshold.
+"""
+
+import re
+import sys
+import os
+import glob
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASTA = os.path.join(RAIZ, "benchmarks")
+CAMINHO_CORPUS = os.path.join(PASTA, "corpus.jsonl")
+CAMINHO_FIXTURES = os.path.join(PASTA, "fixtures.jsonl")
+CAMINHO_BASELINE = os.path.join(PASTA, "baseline.json")
+
+# Medições frias e isoladas: sem cache de respostas, cache de validação descartável, sem histórico de traces
+os.environ.setdefault("RESPONSE_CACHE", "0")
+os.environ.setdefault("REQUEST_TRACE_PATH", "")
+os.environ.setdefault("VALIDATION_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "validacao.sqlite3"))
+sys.path.append(os.path.join(RAIZ, 'Assistente de Diagramas com IA'))
+
+import llm_client
+from llm_backends import BackendGravador, BackendReplay, criar_backend
+from batch_runner import ler_requisicoes
+from pipeline import DiagramPipeline
+from request_trace import percentil
+
+# Etapas medidas: o tempo de LLM de cada agente e as etapas sem LLM registradas no trace
+AGENTES = ("analista", "critico", "desenhista", "corretor")
+ETAPAS = ("validador", "mmdc")
+PERCENTIS = (50, 95, 99)
+
+
+def _prompt_de_diagrama(caminho: str) -> str:
+    """Descreve um diagrama .mmd como um pedido de usuário (nome do processo, grupos e etapas)."""
+    with open(caminho, "r", encoding="utf-8") as f:
+        codigo = f.read()
+    nome = os.path.splitext(os.path.basename(caminho))[0].replace("_", " ")
+    grupos = [g.strip().strip('"') for g in re.findall(r"^\s*subgraph\s+(.+?)\s*$", codigo, re.MULTILINE)]
+    rotulos = re.findall(r"\w+\s*(?:\[\[|\(\[|\(\(|\[|\(|\{)\"?([^\]\)\}\"]+)\"?", codigo)
+    etapas = list(dict.fromkeys(" ".join(r.split()) for r in rotulos if r.strip()))
+    prompt = f"Crie um fluxograma do processo '{nome}'"
+    if grupos:
+        prompt += f", organizado nas fases {', '.join(grupos)}"
+    return prompt + f", com as etapas: {'; '.join(etapas)}."
+
+
+def semear_corpus(caminho: str = CAMINHO_CORPUS) -> list:
+    """Gera o corpus a partir do requests.jsonl da raiz e dos diagramas em diagrams/*.mmd."""
+    corpus = []
+    caminho_requisicoes = os.path.join(RAIZ, "requests.jsonl")
+    if os.path.exists(caminho_requisicoes):
+        corpus.extend({**r, "origem": "requests.jsonl"} for r in ler_requisicoes(caminho_requisicoes))
+    for arquivo in sorted(glob.glob(os.path.join(RAIZ, "diagrams", "*.mmd"))):
+        corpus.append({
+            "id": f"diagrama-{os.path.splitext(os.path.basename(arquivo))[0]}",
+            "prompt": _prompt_de_diagrama(arquivo),
+            "origem": os.path.relpath(arquivo, RAIZ),
+        })
+    with open(caminho, "w", encoding="utf-8") as f:
+        for item in corpus:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    return corpus
+
+
+def medir_etapas(trace: dict) -> dict:
+    """Tempo (ms) de cada etapa em uma requisição, a partir do trace do pipeline."""
+    tempos = {agente: 0.0 for agente in AGENTES}
+    tempos.update({etapa: 0.0 for etapa in ETAPAS})
+    for chamada in trace.get("chamadas", []):
+        if chamada["agente"] in tempos:
+            tempos[chamada["agente"]] += chamada["latencia_ms"]
+    for etapa in trace.get("etapas", []):
+        if etapa["nome"] in tempos:
+            tempos[etapa["nome"]] += etapa["duracao_ms"]
+    tempos["total"] = trace.get("duracao_ms") or 0.0
+    # O que sobra fora do LLM e do validador é o overhead do próprio pipeline
+    # (com candidatos em paralelo, as etapas se sobrepõem e o overhead fica subestimado)
+    tempos["orquestracao"] = max(
+        tempos["total"] - sum(tempos[a] for a in AGENTES) - tempos["validador"], 0.0
+    )
+    return tempos
+
+
+async def executar(corpus: list, concorrencia: int, candidatos: int = None) -> tuple:
+    """Executa o corpus com concorrência limitada; retorna (resultados, duração total em s)."""
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def uma(item: dict) -> dict:
+        async with semaforo:
+            resultado = await DiagramPipeline(candidatos=candidatos).run(item["prompt"])
+            return {"id": item["id"], "status": resultado["status"], "trace": resultado["trace"]}
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*[uma(item) for item in corpus])
+    return resultados, time.perf_counter() - inicio
+
+
+def consolidar(resultados: list, duracao_s: float, concorrencia: int) -> dict:
+    """Métricas do benchmark: vazão, percentis por etapa e fração de tempo no mmdc."""
+    tempos = [medir_etapas(r["trace"]) for r in resultados]
+    etapas = {}
+    for etapa in (*AGENTES, *ETAPAS, "orquestracao", "total"):
+        valores = [t[etapa] for t in tempos]
+        etapas[etapa] = {f"p{p}": round(percentil(valores, p), 1) for p in PERCENTIS}
+    total = sum(t["total"] for t in tempos)
+    return {
+        "data": datetime.now(timezone.utc).isoformat(),
+        "maquina": f"{platform.node()} ({platform.python_implementation()} {platform.python_version()})",
+        "requisicoes": len(resultados),
+        "concorrencia": concorrencia,
+        "sucessos": sum(1 for r in resultados if r["status"] == "sucesso"),
+        "duracao_s": round(duracao_s, 3),
+        "vazao_rps": round(len(resultados) / duracao_s, 3) if duracao_s else 0.0,
+        "fracao_mmdc": round(sum(t["mmdc"] for t in tempos) / total, 4) if total else 0.0,
+        "etapas_ms": etapas,
+    }
+
+
+def comparar(atual: dict, baseline: dict, limiar: float, minimo_ms: float) -> list:
+    """
+    Lista as regressões em relação à baseline.
+
+    Uma latência regrediu se piorou mais que `limiar` (fração) e mais que
+    `minimo_ms`, para não acusar ruído em etapas de poucos milissegundos.
+    """
+    regressoes = []
+    for etapa, percentis in atual["etapas_ms"].items():
+        anteriores = baseline.get("etapas_ms", {}).get(etapa, {})
+        for chave, valor in percentis.items():
+            anterior = anteriores.get(chave)
+            if anterior is None:
+                continue
+            if valor - anterior > minimo_ms and valor > anterior * (1 + limiar):
+                aumento = f" (+{(valor / anterior - 1) * 100:.0f}%)" if anterior else ""
+                regressoes.append(f"{etapa} {chave}: {anterior:.1f}ms -> {valor:.1f}ms{aumento}")
+    # Vazão e sucessos só são comparáveis com o mesmo corpus e a mesma concorrência
+    if (atual["requisicoes"], atual["concorrencia"]) != (baseline.get("requisicoes"), baseline.get("concorrencia")):
+        return regressoes
+    if baseline.get("vazao_rps") and atual["vazao_rps"] < baseline["vazao_rps"] * (1 - limiar):
+        regressoes.append(f"throughput: {baseline['vazao_rps']:.3f} -> {atual['vazao_rps']:.3f} req/s")
+    if atual["sucessos"] < baseline.get("sucessos", 0):
+        regressoes.append(f"valid diagrams: {baseline['sucessos']} -> {atual['sucessos']}")
+    return regressoes
+
+
+def imprimir(metricas: dict, baseline: dict = None):
+    print(f"\n📊 {metricas['requisicoes']} requests, concurrency {metricas['concorrencia']}, "
+          f"{metricas['sucessos']} valid diagrams")
+    print(f"   Throughput: {metricas['vazao_rps']:.3f} req/s ({metricas['duracao_s']:.2f}s total)")
+    print(f"   mmdc share of request time: {metricas['fracao_mmdc'] * 100:.1f}%")
+    print(f"\n   {'stage':<14}" + "".join(f"{f'p{p}':>11}" for p in PERCENTIS)
+          + (f"{'base p95':>11}" if baseline else ""))
+    for etapa, percentis in metricas["etapas_ms"].items():
+        linha = f"   {etapa:<14}" + "".join(f"{percentis[f'p{p}']:>9.1f}ms" for p in PERCENTIS)
+        anterior = (baseline or {}).get("etapas_ms", {}).get(etapa, {}).get("p95")
+        if anterior is not None:
+            linha += f"{anterior:>9.1f}ms"
+        print(linha)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark with recorded LLM responses.")
+    parser.add_argument("--seed-corpus", action="store_true", help="Rebuild the corpus from requests.jsonl and diagrams/*.mmd.")
+    parser.add_argument("--record", action="store_true", help="Record fixtures with the backend in LLM_RECORD_BACKEND (default: azure).")
+    parser.add_argument("--corpus", default=CAMINHO_CORPUS)
+    parser.add_argument("--fixtures", default=CAMINHO_FIXTURES)
+    parser.add_argument("--baseline", default=CAMINHO_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--candidates", type=int, default=None, help="Designer candidates (default: PIPELINE_CANDIDATES).")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N prompts of the corpus.")
+    parser.add_argument("--latency", default=None, help='Replace the recorded latency (e.g. "lognormal:1.5,0.5").')
+    parser.add_argument("--scale", type=float, default=1.0, help="Factor applied to the recorded latency (0 = no LLM wait).")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown flagged as a regression.")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this.")
+    parser.add_argument("--output", help="Also write the metrics to this JSON file.")
+    args = parser.parse_args()
+
+    print("🔄 Pipeline benchmark")
+    print("=" * 50)
+
+    if args.seed_corpus or not os.path.exists(args.corpus):
+        corpus = semear_corpus(args.corpus)
+        print(f"🌱 Corpus seeded with {len(corpus)} prompts: {args.corpus}")
+    corpus = ler_requisicoes(args.corpus)[:args.limit]
+
+    if args.record:
+        gravador = BackendGravador(criar_backend(os.getenv("LLM_RECORD_BACKEND", "azure")), args.fixtures)
+        llm_client.usar_backend(gravador)
+        print(f"⏺️ Recording {len(corpus)} prompts into {args.fixtures} ({gravador.nome})")
+    else:
+        replay = BackendReplay(args.fixtures, latencia=args.latency, escala=args.scale)
+        llm_client.usar_backend(replay)
+
+    resultados, duracao = llm_client.executar(executar(corpus, args.concurrency, args.candidates))
+    metricas = consolidar(resultados, duracao, args.concurrency)
+
+    if args.record:
+        print(f"✅ {gravador.gravadas} fixtures recorded.")
+        return 0
+    print(f"ℹ️ {replay.resumo()}")
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    imprimir(metricas, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(metricas, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(metricas, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Baseline saved: {args.baseline}")
+        return 0
+    if baseline is None:
+        print("\nℹ️ No baseline yet (use --save-baseline).")
+        return 0
+    if (metricas["requisicoes"], metricas["concorrencia"]) != (baseline.get("requisicoes"), baseline.get("concorrencia")):
+        print(f"\n⚠️ Baseline ran {baseline.get('requisicoes')} requests at concurrency {baseline.get('concorrencia')}: "
+              "throughput is not compared.")
+    if baseline.get("maquina") != metricas["maquina"]:
+        print(f"\n⚠️ Baseline recorded on {baseline.get('maquina')}: absolute times may not be comparable.")
+
+    regressoes = comparar(metricas, baseline, args.threshold, args.min_delta_ms)
+    if regressoes:
+        print(f"\n❌ {len(regressoes)} regression(s) against the baseline of {baseline.get('data')}:")
+        for regressao in regressoes:
+            print(f"   - {regressao}")
+        return 1
+    print(f"\n✨ No regressions against the baseline of {baseline.get('data')}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
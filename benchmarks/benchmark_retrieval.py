@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Recall@k and per-stage latency of the semantic search tab
+
+Runs every labelled query of benchmarks/retrieval_queries.jsonl (a query and
+the knowledge graph node ids a good answer must contain) through the vector
+search alone, the BM25 index alone, the hybrid RRF fusion and, with --rerank,
+the hybrid search followed by the cross-encoder, and reports recall@k and the
+p50/p95 latency of each stage.
+
+Usage:
+    python benchmarks/benchmark_retrieval.py                 # isolated copy of knowledge_graph.json
+    python benchmarks/benchmark_retrieval.py --rerank        # also the cross-encoder stage (sentence-transformers)
+    python benchmarks/benchmark_retrieval.py --base-dir .    # the app's own chroma_db
+
+The exit code is 1 when the hybrid recall@k is below --min-recall.
+"""
+
+import sys
+import os
+import json
+import shutil
+import argparse
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASTA = os.path.join(RAIZ, "benchmarks")
+CAMINHO_CONSULTAS = os.path.join(PASTA, "retrieval_queries.jsonl")
+sys.path.append(os.path.join(RAIZ, 'Assistente de Diagramas com IA'))
+
+from chroma_manager import ChromaManager
+from hybrid_retriever import RecuperadorHibrido
+from request_trace import percentil
+
+PERCENTIS = (50, 95)
+
+
+def ler_consultas(caminho: str) -> list:
+    """Lê o JSONL de consultas rotuladas: {"id", "consulta", "relevantes"}."""
+    with open(caminho, "r", encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def recall(encontrados: list, relevantes: list, k: int) -> float:
+    """Fração dos itens relevantes presentes entre os `k` primeiros resultados."""
+    return len(set(encontrados[:k]) & set(relevantes)) / len(relevantes)
+
+
+def avaliar(recuperador: RecuperadorHibrido, consultas: list, ks: tuple, etapas: tuple) -> dict:
+    """Recall@k médio e percentis de latência por etapa de uma configuração do recuperador."""
+    recalls = {k: [] for k in ks}
+    latencias = {}
+    for consulta in consultas:
+        resultado = recuperador.buscar(consulta["consulta"], n_results=max(ks), etapas=etapas)
+        encontrados = [m.get("id") for m in resultado["metadatas"][0]]
+        for k in ks:
+            recalls[k].append(recall(encontrados, consulta["relevantes"], k))
+        for etapa, ms in resultado["latencias_ms"].items():
+            latencias.setdefault(etapa, []).append(ms)
+    return {
+        "recall": {f"@{k}": round(sum(valores) / len(valores), 3) for k, valores in recalls.items()},
+        "latencia_ms": {etapa: {f"p{p}": round(percentil(valores, p), 2) for p in PERCENTIS} for etapa, valores in latencias.items()},
+    }
+
+
+def imprimir(resultados: dict, ks: tuple):
+    print(f"\n{'configuration':<22}" + "".join(f"{'recall@' + str(k):>11}" for k in ks) + "   latency p50/p95 (ms)")
+    for nome, metricas in resultados.items():
+        recalls = "".join(f"{metricas['recall'][f'@{k}']:>11.3f}" for k in ks)
+        etapas = ", ".join(f"{etapa} {v['p50']:.1f}/{v['p95']:.1f}" for etapa, v in metricas["latencia_ms"].items())
+        print(f"{nome:<22}{recalls}   {etapas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and per-stage latency of the hybrid retriever.")
+    parser.add_argument("--queries", default=CAMINHO_CONSULTAS)
+    parser.add_argument("--base-dir", default=None, help="Folder with knowledge_graph.json and chroma_db (default: a temporary copy).")
+    parser.add_argument("--k", default="1,3,5", help="Comma-separated cutoffs.")
+    parser.add_argument("--rerank", action="store_true", help="Also measure the cross-encoder rerank stage.")
+    parser.add_argument("--min-recall", type=float, default=0.0, help="Fail when the hybrid recall at the largest k is below this.")
+    parser.add_argument("--output", help="Also write the metrics to this JSON file.")
+    args = parser.parse_args()
+
+    print("🔎 Retrieval benchmark")
+    print("=" * 50)
+
+    ks = tuple(int(k) for k in args.k.split(","))
+    consultas = ler_consultas(args.queries)
+    base_dir = args.base_dir
+    if base_dir is None:
+        base_dir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(RAIZ, "knowledge_graph.json"), base_dir)
+    chroma_manager = ChromaManager(base_dir)
+    if chroma_manager.is_sync_needed():
+        chroma_manager.run_ingestion()
+    print(f"📚 {len(consultas)} labelled queries, {len(chroma_manager.lexical_index())} indexed items")
+
+    recuperador = RecuperadorHibrido(chroma_manager, reordenar=False)
+    configuracoes = {
+        "vector": (recuperador, ("vetorial",)),
+        "bm25": (recuperador, ("lexica",)),
+        "hybrid (rrf)": (recuperador, ("lexica", "vetorial")),
+    }
+    if args.rerank:
+        configuracoes["hybrid + rerank"] = (RecuperadorHibrido(chroma_manager, reordenar=True), ("lexica", "vetorial"))
+
+    resultados = {nome: avaliar(r, consultas, ks, etapas) for nome, (r, etapas) in configuracoes.items()}
+    imprimir(resultados, ks)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    recall_hibrido = resultados["hybrid (rrf)"]["recall"][f"@{max(ks)}"]
+    if recall_hibrido < args.min_recall:
+        print(f"\n❌ Hybrid recall@{max(ks)} {recall_hibrido:.3f} is below {args.min_recall:.3f}.")
+        return 1
+    print("\n✨ Retrieval benchmark completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Script to test the incremental ChromaDB sync against the installed chromadb
+
+Runs two syncs of a copy of knowledge_graph.json, then one after an edit, in
+a temporary folder. Embeddings come from a deterministic hash model, so no
+model download is needed.
+"""
+
+import sys
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from chroma_manager import ChromaManager, SYNC_HASH_ID
+from embedding_cache import EmbeddingCache, FuncaoDeEmbeddingComCache
+
+
+class ModeloDeHash:
+    """Embeddings determinísticos de 16 dimensões derivados do SHA-256 do texto."""
+
+    id = "teste:sha256-16"
+
+    def embed_lote(self, textos: list) -> list:
+        return [[b / 255 for b in hashlib.sha256(texto.encode("utf-8")).digest()[:16]] for texto in textos]
+
+
+def main():
+    print("🔄 Testing incremental ChromaDB sync")
+    print("=" * 50)
+    falhas = 0
+
+    def verificar(nome, obtido, esperado):
+        nonlocal falhas
+        if obtido == esperado:
+            print(f"   ✅ {nome}: {obtido}")
+        else:
+            falhas += 1
+            print(f"   ❌ {nome}: expected {esperado}, got {obtido}")
+
+    pasta = tempfile.mkdtemp()
+    shutil.copy(os.path.join(os.path.dirname(__file__), 'knowledge_graph.json'), pasta)
+    caminho_grafo = os.path.join(pasta, 'knowledge_graph.json')
+    with open(caminho_grafo, 'r', encoding='utf-8') as f:
+        grafo = json.load(f)
+    total = len(grafo['nodes']) + len(grafo['edges'])
+
+    def novo_gerenciador():
+        embeddings = FuncaoDeEmbeddingComCache(ModeloDeHash(), EmbeddingCache(os.path.join(pasta, 'embeddings.sqlite3')))
+        return ChromaManager(pasta, embedding_function=embeddings)
+
+    try:
+        print("\n🧪 First sync")
+        gerenciador = novo_gerenciador()
+        verificar("sync needed", gerenciador.is_sync_needed(), True)
+        estatisticas = gerenciador.run_ingestion()
+        verificar("added", estatisticas['added'], total)
+        verificar("sync hash stored", gerenciador.sync_hash() is not None, True)
+        verificar("items + sync record", gerenciador.collection.count(), total + 1)
+
+        print("\n🧪 Second sync (new process, unchanged file)")
+        gerenciador = novo_gerenciador()
+        verificar("sync needed", gerenciador.is_sync_needed(), False)
+        estatisticas = gerenciador.run_ingestion()
+        verificar("changed", estatisticas['added'] + estatisticas['updated'] + estatisticas['deleted'], 0)
+        verificar("embeddings computed", estatisticas['embeddings_computed'], 0)
+        os.utime(caminho_grafo, ns=(1, 10 ** 18))
+        verificar("touched file, same content", gerenciador.is_sync_needed(), False)
+        verificar("new mtime recorded", gerenciador._sync_record()['file_mtime_ns'], 10 ** 18)
+
+        print("\n🧪 Sync after an edit")
+        grafo['nodes'][0]['summary'] = grafo['nodes'][0].get('summary', '') + " Editado."
+        grafo['edges'].append({"source": grafo['nodes'][0]['id'], "target": grafo['nodes'][1]['id'], "label": "teste_sync"})
+        with open(caminho_grafo, 'w', encoding='utf-8') as f:
+            json.dump(grafo, f, ensure_ascii=False)
+        verificar("sync needed", gerenciador.is_sync_needed(), True)
+        estatisticas = gerenciador.run_ingestion()
+        verificar("added / updated", (estatisticas['added'], estatisticas['updated']), (1, 1))
+        verificar("BM25 index follows the sync", [i for i, _ in gerenciador.lexical_index().buscar("teste_sync", 1)], [gerenciador._edge_id(grafo['edges'][-1], 0)])
+
+        print("\n🧪 Queries skip the sync record")
+        resultados = gerenciador.semantic_query("ChromaDB", n_results=total + 1, include_edges=True)
+        verificar("sync record returned", SYNC_HASH_ID in resultados['ids'][0], False)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    print("\n✨ Incremental ChromaDB sync test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
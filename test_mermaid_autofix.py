@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Script to test the rule-based Mermaid auto-fixer
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from mermaid_autofix import corrigir_por_regras, metricas, zerar_metricas, resumo
+
+# (código com erro, mensagem de erro do mmdc, regra esperada)
+CASOS = {
+    "<br> em rótulo": (
+        'graph TD\n    A[Linha 1<br>Linha 2] --> B("Sim<br/>ok")', "", "rotulos_sem_aspas"
+    ),
+    "parênteses sem aspas": (
+        "graph TD\n    A[Enviar (online)] -->|Sim (x)| B{Decidir}\n    B -- Não (zero) --> C(Calcular (total))",
+        "", "rotulos_sem_aspas"
+    ),
+    "cercas markdown": (
+        "Aqui está o diagrama:\n```mermaid\ngraph TD\n    A --> B\n```\nEspero ter ajudado.",
+        "", "cercas_markdown"
+    ),
+    "cerca de fechamento solta": ("graph TD\n    A --> B\n```", "", "cercas_markdown"),
+    "direction em subgraph": (
+        'graph TD\n    subgraph S ["Grupo"]\n        direction LR\n        A --> B\n    end', "", "direction_em_subgraph"
+    ),
+    "id reservado": ('graph TD\n    A --> end\n    end["Fim"]', "", "id_reservado"),
+    "subgraph sem end": ("graph TD\n    subgraph X\n        A --> B", "", "subgraph_sem_end"),
+    "cabeçalho ausente": ("A[Início] --> B[Fim]", "UnknownDiagramError: No diagram type detected", "cabecalho_ausente"),
+}
+
+# Erros sem correção mecânica: devem seguir para o LLM
+SEM_REGRA = {
+    "conexão inválida": "graph TD\n    A -> B",
+    "forma não fechada no fim": "graph TD\n    A[Texto --> B",
+}
+
+
+def main():
+    print("🔄 Testing Mermaid auto-fixer")
+    print("=" * 50)
+    falhas = 0
+    zerar_metricas()
+
+    print(f"\n🧪 Fixable errors: {len(CASOS)}")
+    for nome, (codigo, erro, regra) in CASOS.items():
+        resultado = corrigir_por_regras(codigo, erro)
+        if resultado.corrigido and regra in resultado.regras:
+            print(f"   ✅ {nome}: fixed by {', '.join(resultado.regras)}")
+        else:
+            falhas += 1
+            print(f"   ❌ {nome}: rules={resultado.regras} valid={resultado.valido}\n{resultado.codigo}")
+
+    print(f"\n🧪 Errors left to the LLM: {len(SEM_REGRA)}")
+    for nome, codigo in SEM_REGRA.items():
+        resultado = corrigir_por_regras(codigo)
+        if resultado.corrigido:
+            falhas += 1
+            print(f"   ❌ {nome}: unexpectedly fixed by {resultado.regras}")
+        else:
+            print(f"   ✅ {nome}: not fixed")
+
+    m = metricas()
+    print(f"\n📊 {resumo()}")
+    if m["corrigidos"] != len(CASOS):
+        falhas += 1
+        print(f"   ❌ Expected {len(CASOS)} fixes in the counters, got {m['corrigidos']}")
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    print("\n✨ Auto-fixer test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Script to test the local Mermaid flowchart pre-validation against the diagram corpus
+"""
+
+import sys
+import os
+import glob
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from mermaid_parser import analisar_flowchart, erros, e_flowchart
+
+# Diagramas inválidos e o código de diagnóstico que cada um deve produzir
+CASOS_INVALIDOS = {
+    "graph XY\n    A --> B": "direcao_invalida",
+    "graph TD\n    subgraph S\n    A --> B": "subgraph_sem_end",
+    "graph TD\n    A --> B\n    end": "end_sem_subgraph",
+    "graph TD\n    A[Linha 1<br>Linha 2] --> B": "br_em_rotulo",
+    "graph TD\n    A[Validar (dados)] --> B": "caractere_especial_sem_aspas",
+    "graph TD\n    A(Início --> B": "forma_nao_fechada",
+    "graph TD\n    A[\"Início] --> B": "aspas_nao_fechadas",
+    "graph TD\n    A -->|Sim B": "rotulo_conexao_nao_fechado",
+    "graph TD\n    subgraph X\n        direction LR\n        A --> B\n    end": "direction_em_subgraph",
+    "graph TD\n    A --> end": "id_reservado",
+}
+
+# Sintaxes de conexão válidas que não podem ser rejeitadas sem consultar o mmdc
+CONEXOES_VALIDAS = [
+    "graph TD\n    A--texto-->B",
+    "graph TD\n    A-- texto -->B",
+    "graph TD\n    A--\"rótulo\"-->B",
+    "graph TD\n    A -- \"rótulo com --> seta\" --> B",
+    "graph TD\n    A ~~~ B",
+    "graph TD\n    A~~~B-->C",
+    "graph TD\n    A-->B-->C",
+    "graph TD\n    A---B",
+    "graph TD\n    A==texto==>B",
+    "graph TD\n    A-.texto.->B",
+    "graph TD\n    A-.->B",
+    "graph TD\n    A <--> B",
+    "graph TD\n    A --o B",
+    "graph TD\n    A --x C",
+]
+
+# Conexões fora do que a pré-validação reconhece: apenas um aviso, o mmdc decide
+CASOS_AVISO = {
+    "graph TD\n    A B --> C": "conexao_nao_reconhecida",
+}
+
+
+def main():
+    print("🔄 Testing local Mermaid pre-validation")
+    print("=" * 50)
+    falhas = 0
+
+    base_dir = os.path.dirname(__file__)
+    corpus = sorted(glob.glob(os.path.join(base_dir, 'diagrams', '*.mmd')))
+    print(f"\n📂 Corpus: {len(corpus)} diagrams")
+    for caminho in corpus:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            codigo = f.read()
+        nome = os.path.basename(caminho)
+        if not e_flowchart(codigo):
+            print(f"   ⏭️ {nome}: not a flowchart, skipped")
+            continue
+        encontrados = erros(analisar_flowchart(codigo))
+        if encontrados:
+            falhas += 1
+            print(f"   ❌ {nome}: unexpected errors")
+            for diagnostico in encontrados:
+                print(f"      {diagnostico}")
+        else:
+            print(f"   ✅ {nome}: valid")
+
+    print(f"\n🧪 Invalid samples: {len(CASOS_INVALIDOS)}")
+    for codigo, esperado in CASOS_INVALIDOS.items():
+        codigos = [d.codigo for d in erros(analisar_flowchart(codigo))]
+        if esperado in codigos:
+            print(f"   ✅ {esperado}")
+        else:
+            falhas += 1
+            print(f"   ❌ expected {esperado}, got {codigos or 'no errors'}")
+
+    print(f"\n🧪 Valid link syntax: {len(CONEXOES_VALIDAS)}")
+    for codigo in CONEXOES_VALIDAS:
+        diagnosticos = analisar_flowchart(codigo)
+        linha = codigo.split("\n", 1)[1].strip()
+        if erros(diagnosticos) or any(d.codigo == "conexao_nao_reconhecida" for d in diagnosticos):
+            falhas += 1
+            print(f"   ❌ {linha}: {[str(d) for d in diagnosticos]}")
+        else:
+            print(f"   ✅ {linha}")
+
+    print(f"\n🧪 Unrecognised links fall through to mmdc: {len(CASOS_AVISO)}")
+    for codigo, esperado in CASOS_AVISO.items():
+        diagnosticos = analisar_flowchart(codigo)
+        avisos = [d.codigo for d in diagnosticos if d.severidade == "aviso"]
+        if esperado in avisos and not erros(diagnosticos):
+            print(f"   ✅ {esperado} (warning)")
+        else:
+            falhas += 1
+            print(f"   ❌ expected only the warning {esperado}, got {[(d.codigo, d.severidade) for d in diagnosticos]}")
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    print("\n✨ Local pre-validation test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Script to test the markdown fence filter used by the streaming agents
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from mermaid_stream import FiltroDeCercas, extrair_codigo_mermaid
+
+# (resposta do modelo, código esperado)
+CASOS = {
+    "bloco mermaid": ("```mermaid\ngraph TD\n  A-->B\n```", "graph TD\n  A-->B"),
+    "prosa antes e depois": ("Aqui está:\n```mermaid\ngraph TD\n  A-->B\n```\nEspero ter ajudado.", "graph TD\n  A-->B"),
+    "cerca sem linguagem": ("```\ngraph TD\n  A-->B\n```", "graph TD\n  A-->B"),
+    "sem cercas": ("graph TD\n  A-->B", "graph TD\n  A-->B"),
+    "bloco em uma linha": ("```mermaid graph TD```", "graph TD"),
+    "código na linha da abertura": ("```mermaid graph TD\n  A-->B\n```", "graph TD\n  A-->B"),
+    "código na abertura sem linguagem": ("```graph TD\n  A-->B\n```", "graph TD\n  A-->B"),
+}
+
+
+def main():
+    print("🔄 Testing Mermaid fence filter")
+    print("=" * 50)
+    falhas = 0
+
+    def verificar(nome, obtido, esperado):
+        nonlocal falhas
+        if obtido == esperado:
+            print(f"   ✅ {nome}: {obtido!r}")
+        else:
+            falhas += 1
+            print(f"   ❌ {nome}: expected {esperado!r}, got {obtido!r}")
+
+    print("\n🧪 Complete responses")
+    for nome, (resposta, esperado) in CASOS.items():
+        verificar(nome, extrair_codigo_mermaid(resposta), esperado)
+
+    print("\n🧪 Streamed in 3-character chunks")
+    for nome, (resposta, esperado) in CASOS.items():
+        filtro = FiltroDeCercas()
+        for i in range(0, len(resposta), 3):
+            filtro.alimentar(resposta[i:i + 3])
+        verificar(nome, filtro.finalizar(), esperado)
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    print("\n✨ Fence filter test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
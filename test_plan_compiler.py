@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Script to test the deterministic plan-to-Mermaid compiler
+"""
+
+import sys
+import os
+import re
+import json
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from plan_compiler import compilar_plano, PlanoIncompativelError
+from mermaid_parser import analisar_flowchart, erros
+
+# Planos com textos e ids que quebrariam uma conversão ingênua
+PLANOS_DIFICEIS = {
+    "caracteres especiais": {
+        "passos": [
+            {"id": "A", "tipo": "inicio", "texto": 'Receber "pedido" (online) {urgente}'},
+            {"id": "B", "tipo": "decisão", "texto": "Estoque > 0 | reservado?"},
+            {"id": "C", "tipo": "processo", "texto": "Linha 1<br>Linha 2"},
+        ],
+        "conexoes": [{"de": "A", "para": "B", "label": ""}, {"de": "B", "para": "C", "label": 'Sim (com "aspas")'}],
+    },
+    "ids reservados e acentuados": {
+        "orientacao": "lr",
+        "passos": [{"id": "end", "tipo": "fim"}, {"id": "Ação 1"}, {"id": "1"}],
+        "conexoes": [{"de": "Ação 1", "para": "end"}, {"de": "1", "para": "Ação 1", "tipo": "tracejada"}],
+    },
+    "subgrafos": {
+        "passos": [
+            {"id": "A", "tipo": "inicio", "texto": "Início"},
+            {"id": "B", "texto": "Faturar", "subgrafo": "Financeiro"},
+            {"id": "C", "tipo": "dados", "texto": "Nota fiscal", "subgrafo": "Financeiro"},
+            {"id": "D", "tipo": "fim", "texto": "Fim", "subgrafo": "end"},
+        ],
+        "conexoes": [{"de": "A", "para": "B"}, {"de": "B", "para": "C"}, {"de": "C", "para": "D"}],
+    },
+}
+
+PLANOS_INCOMPATIVEIS = {
+    "sem passos": {"passos": []},
+    "conexão para passo inexistente": {"passos": [{"id": "A"}], "conexoes": [{"de": "A", "para": "Z"}]},
+    "id duplicado": {"passos": [{"id": "A"}, {"id": "A"}]},
+    "orientação desconhecida": {"orientacao": "diagonal", "passos": [{"id": "A"}]},
+    "tipo de conexão desconhecido": {"passos": [{"id": "A"}, {"id": "B"}], "conexoes": [{"de": "A", "para": "B", "tipo": "ondulada"}]},
+}
+
+
+def main():
+    print("🔄 Testing plan compiler")
+    print("=" * 50)
+    falhas = 0
+
+    manual = os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA', 'manual_de_boas_praticas_design.md')
+    with open(manual, 'r', encoding='utf-8') as f:
+        exemplos = re.findall(r"```json\n(.*?)```", f.read(), re.S)
+    # O primeiro exemplo do manual só ilustra a estrutura: as conexões C -> D e C -> E
+    # apontam para passos que ele não define, então o compilador o recusa (e o plano vai ao LLM)
+    esquematico = json.loads(exemplos[0])
+    planos = {f"manual, exemplo {i + 1}": json.loads(e) for i, e in enumerate(exemplos) if i > 0}
+    planos.update(PLANOS_DIFICEIS)
+
+    print(f"\n🧪 Compilable plans: {len(planos)}")
+    for nome, plano in planos.items():
+        try:
+            codigo = compilar_plano(plano)
+        except PlanoIncompativelError as e:
+            falhas += 1
+            print(f"   ❌ {nome}: {e}")
+            continue
+        encontrados = erros(analisar_flowchart(codigo))
+        if encontrados:
+            falhas += 1
+            print(f"   ❌ {nome}: compiled code has errors: {encontrados}")
+        else:
+            print(f"   ✅ {nome}: {len(codigo.splitlines())} lines")
+
+    print(f"\n🧪 Incompatible plans: {len(PLANOS_INCOMPATIVEIS) + 1}")
+    for nome, plano in PLANOS_INCOMPATIVEIS.items():
+        try:
+            compilar_plano(plano)
+            falhas += 1
+            print(f"   ❌ {nome}: compiled but should have been rejected")
+        except PlanoIncompativelError:
+            print(f"   ✅ {nome}: rejected")
+    try:
+        compilar_plano(esquematico)
+        falhas += 1
+        print("   ❌ manual, exemplo 1: compiled but should have been rejected")
+    except PlanoIncompativelError as e:
+        if "'D'" in str(e):
+            print(f"   ✅ manual, exemplo 1: rejected ({e})")
+        else:
+            falhas += 1
+            print(f"   ❌ manual, exemplo 1: rejected without naming the missing step: {e}")
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    print("\n✨ Plan compiler test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Script to test the adaptive refinement budget
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from refinement_budget import OrcamentoDeRefinamento, diferenca_entre_planos, sobreposicao_de_criticas
+
+
+def _plano(n: int) -> dict:
+    passos = [{"id": f"P{i}", "tipo": "processo", "texto": f"Etapa {i}"} for i in range(n)]
+    conexoes = [{"de": a["id"], "para": b["id"], "label": ""} for a, b in zip(passos, passos[1:])]
+    return {"passos": passos, "conexoes": conexoes}
+
+
+def _ciclos(orcamento: OrcamentoDeRefinamento, planos: list, criticas: list) -> int:
+    """Simula os ciclos: cada um termina em um refinamento de planos[i] para planos[i + 1]."""
+    i = 0
+    while orcamento.permite_ciclo():
+        orcamento.registrar_refinamento(planos[i], planos[i + 1], criticas[i])
+        i += 1
+    return orcamento.ciclos_usados
+
+
+CRITICAS = ["Falta validar o estoque", "Decisão sem rótulo Sim", "Texto do início vago",
+            "Conexão redundante entre etapas", "Orientação deveria ser LR", "Faltou tratar pagamento recusado"]
+
+
+def main():
+    print("🔄 Testing adaptive refinement budget")
+    print("=" * 50)
+    falhas = 0
+
+    def verificar(nome, obtido, esperado):
+        nonlocal falhas
+        if obtido == esperado:
+            print(f"   ✅ {nome}: {obtido}")
+        else:
+            falhas += 1
+            print(f"   ❌ {nome}: expected {esperado}, got {obtido}")
+
+    print("\n🧪 Measures")
+    verificar("identical plans", diferenca_entre_planos(_plano(4), _plano(4)), 0.0)
+    verificar("one extra step", round(diferenca_entre_planos(_plano(4), _plano(5)), 2), 0.22)
+    verificar("repeated critique", sobreposicao_de_criticas(["Adicione um passo de validação"], ["adicione um passo de validação!"]), 1.0)
+    verificar("new critique", sobreposicao_de_criticas(["Adicione um passo de validação"], ["Orientação deveria ser LR"]), 0.0)
+
+    print("\n🧪 Quality cycles")
+    planos = [_plano(4 + i) for i in range(8)]
+    verificar("stable plan stops after 1", _ciclos(OrcamentoDeRefinamento(adaptativo=True), [_plano(4)] * 8, [CRITICAS] * 8), 1)
+    verificar("ignored critiques stop after 2", _ciclos(OrcamentoDeRefinamento(adaptativo=True), planos, [CRITICAS[:2]] * 8), 2)
+    verificar("shrinking critiques get extra cycles", _ciclos(
+        OrcamentoDeRefinamento(ciclos_maximos=5, adaptativo=True), planos, [CRITICAS[i:] for i in range(8)]
+    ), 5)
+    verificar("fixed budget", _ciclos(OrcamentoDeRefinamento(adaptativo=False), [_plano(4)] * 8, [CRITICAS] * 8), 3)
+    orcamento = OrcamentoDeRefinamento(adaptativo=True)
+    _ciclos(orcamento, [_plano(4)] * 8, [CRITICAS] * 8)
+    verificar("cycles saved", orcamento.relatorio()["ciclos_economizados"], 2)
+    longo, corrigido = _plano(20), _plano(20)
+    corrigido["conexoes"][5]["label"] = "Sim"
+    orcamento = OrcamentoDeRefinamento(adaptativo=True)
+    orcamento.permite_ciclo()
+    ciclo = orcamento.registrar_refinamento(longo, corrigido, CRITICAS[:1])
+    verificar("one-label fix on a 20-step plan", ciclo.diferenca, 0.05)
+    verificar("small real change keeps refining", orcamento.permite_ciclo(), True)
+
+    print("\n🧪 Syntax attempts")
+    orcamento = OrcamentoDeRefinamento(adaptativo=True)
+    verificar("first correction", orcamento.permite_tentativa("graph TD\n A-->", "erro 1"), True)
+    verificar("same code returned", orcamento.permite_tentativa("graph TD\n A-->", "erro 1"), False)
+    orcamento = OrcamentoDeRefinamento(tentativas_maximas=4, adaptativo=True)
+    erros = ["erro 1", "erro 2", "erro 3", "erro 4", "erro 5"]
+    while orcamento.permite_tentativa(f"codigo {orcamento.tentativas}", erros[orcamento.tentativas]):
+        pass
+    verificar("changing errors get an extra attempt", orcamento.tentativas, 4)
+
+    print("\n🧪 Deadline")
+    orcamento = OrcamentoDeRefinamento(prazo_s=0.001, adaptativo=True)
+    orcamento.permite_ciclo()
+    time.sleep(0.01)
+    orcamento.registrar_refinamento(planos[0], planos[1], CRITICAS)
+    verificar("deadline stops cycles", orcamento.permite_ciclo(), False)
+    verificar("deadline reason", orcamento.motivo_ciclos.startswith("prazo"), True)
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    print("\n✨ Refinement budget test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
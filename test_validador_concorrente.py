@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Stress test: many threads validating Mermaid diagrams at the same time
+
+The validation cache is disabled and every sample gets past the local
+pre-validation (valid diagrams plus sequence diagrams, which only mmdc
+checks), so each of the threads reaches the worker pool.
+
+Exits with 77 (skipped) when mmdc is not installed, since the pool overlap
+and the mmdc error messages cannot be checked without it.
+"""
+
+import sys
+import os
+import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Sem cache de validação: cada chamada precisa chegar ao mmdc
+os.environ["VALIDATION_CACHE"] = "0"
+sys.path.append(os.path.join(os.path.dirname(__file__), 'Assistente de Diagramas com IA'))
+
+from agente_validador import validar_diagrama_mermaid
+from mermaid_parser import e_flowchart, analisar_flowchart, erros
+from mermaid_worker_pool import get_pool
+
+THREADS = 16
+REPETICOES = 20
+# Código de saída quando o mmdc não está instalado: nem sucesso nem falha (convenção do automake)
+SKIP = 77
+
+# Erros que só o mmdc detecta (a pré-validação local cobre apenas flowcharts), com
+# um trecho que deve aparecer na mensagem de erro de cada um
+DIAGRAMAS_INVALIDOS = {
+    f"sequenceDiagram\n    participant A{i}\n    A{i}->>B{i} Mensagem sem dois-pontos": "line 3" for i in range(5)
+}
+
+
+class ContadorDeChamadas:
+    """Conta as validações em andamento no pool ao mesmo tempo."""
+
+    def __init__(self, validar):
+        self._validar = validar
+        self._lock = threading.Lock()
+        self.em_andamento = 0
+        self.maximo = 0
+        self.total = 0
+
+    def __call__(self, codigo):
+        with self._lock:
+            self.em_andamento += 1
+            self.total += 1
+            self.maximo = max(self.maximo, self.em_andamento)
+        try:
+            return self._validar(codigo)
+        finally:
+            with self._lock:
+                self.em_andamento -= 1
+
+
+def main():
+    print("🔄 Testing concurrent Mermaid validation")
+    print("=" * 50)
+
+    base_dir = os.path.dirname(__file__)
+    diagramas = []
+    for caminho in sorted(glob.glob(os.path.join(base_dir, 'diagrams', '*.mmd'))):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            diagramas.append(f.read())
+    diagramas.extend(DIAGRAMAS_INVALIDOS)
+
+    falhas = 0
+    for codigo in diagramas:
+        if e_flowchart(codigo) and erros(analisar_flowchart(codigo)):
+            falhas += 1
+            print(f"   ❌ sample stopped by the local pre-validation: {codigo.splitlines()[0]!r}")
+
+    pool = get_pool()
+    contador = ContadorDeChamadas(pool.validar)
+    pool.validar = contador
+
+    # Resultado de referência, calculado sequencialmente
+    referencia = {codigo: validar_diagrama_mermaid(codigo)[:2] for codigo in diagramas}
+    mmdc_disponivel = not any("não encontrado" in mensagem for _, mensagem in referencia.values())
+
+    arquivos_antes = set(os.listdir(os.getcwd()))
+    tarefas = diagramas * REPETICOES
+    contador.maximo = contador.total = 0
+    print(f"\n🧵 {len(tarefas)} validations on {THREADS} threads...")
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        resultados = list(executor.map(validar_diagrama_mermaid, tarefas))
+    arquivos_depois = set(os.listdir(os.getcwd()))
+
+    divergentes = sum(1 for codigo, (valido, mensagem, _) in zip(tarefas, resultados) if (valido, mensagem) != referencia[codigo])
+    falhas += divergentes
+    print(f"   {'✅' if not divergentes else '❌'} {len(tarefas) - divergentes}/{len(tarefas)} results match the sequential run")
+
+    if contador.total != len(tarefas):
+        falhas += 1
+        print(f"   ❌ only {contador.total}/{len(tarefas)} validations reached the pool")
+    elif not mmdc_disponivel:
+        # Sem o mmdc o pool recusa as chamadas na hora, então elas não chegam a se sobrepor
+        print(f"   ⏭️ concurrency not tested: mmdc not found ({contador.total} pool calls, at most {contador.maximo} at once)")
+    elif contador.maximo > 1:
+        print(f"   ✅ every validation reached the pool, up to {contador.maximo} at once")
+    else:
+        falhas += 1
+        print("   ❌ the pool never ran two validations at once")
+
+    if not mmdc_disponivel:
+        print("   ⏭️ mmdc error messages not checked: mmdc not found")
+    else:
+        for codigo, trecho in DIAGRAMAS_INVALIDOS.items():
+            valido, mensagem = referencia[codigo]
+            if valido or trecho not in mensagem:
+                falhas += 1
+                print(f"   ❌ invalid diagram was not rejected as expected: {mensagem!r}")
+
+    novos = arquivos_depois - arquivos_antes
+    if novos:
+        falhas += 1
+        print(f"   ❌ validation left files behind: {sorted(novos)}")
+    else:
+        print("   ✅ no files written to the working directory")
+
+    if falhas:
+        print(f"\n❌ {falhas} check(s) failed.")
+        return 1
+    if not mmdc_disponivel:
+        print(f"\n⏭️ Skipped: install mmdc to run the concurrent validation checks (exit code {SKIP}).")
+        return SKIP
+    print("\n✨ Concurrent validation test completed!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())